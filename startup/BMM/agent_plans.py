@@ -8,7 +8,7 @@ from BMM.user_ns.instruments import slits3
 from BMM.user_ns.motors import xafs_det
 from BMM.xafs import xafs
 
-__all__ = ["agent_driven_nap", "agent_move_and_measure"]
+__all__ = ["agent_driven_nap", "agent_move_and_measure", "agent_batch_measure"]
 
 
 @bpp.run_decorator()
@@ -335,3 +335,224 @@ def CMS_driven_measurement(composition=None, distance=None, time=None):
     yield from finalize_wrapper(main_plan(composition, distance, time), cleanup_plan())
 
     
+
+
+
+######################################################################
+## Edge-aware batching of agent requests.  An agent pushing many
+## measurements one queue item at a time can make the beamline flip
+## between edges far more often than necessary.  Instead, a window of
+## pending requests can be submitted as a single agent_batch_measure
+## item.  The requests are grouped by edge and the groups are ordered
+## to minimize the time spent changing edges.
+######################################################################
+
+import itertools, re
+import numpy
+from BMM.edge           import edge_change_history
+from BMM.periodictable  import edge_energy
+from BMM.xafs_functions import conventional_grid
+
+
+class EdgeCostModel():
+    '''Estimate, in seconds, the time cost of the steps of a batch of
+    agent measurements.
+
+    An edge change costs a fixed amount of time (photon delivery
+    mode, rocking curve, slit height scan) plus an amount which grows
+    with the size of the energy move.  Both are fit by least squares
+    to the history of edge changes recorded by change_edge(), see
+    BMM.edge.edge_change_history.  Until there is enough history, the
+    default values are used.
+
+    A measurement costs the integration time of its energy grid plus
+    the historical overhead per point for its element, as estimated
+    by conventional_grid() from BMMTelemetry.
+
+    attributes
+    ==========
+    fixed : float
+      time of an edge change, excluding the energy move [360]
+    per_kev : float
+      additional time per keV of energy move [20]
+    minimum : int
+      number of recorded edge changes needed to fit the model [5]
+
+    '''
+    def __init__(self, fixed=360, per_kev=20, minimum=5):
+        self.fixed   = fixed
+        self.per_kev = per_kev
+        self.minimum = minimum
+        self.fit()
+
+    def energy(self, el, edge):
+        try:
+            return edge_energy(el, edge)
+        except Exception:
+            return None
+
+    def fit(self):
+        rows = []
+        for h in edge_change_history():
+            start = h.get('from_energy') or self.energy(h.get('from'), h.get('from_edge'))
+            if start is None or h.get('energy') is None or h.get('duration') is None:
+                continue
+            rows.append((abs(h['energy'] - float(start))/1000, h['duration']))
+        if len(rows) < self.minimum:
+            return
+        de, dt = numpy.array(rows).T
+        slope, intercept = numpy.polyfit(de, dt, 1) if numpy.ptp(de) > 0 else (0, numpy.median(dt))
+        if slope < 0 or intercept <= 0:  # not enough spread in the history to say anything about energy
+            slope, intercept = 0, numpy.median(dt)
+        self.fixed, self.per_kev = float(intercept), float(slope)
+
+    def edge_change(self, here, there):
+        '''Cost of moving from the (element, edge) here to the one there.'''
+        if here == there:
+            return 0
+        e1, e2 = self.energy(*here), self.energy(*there)
+        if e1 is None or e2 is None:
+            return self.fixed
+        return self.fixed + self.per_kev*abs(e2-e1)/1000
+
+    def measurement(self, task):
+        '''Estimated time of the XAFS measurement in task.'''
+        kwargs = task['kwargs']
+        try:
+            regions = []
+            for a in ('bounds', 'steps', 'times'):
+                this = []
+                for f in re.split('[ \t,]+', str(kwargs[a]).strip()):
+                    try:
+                        this.append(float(f))
+                    except ValueError:
+                        this.append(f)
+                regions.append(this)
+            (grid, inttime, approximate_time, delta) = conventional_grid(*regions, e0=edge_energy(task['element'], task['edge']),
+                                                                         element=task['element'], edge=task['edge'])
+            return approximate_time * 60 * int(kwargs.get('nscans', 1))
+        except Exception:
+            return 0
+
+
+def agent_tasks(requests):
+    '''Flatten a window of agent requests into a list of single-edge
+    measurements.  Each request is a dict in one of two forms:
+
+    single edge:
+        {'element': 'Cu', 'edge': 'K', 'motor_x': 'xafs_x', 'x_position': -9.04,
+         'motor_y': 'xafs_y', 'y_position': -31.64, 'det_position': 40, 'kwargs': {...}}
+
+    several edges, with the same positional values as agent_move_and_measure:
+        {'elements': ['Cu', 'Ti'], 'edges': ['K', 'K'], 'motor_x': 'xafs_x', 'motor_y': 'xafs_y',
+         'elem1_x_position': ..., 'elem2_x_position': ..., 'elem1_y_position': ..., ...,
+         'elem1_det_position': ..., 'elem2_det_position': ..., 'kwargs': {...}}
+
+    kwargs are the keyword arguments for the xafs plan, which must
+    include 'filename'.  det_position is optional.  motor_x and
+    motor_y default to xafs_x and xafs_y.
+
+    '''
+    tasks = []
+    for i, request in enumerate(requests):
+        common = {'request': i,
+                  'motor_x': request.get('motor_x', 'xafs_x'),
+                  'motor_y': request.get('motor_y', 'xafs_y'),
+                  'md'     : request.get('md', {}),}
+        if 'elements' in request:
+            for n, (el, edge) in enumerate(zip(request['elements'], request['edges'])):
+                kwargs = dict(request['kwargs'])
+                kwargs['filename'] = f"{el}_{request['kwargs']['filename']}"
+                tasks.append(dict(common, element=el.capitalize(), edge=edge.upper(), kwargs=kwargs,
+                                  x_position   = request[f'elem{n+1}_x_position'],
+                                  y_position   = request[f'elem{n+1}_y_position'],
+                                  det_position = request.get(f'elem{n+1}_det_position')))
+        else:
+            tasks.append(dict(common, element=request['element'].capitalize(), edge=request.get('edge', 'K').upper(),
+                              kwargs       = dict(request['kwargs']),
+                              x_position   = request['x_position'],
+                              y_position   = request['y_position'],
+                              det_position = request.get('det_position')))
+    return tasks
+
+
+def schedule_agent_batch(requests, current=None, model=None, exhaustive=7):
+    '''Group a window of agent requests by edge and order the groups to
+    minimize the estimated time spent changing edges, starting from
+    the current (element, edge).  Within a group, the requests keep
+    the order in which they were submitted.
+
+    Up to exhaustive groups, every ordering is considered.  Beyond
+    that, the nearest edge, by estimated cost, is always taken next.
+
+    Returns a list of ((element, edge), [tasks]) and the estimated
+    total time in seconds spent changing edges.
+    '''
+    if model is None:
+        model = EdgeCostModel()
+    groups = {}
+    for task in agent_tasks(requests):
+        groups.setdefault((task['element'], task['edge']), []).append(task)
+
+    def cost(order):
+        here, total = current, 0
+        for there in order:
+            total += model.edge_change(here, there)
+            here = there
+        return total
+
+    keys = list(groups.keys())
+    if len(keys) <= exhaustive:
+        order = min(itertools.permutations(keys), key=cost) if len(keys) > 0 else ()
+    else:
+        order, here, remaining = [], current, list(keys)
+        while len(remaining) > 0:
+            there = min(remaining, key=lambda k: model.edge_change(here, k))
+            order.append(there)
+            remaining.remove(there)
+            here = there
+    return [(key, groups[key]) for key in order], cost(order)
+
+
+def agent_batch_measure(requests, *, md=None):
+    '''Measure a window of agent requests as a single plan, changing
+    edges as few times as possible.  See agent_tasks() for the form of
+    the requests and schedule_agent_batch() for how they are ordered.
+
+    Parameters
+    ----------
+    requests : Sequence[dict]
+        the pending agent requests
+    md : Optional[dict]
+        Metadata, added to that of every measurement
+    '''
+    rkvs = redis.Redis(host="xf06bm-ioc2", port=6379, db=0)
+    current = (rkvs.get("BMM:pds:element").decode("utf-8"), rkvs.get("BMM:pds:edge").decode("utf-8"))
+    model = EdgeCostModel()
+    ordered, edge_time = schedule_agent_batch(requests, current=current, model=model)
+    measure_time = sum(model.measurement(task) for key, tasks in ordered for task in tasks)
+    nspectra = sum(len(tasks) for key, tasks in ordered)
+    report(f'Agent batch: {nspectra} measurements at {len(ordered)} edges, in the order {", ".join(f"{el} {edge}" for (el, edge), tasks in ordered)}.  '
+           f'Estimated time: {edge_time/60:.0f} min changing edges, {measure_time/60:.0f} min measuring', level='bold', slack=True)
+
+    for (el, edge), tasks in ordered:
+        if (el, edge) != current:
+            yield from change_edge(el, edge=edge, focus=True)
+            current = (el, edge)
+        for task in tasks:
+            motor_x, motor_y = task['motor_x'], task['motor_y']
+            if isinstance(motor_x, str):
+                motor_x = user_ns[motor_x]
+            if isinstance(motor_y, str):
+                motor_y = user_ns[motor_y]
+            yield from bps.mv(motor_x, task['x_position'])
+            _md = {f"{el}_position": motor_x.position}
+            yield from bps.mv(motor_y, task['y_position'])
+            if task['det_position'] is not None:
+                yield from bps.mv(xafs_det, task['det_position'])
+            _md[f"{el}_det_position"] = xafs_det.position
+            _md.update(task['md'])
+            _md.update(md or {})
+            kwargs = {k: v for k, v in task['kwargs'].items() if k not in ('element', 'edge')}
+            # xafs doesn't take md, so stuff it into a comment string to be ast.literal_eval()
+            yield from xafs(element=el, edge=edge, comment=str(_md), **kwargs)
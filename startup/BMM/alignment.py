@@ -0,0 +1,135 @@
+import numpy
+
+from bluesky.plans import rel_list_scan
+from bluesky.preprocessors import subs_wrapper
+
+from BMM.kafka import kafka_message
+
+
+class ReadingCollector():
+    '''Keep the primary stream of the runs made while this is subscribed
+    in memory, so that a plan can analyze what it just measured without
+    reading it back from Tiled.
+
+    attributes
+    ==========
+    starts : list
+      start documents of the runs seen so far
+    data : dict
+      column name : list of values, from all the runs seen so far
+
+    example
+    =======
+    >>> collector = ReadingCollector()
+    >>> yield from subs_wrapper(rel_scan(dets, motor, -1, 1, 11), collector)
+    >>> t = collector.table()
+
+    '''
+    def __init__(self):
+        self.starts      = []
+        self.descriptors = set()
+        self.data        = {}
+
+    def __call__(self, name, doc):
+        if name == 'start':
+            self.starts.append(doc)
+        elif name == 'descriptor' and doc.get('name') == 'primary':
+            self.descriptors.add(doc['uid'])
+        elif name == 'event' and doc['descriptor'] in self.descriptors:
+            for k, v in doc['data'].items():
+                self.data.setdefault(k, []).append(v)
+
+    @property
+    def uids(self):
+        return [s['uid'] for s in self.starts]
+
+    @property
+    def scan_ids(self):
+        return [s['scan_id'] for s in self.starts]
+
+    def table(self):
+        '''Return the columns as a dict of numpy arrays.'''
+        return {k: numpy.asarray(v) for k, v in self.data.items()}
+
+
+def refine_windows(x, y, shape='peak'):
+    '''Find where a coarse scan should be refined.  For a peak, that is
+    the interval between the neighbors of the largest point.  For
+    edges, as in the scan across a slot or a slit, that is the interval
+    around each of the first and last crossings of the level halfway
+    between the smallest and largest points.  Return a list of (low,
+    high) intervals.'''
+    order = numpy.argsort(x)
+    x, y  = numpy.asarray(x, dtype=float)[order], numpy.asarray(y, dtype=float)[order]
+    if len(x) < 3 or not numpy.isfinite(y).all():
+        return []
+    if shape == 'peak':
+        i = int(numpy.argmax(y))
+        return [(x[max(i-1, 0)], x[min(i+1, len(x)-1)])]
+    half     = (y.max() + y.min()) / 2
+    crossing = numpy.nonzero(numpy.diff(numpy.sign(y - half)) != 0)[0]
+    if len(crossing) == 0:
+        return []
+    step = (x[-1] - x[0]) / (len(x) - 1)
+    return [(x[i] - step/2, x[i+1] + step/2) for i in sorted({crossing[0], crossing[-1]})]
+
+
+def adaptive_scan(detectors, motor, start, stop, coarse, fine, signal, shape='peak', kafka=None, md={}):
+    '''Coarse-to-fine relative scan.  A coarse pass of evenly spaced
+    points from start to stop is followed by a fine pass which places
+    fine points in each interval found by refine_windows(), i.e. about
+    the peak or about each edge of the signal.  Each pass is its own
+    run, with monotonic positions, so it is saved like any other line
+    scan.  A single kafka linescan start and stop bracket both passes,
+    so they are drawn on the same live plot.
+
+    The readings of both passes are kept in memory.  The plan returns
+    the ReadingCollector holding them.
+
+    arguments
+    =========
+    detectors : list of readable devices
+    motor : the motor to scan
+    start, stop : scan range relative to the current position
+    coarse : number of points in the coarse pass
+    fine : number of points in each refined interval, 0 for a single uniform pass
+    signal : function which computes the signal from the collected table
+    shape : 'peak' or 'edges'
+    kafka : dict for the kafka linescan start message, None to send no message
+    md : metadata dictionary
+    '''
+    collector = ReadingCollector()
+    origin = motor.position
+
+    def one_pass(steps):
+        yield from subs_wrapper(rel_list_scan(detectors, motor, list(steps), md=md), collector)
+
+    def both_passes():
+        yield from one_pass(numpy.linspace(start, stop, coarse))
+        if fine > 0:
+            t = collector.table()
+            windows = refine_windows(t[motor.name] - origin, signal(t), shape)
+            if len(windows) > 0:
+                steps = numpy.concatenate([numpy.linspace(low, high, fine) for low, high in windows])
+                yield from one_pass(numpy.unique(steps))
+
+    if kafka is not None:
+        kafka_message({'linescan': 'start', **kafka})
+    try:
+        yield from both_passes()
+    finally:
+        if kafka is not None:
+            kafka_message({'linescan': 'stop',})
+    return collector
+
+
+def peak_position(x, y, choice='peak'):
+    '''Position of the peak of y(x), from the largest point ('peak') or
+    from the center of mass ('com').  The points need not be evenly
+    spaced or in order.'''
+    order = numpy.argsort(x)
+    x, y  = numpy.asarray(x, dtype=float)[order], numpy.asarray(y, dtype=float)[order]
+    if choice.lower() == 'com':
+        width = numpy.gradient(x)   # the span of x represented by each point
+        return float((x*y*width).sum() / (y*width).sum())
+    return float(x[numpy.argmax(y)])
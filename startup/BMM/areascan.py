@@ -1,17 +1,17 @@
 
 from bluesky.plans import grid_scan
 from bluesky.callbacks import LiveGrid
-from bluesky.plan_stubs import sleep, mv, mvr, null
-from bluesky.preprocessors import subs_decorator, finalize_wrapper
-import numpy, datetime
+from bluesky.plan_stubs import sleep, mv, mvr, null, abs_set, trigger_and_read
+from bluesky.preprocessors import subs_decorator, finalize_wrapper, stage_decorator, run_decorator
+import numpy, datetime, time
 import os
 import matplotlib.pyplot as plt
-from ophyd.sim import noisy_det
+from ophyd.sim import noisy_det, SynAxis
 
 from BMM.user_ns.dwelltime import use_1element, use_4element, use_7element
 from BMM.resting_state     import resting_state_plan
 from BMM.suspenders        import BMM_clear_to_start
-from BMM.kafka             import kafka_message
+from BMM.kafka             import kafka_message, tiled_catchup
 from BMM.linescans         import motor_nicknames
 from BMM.logging           import BMM_log_info, BMM_msg_hook, report
 from BMM.functions         import countdown, plotting_mode, now
@@ -20,7 +20,7 @@ from BMM.attic.derivedplot       import DerivedPlot, interpret_click, close_all_
 from BMM.suspenders        import BMM_suspenders, BMM_clear_to_start, BMM_clear_suspenders
 from BMM.workspace         import rkvs
 
-from BMM.user_ns.base      import bmm_catalog
+from BMM.user_ns.base      import recent
 from BMM.user_ns.bmm       import BMMuser
 from BMM.user_ns.dwelltime import _locked_dwell_time
 from BMM.user_ns.detectors import quadem1, xs, xs1, xs4, xs7, ic0, ic1, ic2, ION_CHAMBERS
@@ -29,11 +29,121 @@ from BMM import user_ns as user_ns_module
 user_ns = vars(user_ns_module)
 
 
+def fly_row(fast, fast_start, fast_stop, nfast, dwell):
+    '''Return the pixel size, velocity, ramp time, run up distance and
+    total distance of one row of a fly scan.  An EpicsMotor's
+    acceleration is the time it takes to reach speed, a SynAxis
+    reaches speed at once.'''
+    pixel     = abs(fast_stop - fast_start) / max(nfast-1, 1)
+    velocity  = pixel / dwell
+    ramp      = 0
+    if not isinstance(fast, SynAxis) and hasattr(fast, 'acceleration'):
+        ramp  = fast.acceleration.get()
+    runup     = velocity*ramp + pixel
+    distance  = abs(fast_stop - fast_start) + 2*runup
+    return pixel, velocity, ramp, runup, distance
+
+
+def fly_bins(fast, fast_start, fast_stop, nfast, dwell, margin=0.1):
+    '''Return the largest number of time bins expected in one row of a
+    fly scan: the time to travel the row, including run up and run
+    out, plus the time to speed up and slow down, in bins of length
+    dwell, with a fractional margin and a couple of spare bins.'''
+    pixel, velocity, ramp, runup, distance = fly_row(fast, fast_start, fast_stop, nfast, dwell)
+    return int(numpy.ceil((distance/velocity + 2*ramp) / dwell * (1 + margin))) + 2
+
+
+def fly_grid_scan(detectors, slow, slow_positions, fast, fast_start, fast_stop, nfast, dwell, md={}):
+    '''Continuous motion grid scan.  For each position of the slow axis,
+    the fast axis moves at constant velocity from fast_start to
+    fast_stop, covering one pixel per dwell time, while the detectors
+    are read in time bins of length dwell.  The fast axis starts and
+    ends a run up distance outside of the scan range, so that it is
+    at speed over the whole row.
+
+    Each event is one time bin, read at the end of the bin, and holds
+    the detector readings along with the slow and fast axis
+    readbacks.  The position at the center of each bin is interpolated
+    later from the readbacks and event times, and the bins are
+    resampled onto the nslow x nfast pixel grid, see
+    BMM_common.flygrid.
+
+    This works with ophyd.sim motors and detectors, so map throughput
+    can be measured without hardware.  A SynAxis moves at constant
+    velocity if it is made with many events per move, e.g.
+
+       fx = SynAxis(name='fx', events_per_move=200)
+
+    arguments
+    =========
+    detectors : list of readable devices
+    slow : slow axis positioner
+    slow_positions : sequence of absolute slow axis positions
+    fast : fast axis positioner, an EpicsMotor or a SynAxis
+    fast_start, fast_stop : absolute range of the fast axis
+    nfast : number of pixels along the fast axis
+    dwell : time bin in seconds, one pixel is traversed in this time
+    md : metadata dictionary
+    '''
+    nslow     = len(slow_positions)
+    direction = 1 if fast_stop >= fast_start else -1
+    pixel, velocity, ramp, runup, distance = fly_row(fast, fast_start, fast_stop, nfast, dwell)
+    readables = list(detectors) + [slow, fast]
+
+    _md = {'detectors'   : [d.name for d in detectors],
+           'motors'      : [slow.name, fast.name],
+           'num_points'  : nslow*nfast,
+           'shape'       : [nslow, nfast],
+           'extents'     : [[slow_positions[0], slow_positions[-1]], [fast_start, fast_stop]],
+           'plan_name'   : 'fly_grid_scan',
+           'plan_pattern': 'fly',
+           'fly'         : {'dwell'          : dwell,
+                            'velocity'       : velocity,
+                            'runup'          : runup,
+                            'fast_start'     : fast_start,
+                            'fast_stop'      : fast_stop,
+                            'slow_positions' : [float(y) for y in slow_positions]},
+           'hints'       : {'dimensions': [([fast.name], 'primary'), ([slow.name], 'primary')]},
+           }
+    _md.update(md)
+
+    if isinstance(fast, SynAxis):
+        initial = fast.delay
+    else:
+        initial = fast.velocity.get()
+
+    def fly_speed(on):
+        if isinstance(fast, SynAxis):
+            fast.delay = distance/velocity if on else initial
+            yield from null()
+        else:
+            yield from mv(fast.velocity, velocity if on else initial)
+
+    @stage_decorator(readables)
+    @run_decorator(md=_md)
+    def fly_rows():
+        for y in slow_positions:
+            yield from mv(slow, y, fast, fast_start - direction*runup)
+            yield from fly_speed(True)
+            status = yield from abs_set(fast, fast_stop + direction*runup)
+            began = time.monotonic()
+            while not status.done:
+                ## a detector integrating for dwell on trigger needs no pacing, one which reads instantly does
+                wait = dwell - (time.monotonic() - began)
+                if wait > 0:
+                    yield from sleep(wait)
+                began = time.monotonic()
+                yield from trigger_and_read(readables)
+            yield from fly_speed(False)
+
+    return (yield from finalize_wrapper(fly_rows(), fly_speed(False)))
+
+
 def areascan(detector,
              slow, startslow, stopslow, nslow,
              fast, startfast, stopfast, nfast,
              pluck=True, force=False, dwell=0.1, fname=None,
-             contour=True, log=False, md={}):
+             contour=True, log=False, fly=False, md={}):
     '''
     Generic areascan plan.  This is a RELATIVE scan, relative to the
     current positions of the selected motors.
@@ -55,6 +165,7 @@ def areascan(detector,
        dwell:     dwell time at each point (0.1 sec default)
        contour:   True=plot with filled-in contours, False=plot with pcolormesh
        log:       True=plot log of signal in color scale
+       fly:       True=move the fast axis continuously, see fly_grid_scan
        md:        composable dictionary of metadata
 
     slow and fast are the BlueSky name for a motor (e.g. xafs_linx)
@@ -65,7 +176,7 @@ def areascan(detector,
     def main_plan(detector,
                   slow, startslow, stopslow, nslow,
                   fast, startfast, stopfast, nfast,
-                  pluck, force, dwell, fname, contour, log,  md):
+                  pluck, force, dwell, fname, contour, log, fly, md):
 
         
         if force is True:
@@ -82,7 +193,7 @@ def areascan(detector,
 
         ## sanity checks on slow axis
         if type(slow) is str: slow = slow.lower()
-        if slow not in motor_nicknames.keys() and 'EpicsMotor' not in str(type(slow)) and 'PseudoSingle' not in str(type(slow)):
+        if slow not in motor_nicknames.keys() and 'EpicsMotor' not in str(type(slow)) and 'PseudoSingle' not in str(type(slow)) and not isinstance(slow, SynAxis):
             print(error_msg('\n*** %s is not an areascan motor (%s)\n' %
                             (slow, str.join(', ', motor_nicknames.keys()))))
             BMMuser.final_log_entry = False
@@ -92,19 +203,20 @@ def areascan(detector,
             slow = motor_nicknames[slow]
 
         current_slow = slow.position
-        if current_slow+startslow < slow.limits[0]:
-            print(error_msg(f'These scan parameters will take {slow.name} outside it\'s lower limit of {slow.limits[0]}'))
+        slow_limits = getattr(slow, 'limits', (-numpy.inf, numpy.inf))  # a SynAxis has no limits
+        if current_slow+startslow < slow_limits[0]:
+            print(error_msg(f'These scan parameters will take {slow.name} outside it\'s lower limit of {slow_limits[0]}'))
             print(whisper(f'(starting position = {slow.position})'))
             return(yield from null())
-        if current_slow+stopslow > slow.limits[1]:
-            print(error_msg(f'These scan parameters will take {slow.name} outside it\'s upper limit of {slow.limits[1]}'))
+        if current_slow+stopslow > slow_limits[1]:
+            print(error_msg(f'These scan parameters will take {slow.name} outside it\'s upper limit of {slow_limits[1]}'))
             print(whisper(f'(starting position = {slow.position})'))
             return(yield from null())
 
 
         ## sanity checks on fast axis
         if type(fast) is str: fast = fast.lower()
-        if fast not in motor_nicknames.keys() and 'EpicsMotor' not in str(type(fast)) and 'PseudoSingle' not in str(type(fast)):
+        if fast not in motor_nicknames.keys() and 'EpicsMotor' not in str(type(fast)) and 'PseudoSingle' not in str(type(fast)) and not isinstance(fast, SynAxis):
             print(error_msg('\n*** %s is not an areascan motor (%s)\n' %
                             (fast, str.join(', ', motor_nicknames.keys()))))
             BMMuser.final_log_entry = False
@@ -114,16 +226,21 @@ def areascan(detector,
             fast = motor_nicknames[fast]
 
         current_fast = fast.position
-        if current_fast+startfast < fast.limits[0]:
-            print(error_msg(f'These scan parameters will take {fast.name} outside it\'s lower limit of {fast.limits[0]}'))
+        fast_limits = getattr(fast, 'limits', (-numpy.inf, numpy.inf))  # a SynAxis has no limits
+        if current_fast+startfast < fast_limits[0]:
+            print(error_msg(f'These scan parameters will take {fast.name} outside it\'s lower limit of {fast_limits[0]}'))
             print(whisper(f'(starting position = {fast.position})'))
             return(yield from null())
-        if current_fast+stopfast > fast.limits[1]:
-            print(error_msg(f'These scan parameters will take {fast.name} outside it\'s upper limit of {fast.limits[1]}'))
+        if current_fast+stopfast > fast_limits[1]:
+            print(error_msg(f'These scan parameters will take {fast.name} outside it\'s upper limit of {fast_limits[1]}'))
             print(whisper(f'(starting position = {fast.position})'))
             return(yield from null())
             
 
+        if fly and not isinstance(fast, SynAxis) and not hasattr(fast, 'velocity'):
+            print(error_msg(f'{fast.name} has no velocity setting and cannot be used as the fast axis of a fly scan'))
+            return(yield from null())
+
         detector = detector.capitalize()
         yield from mv(_locked_dwell_time, dwell)
         dets = ION_CHAMBERS.copy()
@@ -145,7 +262,11 @@ def areascan(detector,
             detector = 'I0'
         elif detector == 'Xs1':
             dets.append(xs1)
-            yield from mv(xs.total_points, nslow*nfast)
+            ## when flying, time bins outnumber pixels because of run up and run out
+            if fly:
+                yield from mv(xs.total_points, nslow*fly_bins(fast, startfast, stopfast, nfast, dwell))
+            else:
+                yield from mv(xs.total_points, nslow*nfast)
         elif detector in ('Random', 'Noisy', 'Noisy_det'):
             dets.append(noisy_det)
             detector = 'noisy_det'
@@ -154,7 +275,10 @@ def areascan(detector,
         line2 = f'fast motor: {fast.name}, {startfast}, {stopfast}, {nfast} -- starting at {fast.position:.3f}\n'
 
         npoints = nfast * nslow
-        estimate = int(npoints*(dwell+0.43))
+        if fly:
+            estimate = int(nslow*(nfast*dwell + 3))  # a few seconds per row to run up and return
+        else:
+            estimate = int(npoints*(dwell+0.43))
     
         close_all_plots()
     
@@ -180,6 +304,7 @@ def areascan(detector,
                        'fast_steps'   : nfast,
                        'fast_initial' : fast.position,
                        'detector'     : detector,
+                       'fly'          : fly,
                        'element'      : BMMuser.element,
                        'energy'       : user_ns['dcm'].energy.position})
         
@@ -193,13 +318,18 @@ def areascan(detector,
                           fast, startfast, stopfast, nfast,
                           fname, snake=False):
             BMMuser.final_log_entry = False
-            
-            uid = yield from grid_scan(dets,
-                                       slow, startslow, stopslow, nslow,
-                                       fast, startfast, stopfast, nfast,
-                                       snake, md={**md, 'plan_name' : f'grid_scan measurement {slow.name} {fast.name} {detector}',
-                                                  'BMM_kafka' : {'hint': f'areascan {detector.capitalize()} {slow.name} {fast.name} {contour} {log} {user_ns["dcm"].energy.position:.1f}',
-                                                                 'pngout': fname}})
+            thismd = {**md, 'plan_name' : f'grid_scan measurement {slow.name} {fast.name} {detector}',
+                      'BMM_kafka' : {'hint': f'areascan {detector.capitalize()} {slow.name} {fast.name} {contour} {log} {user_ns["dcm"].energy.position:.1f}',
+                                     'pngout': fname}}
+            if fly:
+                thismd['plan_name'] = f'fly_grid_scan measurement {slow.name} {fast.name} {detector}'
+                uid = yield from fly_grid_scan(dets, slow, numpy.linspace(startslow, stopslow, nslow),
+                                               fast, startfast, stopfast, nfast, dwell, md=thismd)
+            else:
+                uid = yield from grid_scan(dets,
+                                           slow, startslow, stopslow, nslow,
+                                           fast, startfast, stopfast, nfast,
+                                           snake, md=thismd)
             yield from mv(slow, ini_s, fast, ini_f)  # return to starting position
             BMMuser.final_log_entry = True
             return uid
@@ -209,12 +339,15 @@ def areascan(detector,
         rkvs.set('BMM:scan:estimated', estimate)
         
         BMM_log_info('begin areascan observing: %s\n%s%s' % (detector, line1, line2))
+        began = time.time()
         asuid = yield from make_areascan(dets,
                                        slow, slow.position+startslow, slow.position+stopslow, nslow,
                                        fast, fast.position+startfast, fast.position+stopfast, nfast,
                                        fname, snake=False)
+        tiled_catchup()
         kafka_message({'areascan': 'stop', 'uid' : asuid, 'filename': fname})
         report(f'map uid = {asuid}', level='bold', slack=True)
+        print(whisper(f'{npoints} pixels in {(time.time()-began)/60:.1f} min, {npoints/(time.time()-began):.1f} pixels per second'))
 
         # write .png, .mat, .xlsx with kafka here
         
@@ -223,8 +356,8 @@ def areascan(detector,
         db = user_ns['db']
         BMM_clear_suspenders()
         if BMMuser.final_log_entry is True:
-            BMM_log_info('areascan finished\n\tuid = %s, scan_id = %d' % (bmm_catalog[-1].metadata['start']['uid'],
-                                                                          bmm_catalog[-1].metadata['start']['scan_id']))
+            BMM_log_info('areascan finished\n\tuid = %s, scan_id = %d' % (recent[-1].metadata['start']['uid'],
+                                                                          recent[-1].metadata['start']['scan_id']))
         yield from resting_state_plan()
         user_ns['RE'].msg_hook = BMM_msg_hook
         BMMuser.x, BMMuser.y, BMMuser.motor, BMMuser.motor2, BMMuser.fig, BMMuser.ax = [None] * 6
@@ -245,7 +378,7 @@ def areascan(detector,
     yield from finalize_wrapper(main_plan(detector,
                                           slow, startslow, stopslow, nslow,
                                           fast, startfast, stopfast, nfast,
-                                          pluck, force, dwell, fname, contour, log, md),
+                                          pluck, force, dwell, fname, contour, log, fly, md),
                                 cleanup_plan())
     user_ns['RE'].msg_hook = BMM_msg_hook
 
@@ -1,4 +1,5 @@
 import os, uuid, threading, itertools, datetime
+from functools import lru_cache
 import numpy
 
 import requests
@@ -30,16 +31,54 @@ from BMM.logging import report
 
 from BMM.user_ns.bmm import BMMuser
 
-def annotate_image(imagefile, text):
+JPEG_QUALITY = 75               # PIL's default
+
+@lru_cache(maxsize=4)
+def annotation_font(size=24):
+    '''Load the annotation font once and keep it.'''
     bluesky_path_as_list = bluesky.__path__[0].split('/') # crude, but finds current collection folder
     font_path = os.path.join('/', *bluesky_path_as_list[:4], 'lib', 'python3.7', 'site-packages', 'matplotlib', 'mpl-data', 'fonts', 'ttf')
-    img = Image.open(imagefile)
+    if not os.path.isfile(os.path.join(font_path, 'DejaVuSans.ttf')):
+        import matplotlib
+        font_path = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf')
+    return ImageFont.truetype(os.path.join(font_path, 'DejaVuSans.ttf'), size)
+
+def annotate(img, text):
+    '''Draw the annotation banner on an in-memory PIL image.'''
     width, height = img.size
     draw = ImageDraw.Draw(img, 'RGBA')
     draw.rectangle(((0, int(9.5*height/10)), (width, height)), fill=(255,255,255,125))
-    font = ImageFont.truetype(font_path + '/DejaVuSans.ttf', 24)
-    draw.text((int(0.2*width/10), int(9.6*height/10)), text, (0,0,0), font=font)
-    img.save(imagefile)
+    draw.text((int(0.2*width/10), int(9.6*height/10)), text, (0,0,0), font=annotation_font())
+    return img
+
+def annotate_image(imagefile, text):
+    img = Image.open(imagefile)
+    annotate(img, text).save(imagefile)
+
+def save_snapshot(content, filename, annotation=None, quality=None):
+    '''Write a JPEG image to filename and return its (height, width, 3)
+    shape.
+
+    content is either the bytes of a JPEG image, as returned by a
+    webcam, or a PIL image.  If there is no annotation, JPEG bytes are
+    written as is, without decoding.  Otherwise, the image is
+    annotated in memory and encoded once.
+    '''
+    if quality is None:
+        quality = JPEG_QUALITY
+    if isinstance(content, bytes):
+        img = Image.open(BytesIO(content))  # lazy, the header gives the size without decoding
+        if annotation is None:
+            with open(filename, 'wb') as f:
+                f.write(content)
+            return (img.height, img.width, 3)
+        img = img.convert('RGB')
+    else:
+        img = content
+    if annotation is not None:
+        annotate(img, annotation)
+    img.save(filename, 'JPEG', quality=quality)
+    return (img.height, img.width, 3)
 
 def xas_webcam(filename=None, **kwargs):
     XASURL = 'http://xf06bm-cam6/axis-cgi/jpg/image.cgi'
@@ -47,9 +86,7 @@ def xas_webcam(filename=None, **kwargs):
     if filename is None:
         filename = os.environ['HOME'] + '/XAS_camera_' + now() + '.jpg'
     r=requests.get(XASURL, proxies=CAM_PROXIES)
-    Image.open(BytesIO(r.content)).save(filename, 'JPEG')
-    if 'annotation' in kwargs:
-        annotate_image(filename, kwargs['annotation'])
+    save_snapshot(r.content, filename, annotation=kwargs.get('annotation'), quality=kwargs.get('quality'))
     report('XAS webcam image written to %s' % filename)
 
 def xrd_webcam(filename=None, **kwargs):
@@ -58,9 +95,7 @@ def xrd_webcam(filename=None, **kwargs):
     if filename is None:
         filename = os.environ['HOME'] + '/XRD_camera_' + now() + '.jpg'
     r=requests.get(XRDURL, proxies=CAM_PROXIES)
-    Image.open(BytesIO(r.content)).save(filename, 'JPEG')
-    if 'annotation' in kwargs:
-        annotate_image(filename, kwargs['annotation'])
+    save_snapshot(r.content, filename, annotation=kwargs.get('annotation'), quality=kwargs.get('quality'))
     report('XRD webcam image written to %s' % filename)
 
 
@@ -225,6 +260,8 @@ class BMMSnapshot(Device):
         self.x = 640
         self.y = 480
         self.brightness = 30
+        self.annotate = True    # False to write webcam images as they come from the camera
+        self.quality = JPEG_QUALITY
         if which.lower() =='xrd':
             self._SPEC = "BMM_XRD_WEBCAM"
             self._url = 'http://xf06bm-cam5/axis-cgi/jpg/image.cgi'
@@ -275,26 +312,19 @@ class BMMSnapshot(Device):
             # Kick off requests, or subprocess, or whatever with the result
             # that a file is saved at `filename`.
 
+            annotation = None
+            if self.annotate:
+                annotation = 'NIST BMM (NSLS-II 06BM)      ' + self._annotation_string + '      ' + now()
             if self._SPEC == "BMM_XAS_WEBCAM" or self._SPEC == "BMM_XRD_WEBCAM":
                 CAM_PROXIES = {"http": None, "https": None,}
                 r=requests.get(self._url, proxies=CAM_PROXIES)
-                im = Image.open(BytesIO(r.content))
-                im.save(filename, 'JPEG')
-                #print(f'w: {im.width}    h: {im.height}')
-                self.image.shape = (im.height, im.width, 3)
-
-                annotation = 'NIST BMM (NSLS-II 06BM)      ' + self._annotation_string + '      ' + now()
-                annotate_image(filename, annotation)
+                self.image.shape = save_snapshot(r.content, filename, annotation=annotation, quality=self.quality)
             elif self._SPEC == "BMM_USBCAM":
                 if self.name == 'usbcam-1':
                     u=user_ns['usb1'].image.array_data.get().reshape((1080,1920,3))
                 else: 
                     u=user_ns['usb2'].image.array_data.get().reshape((600,800,3))
-                im = Image.fromarray(u)
-                im.save(filename, 'JPEG')
-                self.image.shape = (im.height, im.width, 3)
-                annotation = 'NIST BMM (NSLS-II 06BM)      ' + self._annotation_string + '      ' + now()
-                annotate_image(filename, annotation)
+                self.image.shape = save_snapshot(Image.fromarray(u), filename, annotation=annotation, quality=self.quality)
             else:
                 analog_camera(device=self.device, x=self.x, y=self.y, brightness=self.brightness,
                               filename=filename, sample=self._annotation_string, folder=self._root, quiet=True)
@@ -0,0 +1,133 @@
+import time
+from ophyd.sim import SynAxis
+
+from BMM.functions import disconnected_msg, bold_msg
+
+
+class ConnectionManager():
+    '''Connect to the beamline's EPICS devices concurrently at startup.
+
+    Instantiating an ophyd device starts its channel access
+    connections in the background.  So, rather than waiting on each
+    device in turn, a startup module instantiates all of its devices
+    first, registering them here, then calls settle() once.  That
+    waits on all of them at the same time, until every one is
+    connected or until the deadline has passed.  There is a single
+    deadline for all of startup, measured from the instantiation of
+    the first device registered, and it is shared by every call to
+    settle().  A module which settles after the deadline gives its
+    own devices only a short grace period.  Thus startup takes about
+    as long as the slowest device, not the sum of all of them.
+
+    Motors made with define() which fail to connect are replaced, in
+    one pass, by SynAxis stand-ins of the same name, both in the
+    manager and in the namespace handed to settle().  Other devices
+    are only reported; the startup module checks their connected
+    attribute, as before.  See the discussion at the top of
+    BMM/user_ns/instruments.py
+
+    run_report() calls begin() for each module imported at startup,
+    which records the time spent importing each module and
+    connecting its devices.  Use report() to see that.
+
+    attributes
+    ==========
+    timeout : float
+      seconds from the first registration to the startup deadline [5.5]
+    grace : float
+      seconds given to a group of devices settled after the deadline [1]
+    deadline : float
+      time.monotonic() value of the shared deadline, None until the
+      first device is registered
+    pending : dict
+      device name : (device, time of instantiation, substitute with SynAxis?)
+    failed : list
+      names of devices which did not connect
+    timeline : list
+      (module, time of import, seconds spent connecting)
+
+    example
+    =======
+    >>> m = connections.define(XAFSEpicsMotor, 'XF:06BM-BI{FS:03-Ax:Y}Mtr', name='dm3_fs')
+    >>> connections.settle(globals())
+
+    '''
+    def __init__(self, timeout=5.5, grace=1):
+        self.timeout  = timeout
+        self.grace    = grace
+        self.deadline = None
+        self.pending  = {}
+        self.failed   = []
+        self.timeline = []
+
+    def begin(self, module):
+        self.timeline.append([module, time.monotonic(), 0])
+
+    def define(self, cls, prefix, name='unnamed', **kwargs):
+        '''Instantiate a motor and register it to be waited on by
+        settle().  It will be replaced by a SynAxis if it fails to
+        connect.'''
+        this = cls(prefix, name=name, **kwargs)
+        self.register(name, this, True)
+        return this
+
+    def watch(self, *devices):
+        '''Register already instantiated devices to be waited on by
+        settle().  These are not substituted if they fail to connect.'''
+        for d in devices:
+            self.register(d.name, d, False)
+
+    def register(self, name, device, substitute):
+        '''Record a device to be waited on.  The first one registered
+        starts the clock on the shared deadline.'''
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now + self.timeout
+        self.pending[name] = (device, now, substitute)
+
+    def settle(self, namespace=None):
+        '''Wait on all the registered devices at once, until the shared
+        startup deadline or, past that, for the grace period.  Replace
+        the motors that fail to connect with SynAxis stand-ins,
+        including wherever they are bound in namespace.  Return the
+        dict of substitutes.'''
+        if len(self.pending) == 0:
+            return {}
+        start = time.monotonic()
+        deadline = max(self.deadline, min(t for d, t, s in self.pending.values()) + self.grace)
+        waiting = dict(self.pending)
+        while len(waiting) > 0 and time.monotonic() < deadline:
+            waiting = {name: this for name, this in waiting.items() if this[0].connected is False}
+            if len(waiting) > 0:
+                time.sleep(0.05)
+        substitutes = {}
+        for name, (device, t, substitute) in waiting.items():
+            print(disconnected_msg(f'{name} is not connected'))
+            self.failed.append(name)
+            if substitute:
+                substitutes[name] = (device, SynAxis(name=name))
+        if namespace is not None and len(substitutes) > 0:
+            for key, value in list(namespace.items()):
+                for name, (device, synaxis) in substitutes.items():
+                    if value is device:
+                        namespace[key] = synaxis
+        self.pending = {}
+        if len(self.timeline) > 0:
+            self.timeline[-1][2] += time.monotonic() - start
+        return {name: synaxis for name, (device, synaxis) in substitutes.items()}
+
+    def report(self):
+        '''Print the time spent importing each startup module and, of that,
+        the time spent waiting for devices to connect.'''
+        print(bold_msg(f'{"module":40} {"import (s)":>10} {"connect (s)":>11}'))
+        total = 0
+        for i, (module, t, connect) in enumerate(self.timeline):
+            end = self.timeline[i+1][1] if i+1 < len(self.timeline) else time.monotonic()
+            total += end - t
+            print(f'{module:40} {end-t:10.2f} {connect:11.2f}')
+        print(bold_msg(f'{"total":40} {total:10.2f} {sum(c for m,t,c in self.timeline):11.2f}'))
+        if len(self.failed) > 0:
+            print(disconnected_msg(f'not connected: {", ".join(self.failed)}'))
+
+
+connections = ConnectionManager()
@@ -1,4 +1,4 @@
-import os, re, socket
+import os, re
 from pygments import highlight
 from pygments.lexers import PythonLexer, IniLexer
 from pygments.formatters import HtmlFormatter
@@ -153,6 +153,7 @@ class DossierTools():
     dwell         = 0
     delay         = 0
     scanuid       = None
+    single_run    = True
     
     def __init__(self):
         self.scanlist      = ''
@@ -209,96 +210,64 @@ class DossierTools():
     def cameras(self, folder, stub, md):
         '''For each camera in use at the beamline, capture and image and record relevant
         metadata (UID, filename) for dossier creation
+
+        With self.single_run True (the default), all cameras are
+        triggered at once, in a single count() run, so the time spent
+        is that of the slowest camera and there is only one set of
+        documents and one copy request.  Otherwise, each camera is
+        captured in its own run, one after another.
         '''
         ahora = now()
         BMMuser, xascam, anacam, usb1, usb2 = user_ns['BMMuser'], user_ns['xascam'], user_ns['anacam'], user_ns['usb1'], user_ns['usb2']
-        image_ana, image_web, image_usb1, image_usb2 = '','','',''
         anauid, webuid, usb1uid, usb2uid = '','','',''
         anasnap, websnap, usb1snap, usb2snap = '','','',''
-        
-        ### --- XAS webcam ---------------------------------------------------------------
-        annotation = stub
-        websnap = "%s_XASwebcam_%s.jpg" % (stub, ahora)
-        image_web = os.path.join(folder, 'snapshots', websnap)
-        md['_filename'] = image_web
-        xascam._annotation_string = annotation
-        if with_webcam is True:
-            print(bold_msg('XAS webcam snapshot'))
-            webuid = yield from count([xascam], 1, md = {'XDI':md, 'plan_name' : 'count xafs_metadata snapshot'})
-            self.websnap, self.webuid = websnap, webuid
-            kafka_message({'copy': True,
-                           'uuid': webuid,
-                           'target': os.path.join(proposal_base(), 'snapshots', websnap), })
-
-            if BMMuser.post_webcam:
-                kafka_message({'echoslack': True,
-                               'img': os.path.join(proposal_base(), 'snapshots', websnap)})
 
         ### --- analog camera using redgo dongle ------------------------------------------
         ###     this can only be read by a client on xf06bm-ws3, so... not QS on srv1
-        thishost = socket.gethostname()
-        if is_re_worker_active() is False and 'ws3' in thishost:
-            pass
-            # print(whisper('The error text below saying "Error opening file for output:"'))
-            # print(whisper('happens every time and does not indicate a problem of any sort.'))
-            # anasnap = "%s_analog_%s.jpg" % (stub, ahora)
-            # image_ana = os.path.join(folder, 'snapshots', anasnap)
-            # md['_filename'] = image_ana
-            # anacam._annotation_string = stub
-            # print(bold_msg('analog camera snapshot'))
-            # anauid = yield from count([anacam], 1, md = {'XDI':md, 'plan_name' : 'count xafs_metadata snapshot'})
-            # print(whisper('The error text above saying "Error opening file for output:"'))
-            # print(whisper('happens every time and does not indicate a problem of any sort.\n'))
-            # self.anasnap, self.anauid = anasnap, anauid
-            # # try:
-            # #     im = Image.fromarray(numpy.array(bmm_catalog[self.anauid].primary.read()['anacam_image'])[0])
-            # #     im.save(image_ana, 'JPEG')
-            # #     if BMMuser.post_anacam:
-            # #         kafka_message({'echoslack': True,
-            # #                        'img': image_ana})
-            # # except:
-            # #     print(error_msg('Could not copy analog snapshot, probably because it\'s capture failed.'))
-            # #     anacam_uid = False
-            # #     pass
-            # kafka_message({'copy': True,
-            #            'uuid': anauid,
-            #            'target': os.path.join(proposal_base(), 'snapshots', anasnap), })
-            # if BMMuser.post_anacam:
-            #     kafka_message({'echoslack': True,
-            #                    'img': os.path.join(proposal_base(), 'snapshots', anasnap)})
-
-            
-        ### --- USB camera #1 --------------------------------------------------------------
-        usb1snap = "%s_usb1_%s.jpg" % (stub, ahora)
-        image_usb1 = os.path.join(folder, 'snapshots', usb1snap)
-        md['_filename'] = image_usb1
-        #usbcam1._annotation_string = stub
-        print(bold_msg('USB camera #1 snapshot'))
-        usb1uid = yield from count([usb1], 1, md = {'XDI':md, 'plan_name' : 'count xafs_metadata snapshot'})
-        self.usb1snap, self.usb1uid = usb1snap, usb1uid
-        kafka_message({'copy': True,
-                       'uuid': usb1uid,
-                       'target': os.path.join(proposal_base(), 'snapshots', usb1snap), })
-        if BMMuser.post_usbcam1:
-            kafka_message({'echoslack': True,
-                           'img': os.path.join(proposal_base(), 'snapshots', usb1snap)})
-
-        ### --- USB camera #2 --------------------------------------------------------------
-        if with_cam2 is True:
+        ###     (currently disabled, see git history for the old code)
+
+        ## (device, attribute stem, snapshot filename, post to slack?, description)
+        cameras = []
+        if with_webcam is True:
+            xascam._annotation_string = stub
+            websnap = "%s_XASwebcam_%s.jpg" % (stub, ahora)
+            cameras.append((xascam, 'web', websnap, BMMuser.post_webcam, 'XAS webcam'))
+        if usb1 is not None:
+            usb1snap = "%s_usb1_%s.jpg" % (stub, ahora)
+            cameras.append((usb1, 'usb1', usb1snap, BMMuser.post_usbcam1, 'USB camera #1'))
+        if with_cam2 is True and usb2 is not None:
             usb2snap = "%s_usb2_%s.jpg" % (stub, ahora)
-            image_usb2 = os.path.join(folder, 'snapshots', usb2snap)
-            md['_filename'] = image_usb2
-            #usbcam2._annotation_string = stub
-            print(bold_msg('USB camera #2 snapshot'))
-            usb2uid = yield from count([usb2], 1, md = {'XDI':md, 'plan_name' : 'count xafs_metadata snapshot'})
-            self.usb2snap, self.usb2uid = usb2snap, usb2uid
+            cameras.append((usb2, 'usb2', usb2snap, BMMuser.post_usbcam2, 'USB camera #2'))
+        if len(cameras) == 0:
+            return
+
+        uids = {}
+        if self.single_run is True:
+            md['_filename'] = os.path.join(folder, 'snapshots', cameras[0][2])
+            md['_filenames'] = [os.path.join(folder, 'snapshots', c[2]) for c in cameras]
+            print(bold_msg(', '.join(c[4] for c in cameras) + ' snapshots'))
+            uid = yield from count([c[0] for c in cameras], 1, md = {'XDI':md, 'plan_name' : 'count xafs_metadata snapshot'})
             kafka_message({'copy': True,
-                           'uuid': usb2uid,
-                           'target': os.path.join(proposal_base(), 'snapshots', usb2snap), })
-            if BMMuser.post_usbcam2:
+                           'uuid': uid,
+                           'targets': {c[0].name: os.path.join(proposal_base(), 'snapshots', c[2]) for c in cameras}, })
+            uids = {c[1]: uid for c in cameras}
+        else:
+            for device, stem, snap, post, description in cameras:
+                md['_filename'] = os.path.join(folder, 'snapshots', snap)
+                print(bold_msg(f'{description} snapshot'))
+                uids[stem] = yield from count([device], 1, md = {'XDI':md, 'plan_name' : 'count xafs_metadata snapshot'})
+                kafka_message({'copy': True,
+                               'uuid': uids[stem],
+                               'target': os.path.join(proposal_base(), 'snapshots', snap), })
+
+        for device, stem, snap, post, description in cameras:
+            setattr(self, f'{stem}snap', snap)
+            setattr(self, f'{stem}uid', uids[stem])
+            if post:
                 kafka_message({'echoslack': True,
-                               'img': os.path.join(proposal_base(), 'snapshots', usb2snap)})
-       
+                               'img': os.path.join(proposal_base(), 'snapshots', snap)})
+        webuid, usb1uid, usb2uid = uids.get('web', ''), uids.get('usb1', ''), uids.get('usb2', '')
+
         ### --- capture metadata for dossier -----------------------------------------------
         self.cameras_md = {'webcam_file': websnap,  'webcam_uid': webuid,
                            'analog_file': anasnap,  'anacam_uid': anauid,
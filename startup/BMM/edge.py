@@ -33,6 +33,27 @@ from BMM.user_ns.dwelltime   import with_xspress3
 from BMM.user_ns.instruments import * #kill_mirror_jacks, m3_ydi, m3_ydo, m3_yu, m3_xd, m3_xu, ks, m2_ydi, m2_ydo, m2_yu
 from BMM.user_ns.motors      import *
 
+EDGE_HISTORY = 'BMM:edge:history'  # redis list of json records, one per completed edge change
+
+def record_edge_change(previous, el, edge, energy, mode, duration, keep=200):
+    '''Append a completed edge change to the history kept in redis.  The
+    agent batch scheduler uses this history to estimate the cost of an
+    edge change.'''
+    try:
+        rkvs.rpush(EDGE_HISTORY, json.dumps({'from': previous[0], 'from_edge': previous[1], 'from_energy': previous[2],
+                                             'element': el, 'edge': edge, 'energy': float(energy), 'mode': mode,
+                                             'duration': duration, 'time': time.time()}))
+        rkvs.ltrim(EDGE_HISTORY, -keep, -1)
+    except Exception as E:
+        print(whisper(f'Unable to record edge change history: {E}'))
+
+def edge_change_history():
+    '''Return the list of recorded edge changes, oldest first.'''
+    try:
+        return [json.loads(x) for x in rkvs.lrange(EDGE_HISTORY, 0, -1)]
+    except Exception:
+        return []
+
 def show_edges():
     #if with_xspress3 is True:
     text = show_reference_wheel() + '\n' + xs.show_rois()
@@ -350,6 +371,7 @@ def change_edge(el, focus=False, edge='K', energy=None, slits=True, tune=True, t
         if mode == 'XRD':
             if edge_energy(el,edge) > 23500:
                 edge = 'L3'
+        previous = (BMMuser.element, BMMuser.edge, getattr(BMMuser, 'edge_energy', None))
         BMMuser.edge        = edge
         BMMuser.element     = el
         BMMuser.edge_energy = energy
@@ -481,6 +503,7 @@ def change_edge(el, focus=False, edge='K', energy=None, slits=True, tune=True, t
             #if mode in ('D', 'E', 'F'):
             yield from mv(slits3.hsize, hsize)
             report(f'Finished configuring for {el.capitalize()} {edge.capitalize()} edge, now in photon delivery mode {get_mode()}', level='bold', slack=True)
+        record_edge_change(previous, el, edge, energy, mode, time.time()-start)
         if slits is False:
             print('  * You may need to verify the slit position:  RE(slit_height())')
 
@@ -106,6 +106,8 @@ def run_report(thisfile, text=None):
     if thisfile[0] == '\t':
         importing = '\t'
     print(colored(f'{importing} {prepend}{thisfile.split("/")[-1]} {add}', 'lightcyan'), flush=True)
+    from BMM.connections import connections  # record import and connection times for the startup report
+    connections.begin(('    ' if importing == '\t' else '') + thisfile.split("/")[-1].strip())
 
 
 def error_msg(text):
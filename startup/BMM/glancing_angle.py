@@ -197,7 +197,7 @@ class GlancingAngle(Device):
         xafs_pitch = user_ns['xafs_pitch']
         uid = yield from linescan(xafs_pitch, 'it', -2.5, 2.5, 51, dopluck=False, force=force)
         kafka_message({'close': 'last'})
-        table  = user_ns['db'][-1].table()
+        table  = user_ns['recent'][-1].table()
         pitch  = table['xafs_pitch']
         signal = table['It']/table['I0']
         target = signal.idxmax()
@@ -223,7 +223,7 @@ class GlancingAngle(Device):
             motor = user_ns['xafs_linx']
         uid = yield from linescan(motor, 'it', -2.3, 2.3, 51, dopluck=False)
         kafka_message({'close': 'last'})
-        table  = user_ns['db'][-1].table()
+        table  = user_ns['recent'][-1].table()
         yy     = table[motor.name]
         signal = table['It']/table['I0']
         if drop is not None:
@@ -263,8 +263,8 @@ class GlancingAngle(Device):
         else:
             motor = user_ns['xafs_linx']
         uid = yield from linescan(motor, 'xs', -2.3, 2.3, 51, dopluck=False, force=force)
-        self.f_uid = user_ns['db'].v2[-1].metadata['start']['uid'] 
-        tf = user_ns['db'][-1].table()
+        self.f_uid = user_ns['recent'][-1].metadata['start']['uid']
+        tf = user_ns['recent'][-1].table()
         yy = tf[motor.name]
         yy = yy[2:]             # spurious first point in fluo scan due to Xspress3 issue 24 July 2024
         signal = (tf[BMMuser.xs1] + tf[BMMuser.xs2] + tf[BMMuser.xs3] + tf[BMMuser.xs4]) / tf['I0']
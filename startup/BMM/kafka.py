@@ -1,5 +1,8 @@
 
-import os
+import os, json, uuid, time, threading, queue
+from collections import deque
+from concurrent.futures import Future
+import numpy
 
 try:
     from bluesky_queueserver import is_re_worker_active
@@ -15,7 +18,7 @@ from nslsii.kafka_utils import _read_bluesky_kafka_config_file
     
 from bluesky_kafka.produce import BasicProducer
 
-from BMM.functions import proposal_base, warning_msg
+from BMM.functions import proposal_base, warning_msg, bold_msg
 
 from BMM import user_ns as user_ns_module
 user_ns = vars(user_ns_module)
@@ -29,14 +32,251 @@ producer = BasicProducer(bootstrap_servers=kafka_config['bootstrap_servers'],
 )
 
 
+class BatchedProducer():
+    '''Send kafka messages from a background thread, in batches.
+
+    Messages handed to send() are put on a queue and the call returns
+    at once with a Future.  A single worker thread collects every
+    message that arrives within linger seconds of the first -- which
+    is typically all the messages from one plan step -- hands them to
+    the producer, then polls for broker acknowledgements.  Since there
+    is one thread and one key, message order is preserved.
+
+    Each Future resolves to the delivery latency in seconds, measured
+    from the call to send() to the broker acknowledgement, or raises
+    the delivery error.  Latencies are kept for the most recent
+    messages and can be shown as a histogram.
+
+    attributes
+    ==========
+    producer : BasicProducer
+      the bluesky_kafka producer
+    linger : float
+      seconds to wait for more messages before sending a batch [0.05]
+    maxbatch : int
+      largest number of messages in one batch [64]
+    lagging : float
+      warn when a message waits longer than this for acknowledgement [5]
+    idle : float
+      seconds between polls for acknowledgements when no message is
+      waiting to be sent [0.1]
+
+    example
+    =======
+    >>> fut = batched.send(['bmm', {'close': 'all'}])
+    >>> batched.flush()        # at a plan boundary
+    >>> batched.histogram()
+
+    '''
+    BINS = (0, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, numpy.inf)
+
+    def __init__(self, producer, linger=0.05, maxbatch=64, lagging=5, idle=0.1, history=2000):
+        self.producer  = producer
+        self.linger    = linger
+        self.maxbatch  = maxbatch
+        self.lagging   = lagging
+        self.idle      = idle
+        self.confluent = self.underlying(producer)
+        self.latencies = deque(maxlen=history)
+        self.sent      = 0
+        self.failed    = 0
+        self.batches   = 0
+        self.pending   = {}     # id(future) : time of send()
+        self.queue     = queue.Queue()
+        self.lock      = threading.Lock()
+        self.worker    = threading.Thread(target=self.run, name='BMM kafka producer', daemon=True)
+        self.worker.start()
+
+    @staticmethod
+    def underlying(producer):
+        '''Return the confluent_kafka producer inside a BasicProducer, so
+        that messages can be produced without waiting on each one.
+        This relies on private attributes of BasicProducer, so they are
+        checked once, here.  Return None, and fall back to
+        producer.produce(), if any of them is missing.'''
+        confluent = getattr(producer, '_producer', None)
+        if (confluent is None or not all(hasattr(producer, a) for a in ('_topic', '_key', '_serializer'))
+            or not all(callable(getattr(confluent, m, None)) for m in ('produce', 'poll', 'flush'))):
+            print(warning_msg('BatchedProducer: cannot reach the underlying kafka producer, using BasicProducer.produce()'))
+            return None
+        return confluent
+
+    def send(self, document):
+        '''Queue a document for delivery and return a Future.'''
+        future = Future()
+        now = time.monotonic()
+        with self.lock:
+            self.pending[id(future)] = now
+        self.queue.put((document, future, now))
+        return future
+
+    def run(self):
+        while True:
+            ## poll on every pass, so delivery callbacks fire on acknowledgement, even between scans
+            if self.confluent is not None:
+                self.confluent.poll(0)
+            try:
+                batch = [self.queue.get(timeout=self.idle)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.maxbatch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.send_batch(batch)
+            for i in range(len(batch)):
+                self.queue.task_done()
+
+    def send_batch(self, batch):
+        self.batches += 1
+        confluent = self.confluent
+        for document, future, start in batch:
+            if document is None:  # a flush request, start is a threading.Event
+                if confluent is not None:
+                    confluent.flush()
+                start.set()
+                continue
+            try:
+                if confluent is None:
+                    self.producer.produce(document)
+                    self.delivered(future, start, None)
+                else:
+                    confluent.produce(topic=self.producer._topic, key=self.producer._key,
+                                      value=self.producer._serializer(document),
+                                      on_delivery=lambda err, msg, f=future, t=start: self.delivered(f, t, err))
+                    confluent.poll(0)
+            except Exception as E:
+                self.delivered(future, start, E)
+        if confluent is not None:
+            confluent.poll(0)
+
+    def delivered(self, future, start, err):
+        latency = time.monotonic() - start
+        with self.lock:
+            self.pending.pop(id(future), None)
+            if err is None:
+                self.sent += 1
+                self.latencies.append(latency)
+            else:
+                self.failed += 1
+        if err is None:
+            future.set_result(latency)
+        else:
+            if self.failed == 1:  # nobody may be watching the Futures, so say so once
+                print(warning_msg(f'kafka message not delivered: {err}'))
+            future.set_exception(err if isinstance(err, Exception) else RuntimeError(str(err)))
+
+    def flush(self, timeout=30):
+        '''Wait until every queued message has been handed to the
+        producer and acknowledged by the broker.  Call this at a plan
+        boundary.  Return True if everything was delivered within
+        timeout seconds.'''
+        end = time.monotonic() + timeout
+        done = threading.Event()
+        self.queue.put((None, None, done))
+        done.wait(timeout)
+        confluent = self.confluent
+        while len(self.pending) > 0 and time.monotonic() < end:
+            if confluent is not None:
+                confluent.poll(0.05)
+            else:
+                time.sleep(0.05)
+        if len(self.pending) > 0:
+            print(warning_msg(f'{len(self.pending)} kafka message(s) not acknowledged after {timeout} seconds'))
+            return False
+        return True
+
+    def lag(self):
+        '''Return the number of unacknowledged messages and the age in
+        seconds of the oldest one.  Warn if the oldest has been waiting
+        longer than self.lagging.'''
+        with self.lock:
+            ages = list(self.pending.values())
+        if len(ages) == 0:
+            return 0, 0
+        oldest = time.monotonic() - min(ages)
+        if oldest > self.lagging:
+            print(warning_msg(f'kafka is lagging: {len(ages)} message(s) waiting, oldest for {oldest:.1f} seconds'))
+        return len(ages), oldest
+
+    def histogram(self):
+        '''Print a histogram of recent delivery latencies.'''
+        with self.lock:
+            latencies = numpy.array(self.latencies)
+        counts, edges = numpy.histogram(latencies, bins=self.BINS)
+        print(bold_msg(f'kafka delivery latency, last {len(latencies)} messages ({self.sent} sent, {self.failed} failed, {self.batches} batches)'))
+        for c, lo, hi in zip(counts, edges[:-1], edges[1:]):
+            print(f'   {1000*lo:7.0f} - {1000*hi:<7.0f} ms : {"#" * int(numpy.ceil(40*c/max(counts.max(), 1)))} {c}')
+        if len(latencies) > 0:
+            print(f'   median = {1000*numpy.median(latencies):.1f} ms,  95% = {1000*numpy.percentile(latencies, 95):.1f} ms')
+        self.lag()
+
+
+batched = BatchedProducer(producer)
+
+
+def tiled_catchup(timeout=10):
+    '''Wait up to timeout seconds for every document emitted so far
+    to be posted to Tiled or spooled.  Return True if the Tiled writer
+    has caught up.
+
+    Documents are posted to Tiled from a background thread (see
+    BMM.tiled_writer).  Call this at the end of a run, before sending
+    a message which makes a worker read that run from Tiled, e.g. an
+    XDI file or a dossier.  tiled_writer.depth() tells how many
+    documents are still waiting without blocking.
+
+    '''
+    tiled_writer = user_ns.get('tiled_writer')
+    if tiled_writer is None or tiled_writer.wait(timeout=timeout):
+        return True
+    print(warning_msg(f'Tiled writer is behind by {tiled_writer.depth()} documents, a worker may not yet find the latest run'))
+    return False
+
+
 def kafka_message(message):
     '''Broadcast a message to kafka on the private BMM channel.
 
     For all BMM workers, the message is a dict.  See worker
     documentation for details.
 
+    The message is queued for delivery by a background thread and
+    this returns immediately with a Future which resolves to the
+    delivery latency.  Use kafka_flush() to wait for delivery.
+
+    '''
+    return batched.send(['bmm', message])
+
+
+def kafka_flush(timeout=30):
+    '''Wait for all queued kafka messages to be delivered.'''
+    return batched.flush(timeout)
+
+
+def kafka_request(message, timeout=5):
+    '''Send a message to a worker and wait for its answer.
+
+    A unique redis key is added to the message as its "reply" field.
+    The worker pushes its json-encoded answer onto a redis list of
+    that name, which is collected here with a blocking pop.  Return
+    the decoded answer or None if no answer arrived within timeout
+    seconds.
+
     '''
-    producer.produce(['bmm', message])
+    rkvs = user_ns['rkvs']
+    reply = f'BMM:reply:{uuid.uuid4()}'
+    message['reply'] = reply
+    kafka_message(message)
+    answer = rkvs.blpop(reply, timeout=timeout)
+    rkvs.delete(reply)
+    if answer is None:
+        return None
+    return json.loads(answer[1])
 
 
 # Maintenance of kafka output
@@ -16,10 +16,11 @@
 ##                           Ovid, Metamorphosis
 ##                           Book II:531-565
 
-import numpy, os
+import numpy
 from larch import (Group, Parameter, isParameter, param_value, isNamedClass, Interpreter) 
 from larch.xafs import (find_e0, pre_edge, autobk, xftf, xftr)
 from larch.io import create_athena
+from larch.io.athena_project import make_athena_args
 import larch.utils.show as lus
 import matplotlib
 import matplotlib.pyplot as plt
@@ -29,6 +30,8 @@ import matplotlib.gridspec as gridspec
 #from BMM.periodictable import edge_energy, element_symbol
 from larch.xray import atomic_symbol, xray_edge
 
+from BMM_common.flygrid import is_flyenergy, rebin_energy
+
 #from BMM import user_ns as user_ns_module
 #user_ns = vars(user_ns_module)
 
@@ -44,6 +47,39 @@ def ktoe(k):
     '''convert wavenumber to relative energy'''
     return k*k*KTOE
 
+## table of absorption edge energies used by Pandrosus.find_edge,
+## built on first use, sorted by energy.  The edge labels and their
+## order are those of Demeter's find_edge, ties go to the earlier
+## entry in (edge, Z) order.
+EDGE_SEARCH = ('K', 'l3', 'L2', 'L1')
+EDGE_TABLE  = None
+def edge_table():
+    '''Return the (energies, Z numbers, edge indices) arrays of the edge
+    lookup table, computing them only once.'''
+    global EDGE_TABLE
+    if EDGE_TABLE is None:
+        zz, ee, nn = [], [], []
+        for n, ed in enumerate(EDGE_SEARCH):
+            for z in range(14, 98):  # larch.xray stops at Cf
+                zz.append(z)
+                nn.append(n)
+                ee.append(xray_edge(z, ed).energy)
+        energies = numpy.array(ee, dtype=float)
+        order = numpy.argsort(energies, kind='stable')
+        EDGE_TABLE = (energies[order], numpy.array(zz)[order], numpy.array(nn)[order])
+    return EDGE_TABLE
+
+def nearest_edge(energy):
+    '''Return the (Z, edge) pair with edge energy closest to energy.'''
+    energies, zz, nn = edge_table()
+    i = numpy.searchsorted(energies, energy)
+    best = min(abs(energies[j] - energy) for j in (i-1, i) if 0 <= j < len(energies))
+    ## among equally close entries, prefer the earliest in (edge, Z) order
+    lo = numpy.searchsorted(energies, energy - best - 1e-6, side='left')
+    hi = numpy.searchsorted(energies, energy + best + 1e-6, side='right')
+    j = min(range(lo, hi), key=lambda j: (round(abs(energies[j] - energy), 6), nn[j], zz[j]))
+    return int(zz[j]), EDGE_SEARCH[nn[j]]
+
 
 class Pandrosus():
     '''A thin wrapper around basic XAS data processing for individual
@@ -84,6 +120,8 @@ class Pandrosus():
     ------
     fetch:      
         Get data set and prepare for analysis with Larch
+    export_project:
+        write the Larch group to an Athena project file
     make_xmu:
         method that actually constructs mu(E) from the data source
     put:
@@ -128,6 +166,9 @@ class Pandrosus():
         self.bkg     = {'rbkg':1, 'e0':None, 'kmin':0, 'kmax':None, 'kweight':2,}
         self.fft     = {'window':'Hanning', 'kmin':3, 'kmax':12, 'dk':2,}
         self.bft     = {'window':'Hanning', 'rmin':1, 'rmax':3, 'dr':0.1,}
+        ## when pre['e0'] is None and this is set, e0 is found within e0_window eV of it
+        self.e0_guess  = None
+        self.e0_window = 30
         ## plotting parameters
         self.xe      = 'energy (eV)'
         self.xk      = 'wavenumber ($\AA^{-1}$)'
@@ -170,7 +211,11 @@ class Pandrosus():
             header = self.db[uid].metadata
             start = header['start']
             table  = self.db[uid].primary.read()
-            
+            if is_flyenergy(start):
+                ## put the time bins of a continuous-energy scan on the energy grid, as in the XDI file
+                table = rebin_energy(start, table, [c for c in table.data_vars
+                                                    if table[c].ndim == 1 and numpy.issubdtype(table[c].dtype, numpy.number)])
+
         self.group.energy = numpy.array(table['dcm_energy'])
         self.group.i0 = numpy.array(table['I0'])
         if mode == 'flourescence': mode = 'fluorescence'
@@ -245,7 +290,7 @@ class Pandrosus():
         self.group.reference = numpy.array(numpy.log(table['It']/table['Ir']))
 
             
-    def fetch(self, uid, name=None, mode='transmission', working_folder=None):
+    def fetch(self, uid, name=None, mode='transmission'):
         self.uid = uid
         self.mode = mode
         if name is not None:
@@ -259,17 +304,25 @@ class Pandrosus():
         self.make_xmu(uid, mode=mode)
         self.make_ref(uid)
         self.prep()
-        if working_folder is None:
-            location = os.path.join(self.folder, 'prj', 'toss.prj')
-        else:
-            location = os.path.join(self.workspace, 'prj', 'toss.prj')
-        toss = create_athena(location)
-        toss.add_group(self.group)
-        toss.save()
-        os.remove(location)
-        toss = None
+        ## fill in the Athena arguments in memory, as adding the group to an
+        ## Athena project would, without writing a project file to disk
+        self.group.args = make_athena_args(self.group)
         self.group.args['label'] = self.db[uid].metadata['start']['XDI']['_filename']
 
+    def export_project(self, filename):
+        '''Write this group to an Athena project file.
+
+        Parameters
+        ----------
+        filename : str
+            fully resolved path to the output project file
+
+        '''
+        project = create_athena(filename)
+        project.add_group(self.group)
+        project.save()
+        return filename
+
             
     def put(self, energy, mu, name):
         self.name = name
@@ -279,19 +332,12 @@ class Pandrosus():
         self.prep()
 
     def find_edge(self):
-        '''This re-implements the Demeter::Data::find_edge method
+        '''This re-implements the Demeter::Data::find_edge method using a
+        precomputed table of edge energies.  A small table of
+        overrides is then applied for common oxide and overlapping
+        edges.
         '''
-        diff = 100000
-        for ed in ('K', 'l3', 'L2', 'L1'):
-            for z in range(14, 98):  # larch.xray stops at Cf
-                en = xray_edge(z, ed).energy
-                this = abs(en - self.group.e0)
-                if this > diff and en > self.group.e0:
-                    break
-                if this < diff:
-                    diff = this
-                    answer = z
-                    edge = ed
+        answer, edge = nearest_edge(self.group.e0)
         elem = atomic_symbol(answer)
         if (elem, edge) == ('Nd', 'L1'):    # Fe oxide
             (elem, edge) = ('Fe', 'K')
@@ -345,7 +391,13 @@ class Pandrosus():
         ## pre1=pre2=None or norm1=norm2=None.  The following
         ## approximates Larch's defaults
         if self.pre['e0'] is None:
-            find_e0(self.group.energy, mu=self.group.mu, group=self.group, _larch=LARCH)
+            near = None
+            if self.e0_guess is not None:
+                near = numpy.abs(self.group.energy - self.e0_guess) < self.e0_window
+            if near is not None and near.sum() > 4:
+                self.group.e0 = find_e0(self.group.energy[near], mu=self.group.mu[near], _larch=LARCH)
+            else:
+                find_e0(self.group.energy, mu=self.group.mu, group=self.group, _larch=LARCH)
             ezero = self.group.e0
         else:
             ezero = self.pre['e0']
@@ -848,6 +900,10 @@ class Kekropidai():
     merge :
         merge the contents of the Kekropidai object and return a
         Pandrosus object containing the merge
+    reset_merge :
+        discard the running sum used by merge
+    export_project :
+        write all the groups to a single Athena project file
     plot_xmu : 
         (alias = pe) overplot all the groups in energy
     plot_i0 :
@@ -867,6 +923,17 @@ class Kekropidai():
     >>> bunch.add(data_set2)
     >>> bunch.add(data_set3)
     >>> bunch.plot_xmu()
+
+    Merging is incremental.  A running sum of mu(E) is kept on the
+    energy grid of the first group.  Each call to merge only
+    interpolates and adds the groups added since the previous call,
+    then processes the merge using the edge of the previous merge and
+    its e0 as the starting guess for e0.  The normalization ranges are
+    recomputed around the refined e0.  This keeps the cost of each
+    merge constant over a long sequence of scans.  The running sum is
+    started over whenever the groups already summed are no longer the
+    first groups in the list, e.g. when groups are removed, replaced,
+    or reordered.
     '''
     def __init__(self, name=None):
         self.groups = list()
@@ -874,6 +941,10 @@ class Kekropidai():
         self.rmax   = 6
         self.folder = None
         self.db     = None
+        ## running sum for incremental merging
+        self.mergesum = None
+        self.mergedids = []
+        self.merged   = None
 
     def put(self, uidlist):
         for u in uidlist:
@@ -882,20 +953,51 @@ class Kekropidai():
             this.fetch(u)
             self.add(this)
 
+    def reset_merge(self):
+        self.mergesum = None
+        self.mergedids = []
+        self.merged   = None
+
     def merge(self):
+        nmerged = len(self.mergedids)
+        if [id(g) for g in self.groups[:nmerged]] != self.mergedids:  # groups were removed, replaced, or reordered
+            self.reset_merge()
+            nmerged = 0
         base = self.groups[0]
         ee = base.group.energy
-        mm = base.group.mu
-        for spectrum in self.groups[1:]:
-            mu = numpy.interp(ee, spectrum.group.energy, spectrum.group.mu)
-            mm = mm + mu
-        mm = mm / len(self.groups)
+        if self.mergesum is None:
+            self.mergesum = numpy.array(base.group.mu, dtype=float)
+            nmerged = 1
+        for spectrum in self.groups[nmerged:]:
+            self.mergesum += numpy.interp(ee, spectrum.group.energy, spectrum.group.mu)
+        self.mergedids = [id(g) for g in self.groups]
+        mm = self.mergesum / len(self.mergedids)
         merge = Pandrosus()
         merge.folder, merge.db = self.folder, self.db
+        if self.merged is not None:
+            ## skip edge finding and refine e0 from the previous merge
+            merge.element, merge.edge = self.merged.element, self.merged.edge
+            merge.e0_guess = self.merged.group.e0
         merge.put(ee, mm, 'merge')
+        self.merged = merge
         return(merge)
         
             
+    def export_project(self, filename):
+        '''Write all the groups to a single Athena project file.
+
+        Parameters
+        ----------
+        filename : str
+            fully resolved path to the output project file
+
+        '''
+        project = create_athena(filename)
+        for g in self.groups:
+            project.add_group(g.group)
+        project.save()
+        return filename
+
     def add(self, groups):
         if 'Pandrosus' in str(type(groups)):
             # this is a single group
@@ -23,15 +23,16 @@ from bluesky.preprocessors import subs_decorator, finalize_wrapper
 from BMM import user_ns as user_ns_module
 user_ns = vars(user_ns_module)
 
+from BMM.alignment     import adaptive_scan, peak_position
 from BMM.resting_state import resting_state_plan
 from BMM.suspenders    import BMM_clear_to_start, BMM_clear_suspenders
-from BMM.kafka         import kafka_message
+from BMM.kafka         import kafka_message, tiled_catchup
 from BMM.logging       import BMM_log_info, BMM_msg_hook
 from BMM.functions     import countdown, clean_img, PROMPT, PROMPTNC, animated_prompt, now
 from BMM.functions     import error_msg, warning_msg, go_msg, url_msg, bold_msg, verbosebold_msg, list_msg, disconnected_msg, info_msg, whisper
 from BMM.workspace     import rkvs
 
-from BMM.user_ns.base        import WORKSPACE
+from BMM.user_ns.base        import WORKSPACE, recent
 from BMM.user_ns.bmm         import BMMuser
 from BMM.user_ns.dcm         import *
 from BMM.user_ns.detectors   import quadem1, ic0, ic1, ic2, xs, xs1, xs4, xs7, pilatus, ION_CHAMBERS
@@ -179,7 +180,7 @@ def peak(signal):
     center of rocking curve and slit height scans.'''
     return pandas.Series.idxmax(signal)
 
-def slit_height(start=-1.5, stop=1.5, nsteps=31, move=False, force=False, slp=1.0, choice='peak'):
+def slit_height(start=-1.5, stop=1.5, nsteps=31, move=False, force=False, slp=1.0, choice='peak', adaptive=True):
     '''Perform a relative scan of the DM3 BCT motor around the current
     position to find the optimal position for slits3. Optionally, the
     motor will moved to the center of mass of the peak at the end of
@@ -199,6 +200,12 @@ def slit_height(start=-1.5, stop=1.5, nsteps=31, move=False, force=False, slp=1.
         length of sleep before trying to move dm3_bct [3.0]
     choice : str 
         'peak' or 'com' (center of mass) ['peak']
+    adaptive : bool
+        True=coarse pass, then fine pass about the peak, False=nsteps evenly spaced [True]
+
+    With adaptive=True, the coarse pass has a fifth as many points as
+    nsteps (but at least 11) and the fine pass puts 11 points between
+    the neighbors of the largest coarse point.
     '''
 
     def main_plan(start, stop, nsteps, move, slp, force):
@@ -228,25 +235,22 @@ def slit_height(start=-1.5, stop=1.5, nsteps=31, move=False, force=False, slp=1.
                 user_ns['ks'].cycle('dm3')
             
 
-            kafka_message({'linescan': 'start',
-                           'motor' : motor.name,
-                           'detector' : 'I0',})
-            uid = yield from rel_scan([*ION_CHAMBERS], motor, start, stop, nsteps, md={'plan_name' : f'rel_scan linescan {motor.name} I0'})
-            kafka_message({'linescan': 'stop',})
+            coarse, fine = (max(nsteps//5 + 1, 11), 11) if adaptive else (nsteps, 0)
+            found = yield from adaptive_scan([*ION_CHAMBERS], motor, start, stop, coarse, fine, lambda t: t['I0'],
+                                             kafka={'motor' : motor.name, 'detector' : 'I0',},
+                                             md={'plan_name' : f'rel_scan linescan {motor.name} I0'})
             
             user_ns['RE'].msg_hook = BMM_msg_hook
-            BMM_log_info('slit height scan: %s\tuid = %s, scan_id = %d' %
-                         (line1, uid, user_ns['db'][-1].start['scan_id']))
+            BMM_log_info('slit height scan: %s\tuid = %s, scan_id = %s' %
+                         (line1, ', '.join(found.uids), ', '.join(str(i) for i in found.scan_ids)))
             if motor.amfe.get() or motor.amfae.get():
                 user_ns['ks'].cycle('dm3')
             if move:
-                t  = user_ns['db'][-1].table()
-                signal = t['I0']
+                t   = found.table()
                 #if get_mode() in ('A', 'B', 'C'):
-                #    position = com(signal)
+                #    top = peak_position(t[motor.name], t['I0'], 'com')
                 #else:
-                position = peak(signal)
-                top = t[motor.name][position]
+                top = peak_position(t[motor.name], t['I0'], 'peak')
                 
                 yield from sleep(slp)
                 yield from mv(motor.kill_cmd, 1)
@@ -293,7 +297,7 @@ def slit_height(start=-1.5, stop=1.5, nsteps=31, move=False, force=False, slp=1.
     user_ns['RE'].msg_hook = BMM_msg_hook
 
 
-def rocking_curve(start=-0.10, stop=0.10, nsteps=101, detector='I0', choice='peak', height=3):
+def rocking_curve(start=-0.10, stop=0.10, nsteps=101, detector='I0', choice='peak', height=3, adaptive=True):
     '''Perform a relative scan of the DCM 2nd crystal pitch around the current
     position to find the peak of the crystal rocking curve.  Begin by opening
     the hutch slits to 3 mm. At the end, move to the position of maximum 
@@ -313,6 +317,15 @@ def rocking_curve(start=-0.10, stop=0.10, nsteps=101, detector='I0', choice='pea
         'peak', fit' or 'com' (center of mass) ['peak']
     height : float
         slit3 height during rocking curve scan [3]
+    adaptive : bool
+        True=coarse pass, then fine pass about the peak, False=nsteps evenly spaced [True]
+
+    With adaptive=True, the coarse pass has a fifth as many points as
+    nsteps (but at least 11) and the fine pass puts 15 points between
+    the neighbors of the largest coarse point.  For the default
+    parameters, that is 36 points rather than 101, with a finer step
+    about the peak.  The position is found from the readings of both
+    passes, which are kept in memory.
 
     If choice is fit, the fit is performed using the
     SkewedGaussianModel from lmfit, which works pretty well for this
@@ -354,19 +367,17 @@ def rocking_curve(start=-0.10, stop=0.10, nsteps=101, detector='I0', choice='pea
             #    yield from mv(slitsg.vsize, 5)
                 
             dets = ION_CHAMBERS.copy()
-            kafka_message({'linescan': 'start',
-                           'motor' : motor.name,
-                           'detector' : 'I0',})
-            uid = yield from rel_scan(dets, motor, start, stop, nsteps, md={'plan_name' : f'rel_scan linescan {motor.name} I0'})
-            kafka_message({'linescan': 'stop',})
+            coarse, fine = (max(nsteps//5 + 1, 11), 15) if adaptive else (nsteps, 0)
+            found = yield from adaptive_scan(dets, motor, start, stop, coarse, fine, lambda t: t[sgnl],
+                                             kafka={'motor' : motor.name, 'detector' : 'I0',},
+                                             md={'plan_name' : f'rel_scan linescan {motor.name} I0'})
 
-            t  = user_ns['db'][-1].table()
+            t  = found.table()
             signal = t[sgnl]
-            if choice.lower() == 'com':
-                position = com(signal)
-                top      = t[motor.name][position]
-            elif choice.lower() == 'fit':
-                pitch    = t['dcm_pitch']
+            if choice.lower() == 'fit':
+                order    = numpy.argsort(t['dcm_pitch'])
+                pitch    = t['dcm_pitch'][order]
+                signal   = signal[order]
                 mod      = SkewedGaussianModel()
                 pars     = mod.guess(signal, x=pitch)
                 out      = mod.fit(signal, pars, x=pitch)
@@ -374,15 +385,14 @@ def rocking_curve(start=-0.10, stop=0.10, nsteps=101, detector='I0', choice='pea
                 out.plot()
                 top      = out.params['center'].value
             else:
-                position = peak(signal)
-                top      = t[motor.name][position]
+                top      = peak_position(t[motor.name], signal, choice)
 
             yield from mv(motor.kill_cmd, 1)
             yield from sleep(1.0)
             user_ns['RE'].msg_hook = BMM_msg_hook
 
-            BMM_log_info('rocking curve scan: %s\tuid = %s, scan_id = %d' %
-                         (line1, uid, user_ns['db'][-1].start['scan_id']))
+            BMM_log_info('rocking curve scan: %s\tuid = %s, scan_id = %s' %
+                         (line1, ', '.join(found.uids), ', '.join(str(i) for i in found.scan_ids)))
             yield from mv(motor, top)
             #if sgnl == 'Bicron':
             #    yield from mv(slitsg.vsize, gonio_slit_height)
@@ -454,7 +464,16 @@ def find_reference():
 
     
 def rectangle_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It',
-                   negate=False, filename=None, move=True, force=False, chore='', md={}):
+                   negate=False, filename=None, move=True, force=False, chore='', md={}, adaptive=True):
+    '''Perform a relative scan across a feature, like a slot in the
+    sample wheel, with a step-like signal on both sides, then fit an
+    error function rectangle to find its midpoint.
+
+    With adaptive=True, a coarse pass with a third as many points as
+    nsteps (but at least 11) is followed by a fine pass with 9 points
+    about each edge.  With adaptive=False, nsteps evenly spaced points
+    are measured.
+    '''
 
     def main_plan(motor, start, stop, nsteps, detector, negate, filename, move, force, chore, md):
         if force is False:
@@ -471,10 +490,11 @@ def rectangle_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It',
 
         sgnl = 'fluorescence (Xspress3)'
 
+        coarse, fine = (max(nsteps//3 + 1, 11), 9) if adaptive else (nsteps, 0)
         if detector.lower() == 'if':
             dets.append(user_ns['xs'])
             sgnl = 'fluorescence (Xspress3)'
-            yield from mv(xs.total_points, nsteps)
+            yield from mv(xs.total_points, coarse + 2*fine)
         elif detector.lower() == 'it':
             sgnl = 'transmission'
         elif detector.lower() == 'ir':
@@ -482,6 +502,13 @@ def rectangle_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It',
 
         titl = f'{sgnl} vs. {motor.name}'
 
+        def rectangle_signal(t):
+            if detector.lower() == 'if':
+                return numpy.array((t[BMMuser.xs1]+t[BMMuser.xs2]+t[BMMuser.xs3]+t[BMMuser.xs4])/t['I0'])
+            elif detector.lower() == 'ir':
+                return numpy.array(t['Ir']/t['It'])
+            return numpy.array(t['It']/t['I0'])
+
         rkvs.set('BMM:scan:type',      'line')
         rkvs.set('BMM:scan:starttime', str(datetime.datetime.timestamp(datetime.datetime.now())))
         rkvs.set('BMM:scan:estimated', 0)
@@ -500,24 +527,18 @@ def rectangle_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It',
                 md['BMM_kafka']['hint'] = hint
 
                 
-            kafka_message({'linescan': 'start',
-                           'motor' : motor.name,
-                           'detector' : detector.capitalize(),})
-            uid = yield from rel_scan(dets, motor, start, stop, nsteps, md={**md, 'plan_name' : f'rel_scan linescan {motor.name} I0'})
-            kafka_message({'linescan': 'stop',})
-            
-            t  = user_ns['db'][-1].table()
-            if detector.lower() == 'if':
-                signal   = numpy.array((t[BMMuser.xs1]+t[BMMuser.xs2]+t[BMMuser.xs3]+t[BMMuser.xs4])/t['I0'])
-            elif detector.lower() == 'it':
-                signal   = numpy.array(t['It']/t['I0'])
-            elif detector.lower() == 'ir':
-                signal   = numpy.array(t['Ir']/t['It'])
-
-            signal = signal - signal[0]
+            found = yield from adaptive_scan(dets, motor, start, stop, coarse, fine, rectangle_signal, shape='edges',
+                                             kafka={'motor' : motor.name, 'detector' : detector.capitalize(),},
+                                             md={**md, 'plan_name' : f'rel_scan linescan {motor.name} I0'})
+            uid = found.uids[-1]
+
+            t        = found.table()
+            order    = numpy.argsort(t[motor.name])
+            signal   = rectangle_signal(t)[order]
+            signal   = signal - signal[0]
             if negate is True:
                 signal = -1 * signal
-            pos      = numpy.array(t[motor.name])
+            pos      = numpy.array(t[motor.name])[order]
             mod      = RectangleModel(form='erf')
             pars     = mod.guess(signal, x=pos)
             out      = mod.fit(signal, pars, x=pos)
@@ -551,8 +572,13 @@ def rectangle_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It',
     user_ns['RE'].msg_hook = BMM_msg_hook
 
 
-def peak_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It', find='max', how='peak', filename=None):
+def peak_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It', find='max', how='peak', filename=None, adaptive=True):
     ''' Deprecated. needs to be updated for the kafka/data seucrity agent_change_edge
+
+    how is 'peak', 'com' (center of mass), or 'fit' (skewed Gaussian).
+    With adaptive=True, a coarse pass with a fifth as many points as
+    nsteps (but at least 11) is followed by a fine pass of 11 points
+    about the peak.
     '''
     def main_plan(motor, start, stop, nsteps, detector, find, how, filename):
         (ok, text) = BMM_clear_to_start()
@@ -568,10 +594,11 @@ def peak_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It', find='ma
 
         sgnl = 'fluorescence (Xspress3)'
 
+        coarse, fine = (max(nsteps//5 + 1, 11), 11) if adaptive else (nsteps, 0)
         if detector.lower() == 'if':
             dets.append(user_ns['xs'])
             sgnl = 'fluorescence (Xspress3)'
-            yield from mv(xs.total_points, nsteps)
+            yield from mv(xs.total_points, coarse + fine)
         elif detector.lower() == 'it':
             dets.append(user_ns['ic1'])
             sgnl = 'transmission'
@@ -582,6 +609,17 @@ def peak_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It', find='ma
 
         titl = f'{sgnl} vs. {motor.name}'
 
+        def peak_signal(t):
+            if detector.lower() == 'if':
+                signal = numpy.array((t[BMMuser.xs1]+t[BMMuser.xs2]+t[BMMuser.xs3]+t[BMMuser.xs4])/t['I0'])
+            elif detector.lower() == 'ir':
+                signal = numpy.array(t['Ir']/t['It'])
+            else:
+                signal = numpy.array(t['It']/t['I0'])
+            if find == 'min':
+                signal = -1 * signal
+            return signal
+
         rkvs.set('BMM:scan:type',      'line')
         rkvs.set('BMM:scan:starttime', str(datetime.datetime.timestamp(datetime.datetime.now())))
         rkvs.set('BMM:scan:estimated', 0)
@@ -590,52 +628,37 @@ def peak_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It', find='ma
             line1 = '%s, %s, %.3f, %.3f, %d -- starting at %.3f\n' % \
                     (motor.name, sgnl, start, stop, nsteps, motor.user_readback.get())
 
-            kafka_message({'linescan': 'start',
-                           'motor' : motor.name,
-                           'detector' : detector. capitalize(),})
-            uid = yield from rel_scan(dets, motor, start, stop, nsteps, md={'plan_name' : f'rel_scan linescan {motor.name} I0'})
-            kafka_message({'linescan': 'stop',})
+            found = yield from adaptive_scan(dets, motor, start, stop, coarse, fine, peak_signal,
+                                             kafka={'motor' : motor.name, 'detector' : detector.capitalize(),},
+                                             md={'plan_name' : f'rel_scan linescan {motor.name} I0'})
 
-            t  = user_ns['db'][-1].table()
-            if detector.lower() == 'if':
-                signal   = numpy.array((t[BMMuser.xs1]+t[BMMuser.xs2]+t[BMMuser.xs3]+t[BMMuser.xs4])/t['I0'])
-            elif detector.lower() == 'it':
-                signal   = numpy.array(t['It']/t['I0'])
-            elif detector.lower() == 'ir':
-                signal   = numpy.array(t['Ir']/t['It'])
+            t        = found.table()
+            order    = numpy.argsort(t[motor.name])
+            pos      = numpy.array(t[motor.name])[order]
+            signal   = peak_signal(t)[order]
+            signal   = signal - signal[0]
 
-            signal = signal - signal[0]
-            if find == 'min':
-                signal = -1 * signal
-            pos      = numpy.array(t[motor.name])
-
-            if choice.lower() == 'com':
-                position = com(signal)
-                top      = t[motor.name][position]
-            elif choice.lower() == 'fit':
-                pitch    = t[motor_name]
+            if how.lower() == 'fit':
                 mod      = SkewedGaussianModel()
-                pars     = mod.guess(signal, x=pitch)
-                out      = mod.fit(signal, pars, x=pitch)
+                pars     = mod.guess(signal, x=pos)
+                out      = mod.fit(signal, pars, x=pos)
                 print(whisper(out.fit_report(min_correl=0)))
-                out.plot()
                 top      = out.params['center'].value
+
+                thisagg = matplotlib.get_backend()
+                matplotlib.use('Agg') # produce a plot without screen display
+                out.plot()
+                if filename is None:
+                    filename = os.path.join(user_ns['BMMuser'].folder, 'snapshots', 'toss.png')
+                plt.savefig(filename)
+                matplotlib.use(thisagg) # return to screen display
+                for k in ('amplitude', 'center', 'sigma', 'gamma'):
+                    rkvs.set(f'BMM:lmfit:{k}', out.params[k].value)
             else:
-                position = peak(signal)
-                top      = t[motor.name][position]
-            
-            thisagg = matplotlib.get_backend()
-            matplotlib.use('Agg') # produce a plot without screen display
-            out.plot()
-            if filename is None:
-                filename = os.path.join(user_ns['BMMuser'].folder, 'snapshots', 'toss.png')
-            plt.savefig(filename)
-            matplotlib.use(thisagg) # return to screen display
-            
+                top      = peak_position(pos, signal, how)
+
             yield from mv(motor, top)
             print(bold_msg(f'Found peak at {motor.name} = {motor.position}'))
-            for k in ('center1', 'center2', 'sigma1', 'sigma2', 'amplitude', 'midpoint'):
-                rkvs.set(f'BMM:lmfit:{k}', out.params[k].value)
 
         yield from doscan(filename)
         
@@ -643,7 +666,7 @@ def peak_scan(motor=None, start=-20, stop=20, nsteps=41, detector='It', find='ma
         yield from resting_state_plan()
     
     user_ns['RE'].msg_hook = None
-    yield from finalize_wrapper(main_plan(motor, start, stop, nsteps, detector, find, filename), cleanup_plan())
+    yield from finalize_wrapper(main_plan(motor, start, stop, nsteps, detector, find, how, filename), cleanup_plan())
     user_ns['RE'].msg_hook = BMM_msg_hook
 
 
@@ -857,7 +880,7 @@ def linescan(detector, axis, start, stop, nsteps, dopluck=True, force=False, int
         kafka_message({'linescan': 'stop',})
         
         BMM_log_info('linescan: %s\tuid = %s, scan_id = %d' %
-                     (line1, uid, user_ns['db'][-1].start['scan_id']))
+                     (line1, uid, recent[uid].start['scan_id']))
         if dopluck is True:
             #action = input('\n' + bold_msg('Pluck motor position from the plot? ' + PROMPT))
             print()
@@ -912,5 +935,6 @@ def ls2dat(datafile, key):
 
     '''
     #BMMuser, db = user_ns['BMMuser'], user_ns['db']
+    tiled_catchup()
     kafka_message({'lsxdi': True, 'uid': key, 'filename': datafile})
     print(bold_msg('wrote linescan to %s' % datafile))
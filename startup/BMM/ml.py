@@ -22,7 +22,6 @@ from BMM.functions       import error_msg, warning_msg, go_msg, url_msg, bold_ms
 from BMM.larch_interface import Pandrosus
 #from BMM.functions import plotting_mode
 from BMM.user_ns.base import WORKSPACE
-from BMM.user_ns.bmm  import BMMuser
 
 # when pickle changes version number, this error message will happen twice:
 # /opt/conda_envs/collection-2021-1.2/lib/python3.7/site-packages/sklearn/base.py:315:
@@ -91,8 +90,21 @@ class BMMDataEvaluation:
         show_plot : bool
             True to show plot
         '''
+        if mode == 'transmission' or mode == 'verygood':
+            columns = ['dcm_energy', 'I0', 'It']
+        else:
+            element = clog[uid].metadata['start']['XDI']['Element']['symbol']
+            if element == 'Ti':
+                columns = ['dcm_energy', 'I0', 'DTC2_1', 'DTC2_2', 'DTC2_3', 'DTC2_4']
+            elif element == 'Ce':
+                columns = ['dcm_energy', 'I0', 'DTC3_1', 'DTC3_2', 'DTC3_3', 'DTC3_4']
+            elif element == 'Fe':
+                columns = ['dcm_energy', 'I0', 'DTC1', 'DTC2', 'DTC3', 'DTC4']
+            else:
+                print(f'cannot figure out fluorescence signal for {uid}')
+                return None
         try:
-            primary = clog[uid].primary.read()
+            primary = clog[uid].primary.read(columns)
         except:
             print(f'could not read primary of {uid}')
             return None
@@ -104,37 +116,8 @@ class BMMDataEvaluation:
             if mode == 'transmission' or mode == 'verygood':
                 signal = numpy.array(primary['It'])
                 mu = numpy.log(abs(i0/signal))
-            # elif mode == 'xs':
-            #     t = user_ns['db'][-1].table()
-            #     el = BMMuser.element
-            #     dtc1 = numpy.array(t[el+'1'])
-            #     dtc2 = numpy.array(t[el+'2'])
-            #     dtc3 = numpy.array(t[el+'3'])
-            #     dtc4 = numpy.array(t[el+'4'])
-            #     signal = dtc1+dtc2+dtc3+dtc4
-            #     mu = signal/i0
             else:
-                # dtc1 = numpy.array(primary[BMMuser.dtc1])
-                # dtc2 = numpy.array(primary[BMMuser.dtc2])
-                # dtc3 = numpy.array(primary[BMMuser.dtc3])
-                # dtc4 = numpy.array(primary[BMMuser.dtc4])
-                
-                if clog[uid].metadata['start']['XDI']['Element']['symbol'] == 'Ti':
-                    dtc1 = numpy.array(primary['DTC2_1'])
-                    dtc2 = numpy.array(primary['DTC2_2'])
-                    dtc3 = numpy.array(primary['DTC2_3'])
-                    dtc4 = numpy.array(primary['DTC2_4'])
-                elif clog[uid].metadata['start']['XDI']['Element']['symbol'] == 'Ce':
-                    dtc1 = numpy.array(primary['DTC3_1'])
-                    dtc2 = numpy.array(primary['DTC3_2'])
-                    dtc3 = numpy.array(primary['DTC3_3'])
-                    dtc4 = numpy.array(primary['DTC3_4'])
-                elif clog[uid].metadata['start']['XDI']['Element']['symbol'] == 'Fe':
-                    dtc1 = numpy.array(primary['DTC1'])
-                    dtc2 = numpy.array(primary['DTC2'])
-                    dtc3 = numpy.array(primary['DTC3'])
-                    dtc4 = numpy.array(primary['DTC4'])
-                signal = dtc1+dtc2+dtc3+dtc4
+                signal = sum(numpy.array(primary[c]) for c in columns[2:])
                 mu = signal/i0
             if show_plot:
                 plt.cla()
@@ -275,6 +258,81 @@ class BMMDataEvaluation:
         '''Thin wrapper around the classifier object's score method.'''
         return(self.clf.score(self.scaler.transform(self.X), self.y))
 
+    def evaluate_columns(self, this, mode):
+        '''Return the list of primary stream columns needed to compute mu(E)
+        for a record in the given mode.  Return None if the
+        fluorescence signal cannot be determined.
+
+        For analog fluorescence data, the ROI names are first read
+        from the vortex configuration columns to choose the set of
+        DTC columns.
+
+        '''
+        if mode == 'xs':
+            return ['dcm_energy', 'I0'] + list(this.metadata['start']['XDI']['_dtc'][:4])
+        elif 'trans' in mode:
+            return ['dcm_energy', 'I0', 'It']
+        elif 'ref' in mode:
+            return ['dcm_energy', 'I0', 'It', 'Ir']
+        ## fluorescence and NOT Xspress3
+        element = this.metadata['start']['XDI']['Element']['symbol']
+        vor = this.primary.read(['vor:vor_names_name3', 'vor:vor_names_name15', 'vor:vor_names_name19'])
+        if element in str(vor['vor:vor_names_name3'][0].values):
+            return ['dcm_energy', 'I0', 'DTC1', 'DTC2', 'DTC3', 'DTC4']
+        elif element in str(vor['vor:vor_names_name15'][0].values):
+            return ['dcm_energy', 'I0', 'DTC2_1', 'DTC2_2', 'DTC2_3', 'DTC2_4']
+        elif element in str(vor['vor:vor_names_name19'][0].values):
+            return ['dcm_energy', 'I0', 'DTC3_1', 'DTC3_2', 'DTC3_3', 'DTC3_4']
+        return None
+
+    def evaluation_mu(self, uid, mode=None):
+        '''Fetch a record with a single projected read of its primary
+        stream and return energy and mu(E) as numpy arrays.  Return
+        None if mu(E) cannot be computed.
+
+        '''
+        this = user_ns['db'].v2[uid]
+        if mode is None:
+            mode = this.metadata['start']['XDI']['_mode'][0]
+        columns = self.evaluate_columns(this, mode)
+        if columns is None:
+            print('cannot figure out fluorescence signal')
+            return None
+        t = this.primary.read(columns)
+        en = numpy.array(t['dcm_energy'])
+        i0 = numpy.array(t['I0'])
+        if 'trans' in mode:
+            mu = numpy.log(abs(i0/numpy.array(t['It'])))
+        elif 'ref' in mode:
+            mu = numpy.log(abs(numpy.array(t['It'])/numpy.array(t['Ir'])))
+        else:
+            signal = sum(numpy.array(t[c]) for c in columns[2:])
+            mu = signal/i0
+        return(en, mu)
+
+    def gridded_mu(self, en, mu):
+        '''Return mu interpolated onto exactly GRIDSIZE equally spaced
+        points, as a numpy array.  This is rationalize_mu, trimmed to
+        the length of the training data.
+        '''
+        e, m = self.rationalize_mu(en, mu)
+        return numpy.asarray(m[:self.GRIDSIZE])
+
+    def gridded_many(self, spectra):
+        '''Interpolate a list of (energy, mu) pairs, each onto its own grid
+        of GRIDSIZE equally spaced points as in gridded_mu, with a single
+        call to numpy.interp.  The records, which may differ in length,
+        are laid end to end on one energy axis, each shifted so that the
+        records do not overlap.  Return a (len(spectra), GRIDSIZE) array.
+        '''
+        first = numpy.array([float(en[0]) for en, mu in spectra])
+        span  = numpy.array([float(en[-1]) - float(en[0]) for en, mu in spectra])
+        offset = numpy.concatenate(([0], numpy.cumsum(span + 1)[:-1]))
+        energy = numpy.concatenate([numpy.asarray(en, dtype=float) - e0 + o for (en, mu), e0, o in zip(spectra, first, offset)])
+        mu     = numpy.concatenate([numpy.asarray(mu, dtype=float) for en, mu in spectra])
+        grid   = offset[:, numpy.newaxis] + span[:, numpy.newaxis] * numpy.arange(self.GRIDSIZE) / self.GRIDSIZE
+        return numpy.interp(grid.ravel(), energy, mu).reshape(len(spectra), self.GRIDSIZE)
+
     def evaluate(self, uid, mode=None):
         '''Perform an evaluation of a measurement.  The data will be
         interpolated onto the same grid used for the training set,
@@ -290,56 +348,50 @@ class BMMDataEvaluation:
             when not None, used to specify fluorescence or transmission (for a data set that has both)
 
         '''
-        if mode == 'xs':
-            this = user_ns['db'].v2[uid]
-            channels = this.metadata['start']['XDI']['_dtc']
-            el = BMMuser.element
-            t = this.primary.read()
-            i0 = t['I0']
-            en = t['dcm_energy']
-            dtc1 = numpy.array(t[channels[0]])
-            dtc2 = numpy.array(t[channels[1]])
-            dtc3 = numpy.array(t[channels[2]])
-            dtc4 = numpy.array(t[channels[3]])
-            signal = dtc1+dtc2+dtc3+dtc4
-            mu = signal/i0
-        else:
-            this = user_ns['db'].v2[uid]
-            if mode is None:
-                mode = this.metadata['start']['XDI']['_mode'][0]
-            element = this.metadata['start']['XDI']['Element']['symbol']
-            i0 = this.primary.read()['I0']
-            en = this.primary.read()['dcm_energy']
-            if 'trans' in mode:
-                it = this.primary.read()['It']
-                mu = numpy.log(abs(i0/it))
-            elif 'ref' in mode:
-                it = this.primary.read()['It']
-                ir = this.primary.read()['Ir']
-                mu = numpy.log(abs(it/ir))
-            else:               # fluorescence and NOT Xspress3
-                if element in str(this.primary.read()['vor:vor_names_name3'][0].values):
-                    signal = this.primary.read()['DTC1'] + this.primary.read()['DTC2'] + this.primary.read()['DTC3'] + this.primary.read()['DTC4']
-                elif element in str(this.primary.read()['vor:vor_names_name15'][0].values):
-                    signal = this.primary.read()['DTC2_1'] + this.primary.read()['DTC2_2'] + this.primary.read()['DTC2_3'] + this.primary.read()['DTC2_4']
-                elif element in str(this.primary.read()['vor:vor_names_name19'][0].values):
-                    signal = this.primary.read()['DTC3_1'] + this.primary.read()['DTC3_2'] + this.primary.read()['DTC3_3'] + this.primary.read()['DTC3_4']
-                else:
-                    print('cannot figure out fluorescence signal')
-                    #print(f'vor:vor_names_name3 {}')
-                    return()
-                mu = signal/i0
-        e,m = self.rationalize_mu(en, mu)
-        if len(e) > self.GRIDSIZE:
-            e, m = e[:-1], m[:-1]
-        m = self.scaler.transform([m,])
-        #if len(m) > self.GRIDSIZE:
-        #    m = m[:-1]
+        ret = self.evaluation_mu(uid, mode)
+        if ret is None:
+            return()
+        m = self.scaler.transform([self.gridded_mu(*ret),])
         result = self.clf.predict(m)[0]
         if result == 1:
             return(result, self.good_emoji)
         else:
             return(result, self.bad_emoji)
+
+    def evaluate_many(self, uids, mode=None):
+        '''Evaluate a list of measurements at once.  Each record is read
+        once, all the interpolated spectra are stacked into a single
+        matrix, and the scaler and the classifier are each applied
+        once to the whole matrix.
+
+        Parameters
+        ----------
+        uids : list of str
+            uids of data to be evaluated
+        mode : bool
+            when not None, used to specify fluorescence or transmission for all records
+
+        Returns a list of (score, emoji) tuples in the same order as
+        uids.  The entry for a record that could not be evaluated is
+        an empty tuple.
+        '''
+        spectra, good = [], []
+        for i, uid in enumerate(uids):
+            ret = self.evaluation_mu(uid, mode)
+            if ret is None:
+                continue
+            spectra.append(ret)
+            good.append(i)
+        answers = [()] * len(uids)
+        if len(spectra) == 0:
+            return answers
+        results = self.clf.predict(self.scaler.transform(self.gridded_many(spectra)))
+        for i, result in zip(good, results):
+            if result == 1:
+                answers[i] = (result, self.good_emoji)
+            else:
+                answers[i] = (result, self.bad_emoji)
+        return answers
     
     def test_failure(self):
         '''Examine and process data that failed the current iteration of the data evaluator. 
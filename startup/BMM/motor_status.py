@@ -32,7 +32,7 @@ def motor_metadata(uid=None):
     md = dict()
     table = None
     try:
-        table = bmm_catalog[uid].baseline.read()
+        table = user_ns['recent'].lookup(uid, user_ns['bmm_catalog']).baseline.read()
     except:
         pass
     for m in biglist:
@@ -6,7 +6,7 @@ except ImportError:
     def is_re_worker_active():
         return False
 
-import numpy, os, re, shutil, openpyxl, uuid
+import numpy, os, re, shutil, uuid
 import textwrap, configparser, datetime
 import matplotlib.pyplot as plt
 
@@ -22,18 +22,20 @@ from BMM.dossier         import DossierTools
 from BMM.functions       import countdown, boxedtext, now, isfloat, inflect, e2l, etok, ktoe, present_options, plotting_mode
 from BMM.functions       import PROMPT, PROMPTNC, proposal_base, animated_prompt
 from BMM.functions       import error_msg, warning_msg, go_msg, url_msg, bold_msg, verbosebold_msg, list_msg, disconnected_msg, info_msg, whisper
-from BMM.kafka           import kafka_message, close_plots
+from BMM.kafka           import kafka_message, close_plots, tiled_catchup
 from BMM.logging         import BMM_log_info, BMM_msg_hook, report
 from BMM.metadata        import bmm_metadata, display_XDI_metadata, metadata_at_this_moment
 from BMM.motor_status    import motor_status
 from BMM.resting_state   import resting_state_plan
 from BMM.suspenders      import BMM_suspenders, BMM_clear_to_start, BMM_clear_suspenders
 from BMM.xafs            import file_exists
+from BMM_common.flygrid  import is_fly, regrid
+from BMM_common.mapfiles import MapExport
 
 from BMM import user_ns as user_ns_module
 user_ns = vars(user_ns_module)
 
-from BMM.user_ns.base      import bmm_catalog
+from BMM.user_ns.base      import bmm_catalog, recent
 from BMM.user_ns.dwelltime import _locked_dwell_time
 
 def read_ini(inifile, **kwargs):
@@ -99,6 +101,18 @@ def read_ini(inifile, **kwargs):
             parameters[a] = bool(kwargs[a])
             found[a] = True
                 
+    ## fly defaults to False, unlike the other booleans
+    found['fly'] = False
+    if 'fly' in kwargs:
+        parameters['fly'] = bool(kwargs['fly'])
+        found['fly'] = True
+    else:
+        try:
+            parameters['fly'] = config.getboolean('scan', 'fly')
+            found['fly'] = True
+        except (configparser.NoOptionError, ValueError):
+            parameters['fly'] = False
+
     parameters['ththth'] = False
 
                     
@@ -182,68 +196,61 @@ def difference_data(uid1, uid2, tag):
     ## bkg: 7afeb391-782a-4240-a676-4373fdbee301
     
     ## get motor names and image shape
-    motors = bmm_catalog[uid1].metadata['start']['motors']
-    [nslow, nfast] = bmm_catalog[uid1].metadata['start']['shape']
+    start1 = recent.lookup(uid1, bmm_catalog).metadata['start']
+    motors = start1['motors']
+    [nslow, nfast] = start1['shape']
 
-    ## slurp in data
-    print('Reading primary data set...')
-    datatable1 = bmm_catalog[uid1].primary.read()
-    print('Reading secondary data set...')
-    datatable2 = bmm_catalog[uid2].primary.read()
+    ## the signal based on what is listed in 'detectors' in the start document
+    if 'xs' in start1['detectors']:
+        det_name = start1['plan_name'].split()[-1]
+        det_name = det_name[:-1]
+        channels = [det_name+'1', det_name+'2', det_name+'3', det_name+'4']
+    elif 'noisy_det' in start1['detectors']:
+        channels = ['noisy_det']
+
+    ## slurp in only the needed columns, once
+    tables = []
+    for uid, which in ((uid1, 'primary'), (uid2, 'secondary')):
+        print(f'Reading {which} data set...')
+        run   = recent.lookup(uid, bmm_catalog)
+        table = run.primary.read(motors + ['I0'] + channels)
+        if is_fly(run.metadata['start']):
+            table = regrid(run.metadata['start'], table, ['I0'] + channels)
+        tables.append(table)
+    datatable1, datatable2 = tables
 
     ## common arrays and I0 arrays
-    slow = numpy.array(datatable1[motors[0]])
-    fast = numpy.array(datatable1[motors[1]])
-    i01  = numpy.array(datatable1['I0'])
-    i02  = numpy.array(datatable2['I0'])
-
-    ## grab the signal based on what is listed in 'detectors' in the start document
-    if 'xs' in bmm_catalog[uid1].metadata['start']['detectors']:
-        det_name = bmm_catalog[uid1].metadata['start']['plan_name'].split()[-1]
-        det_name = det_name[:-1]
-        z1 = numpy.array(datatable1[det_name+'1'])+numpy.array(datatable1[det_name+'2'])+numpy.array(datatable1[det_name+'3'])+numpy.array(datatable1[det_name+'4'])
-        z2 = numpy.array(datatable2[det_name+'1'])+numpy.array(datatable2[det_name+'2'])+numpy.array(datatable2[det_name+'3'])+numpy.array(datatable2[det_name+'4'])
-    elif 'noisy_det' in bmm_catalog[uid1].metadata['start']['detectors']:
-        z1 = numpy.array(datatable1['noisy_det'])
-        z2 = numpy.array(datatable2['noisy_det'])
-
-    ## save map in xlsx format
-    wb = openpyxl.Workbook()
-    ws1 = wb.active
-    ws1.title = tag
-    ws1.append(('slow', 'fast', 'difference', 'normalized_1', 'normalized_2', 'signal_1', 'I0_1', 'signal_2', 'I0_2'))
-    n1 = z1/i01
-    n2 = z2/i02
+    slow = numpy.asarray(datatable1[motors[0]], dtype=float)
+    fast = numpy.asarray(datatable1[motors[1]], dtype=float)
+    i01  = numpy.asarray(datatable1['I0'], dtype=float)
+    i02  = numpy.asarray(datatable2['I0'], dtype=float)
+    z1   = numpy.sum([numpy.asarray(datatable1[c], dtype=float) for c in channels], axis=0)
+    z2   = numpy.sum([numpy.asarray(datatable2[c], dtype=float) for c in channels], axis=0)
+    n1   = z1/i01
+    n2   = z2/i02
     diff = n1 - n2
-    for i in range(len(slow)):
-        ws1.append((slow[i], fast[i], diff[i], n1[i], n2[i], z1[i], i01[i], z2[i], i02[i]))
-    wb.save(filename=os.path.join(user_ns['BMMuser'].folder, 'maps', f'{tag}.xlsx'))
+
+    ## save map in xlsx and matlab formats
+    export = MapExport(tag, ['slow', 'fast'], (nslow, nfast),
+                       {'slow': slow, 'fast': fast, 'difference': diff, 'normalized_1': n1, 'normalized_2': n2,
+                        'signal_1': z1, 'I0_1': i01, 'signal_2': z2, 'I0_2': i02},
+                       signal='difference')
+    export.xlsx(os.path.join(user_ns['BMMuser'].folder, 'maps', f'{tag}.xlsx'))
     print(f'wrote {user_ns["BMMuser"].folder}/maps/{tag}.xlsx')
-    
-    ## save map in matlab format 
-    savemat(os.path.join(user_ns['BMMuser'].folder, 'maps', f'{tag}.mat'), {'label'        : tag,
-                                                                            motors[0]      : list(slow),
-                                                                            motors[1]      : list(fast),
-                                                                            'difference'   : list(diff),
-                                                                            'normalized_1' : list(n1),
-                                                                            'normalized_2' : list(n2),
-                                                                            'I0_1'         : list(i01),
-                                                                            'signal_1'     : list(z1),
-                                                                            'I0_2'         : list(i02),
-                                                                            'signal_2'     : list(z2), })
-    print(f'wrote {user_ns["BMMuser"]}/maps/{tag}.mat')
+    export.mat(os.path.join(user_ns['BMMuser'].folder, 'maps', f'{tag}.mat'), aliases={motors[0]: 'slow', motors[1]: 'fast'})
+    print(f'wrote {user_ns["BMMuser"].folder}/maps/{tag}.mat')
 
     ## make a pretty picture of the difference map
-    zzz=diff.reshape(nfast, nslow)
+    zzz = export.image('difference')
     # grabbing the first nfast elements of x and every
-    # nslow-th element of y is more reliable than 
+    # nfast-th element of y is more reliable than 
     # numpy.unique due to float &/or motor precision issues
 
     plt.title(tag)
-    plt.xlabel(f'fast axis ({motors[0]}) position (mm)')
-    plt.ylabel(f'slow axis ({motors[1]}) position (mm)')
+    plt.xlabel(f'fast axis ({motors[1]}) position (mm)')
+    plt.ylabel(f'slow axis ({motors[0]}) position (mm)')
     plt.gca().invert_yaxis()  # plot an xafs_x/xafs_y plot upright
-    plt.contourf(fast[:nfast], slow[::nslow], zzz, cmap=plt.cm.viridis)
+    plt.contourf(fast[:nfast], slow[::nfast], zzz, cmap=plt.cm.viridis)
     plt.colorbar()
     plt.show()
     plt.savefig(os.path.join(user_ns['BMMuser'].folder, 'maps', f'{tag}.png'))
@@ -344,7 +351,10 @@ def raster(inifile=None, **kwargs):
             xlsxout = f"maps/{p['filename']}-{seqnumber:02d}.xlsx"
             matout  = f"maps/{p['filename']}-{seqnumber:02d}.mat"
             print(f'\nImage data to be written to {pngout}, .xlsx, and .mat')
-            estimate = float(p['fast_steps'])*float(p['slow_steps']) * (float(p['dwelltime'])+0.43)
+            if p['fly']:
+                estimate = float(p['slow_steps']) * (float(p['fast_steps'])*float(p['dwelltime']) + 3)
+            else:
+                estimate = float(p['fast_steps'])*float(p['slow_steps']) * (float(p['dwelltime'])+0.43)
             minutes = int(estimate/60)
             #seconds = int(estimate - minutes*60)
             print(f'Rough time estimate: {minutes} min')
@@ -439,10 +449,11 @@ def raster(inifile=None, **kwargs):
                                   slow, p['slow_start'], p['slow_stop'], p['slow_steps'],
                                   fast, p['fast_start'], p['fast_stop'], p['fast_steps'],
                                   pluck=False, force=force, dwell=p['dwelltime'],
-                                  fname=pngout, contour=p['contour'], log=p['log'], md=xdi)
+                                  fname=pngout, contour=p['contour'], log=p['log'], fly=p['fly'], md=xdi)
         #preserve_data(uid, f'{p["filename"]} {dcm.energy.position} eV', xlsxout, matout)
 
-        thisuid = bmm_catalog[-1].metadata['start']['uid']  # not sure why this is necessary....
+        thisuid = recent[-1].metadata['start']['uid']  # areascan() does not return the uid of its run
+        tiled_catchup()
         kafka_message({'raster': True, 'uid': thisuid})
 
         kafka_message({'dossier' : 'set',
@@ -460,9 +471,12 @@ def raster(inifile=None, **kwargs):
             dossier.seqend = now('%A, %B %d, %Y %I:%M %p')
             how = 'finished  :tada:'
             try:
-                if 'primary' not in bmm_catalog[-1].metadata['stop']['num_events']:
+                if 'primary' not in recent[-1].metadata['stop']['num_events']:
                     how = '*stopped*'
-                elif bmm_catalog[-1].metadata['stop']['num_events']['primary'] != bmm_catalog[-1].metadata['start']['num_points']:
+                elif 'fly' in recent[-1].metadata['start']:
+                    if recent[-1].metadata['stop']['exit_status'] != 'success':
+                        how = '*stopped*'
+                elif recent[-1].metadata['stop']['num_events']['primary'] != recent[-1].metadata['start']['num_points']:
                     how = '*stopped*'
             except:
                 how = '*stopped*'
@@ -0,0 +1,167 @@
+import threading
+from collections import OrderedDict
+
+import numpy, pandas
+
+
+class RecentStream():
+    '''The events of one stream of a run held in memory, column by
+    column.'''
+    def __init__(self, name):
+        self.name    = name
+        self.columns = {}
+        self.time    = []
+
+    def append(self, data, time):
+        for k, v in data.items():
+            self.columns.setdefault(k, []).append(v)
+        self.time.append(time)
+
+    def __len__(self):
+        return len(self.time)
+
+    def read(self, keys=None):
+        '''Return a dict of numpy arrays, like the columns of a Tiled
+        stream's read(), always including time.'''
+        if keys is None:
+            keys = list(self.columns.keys())
+        table = {k: numpy.asarray(self.columns[k]) for k in keys if k != 'time'}
+        table['time'] = numpy.asarray(self.time, dtype=float)
+        return table
+
+
+class RecentRun():
+    '''A run assembled from its documents.  The metadata attribute and
+    streams behave like those of a Tiled run, so code reading a run
+    just measured can use either.'''
+    def __init__(self, start):
+        self.metadata = {'start': start, 'stop': None}
+        self.streams  = {}
+
+    @property
+    def start(self):
+        return self.metadata['start']
+
+    @property
+    def stop(self):
+        return self.metadata['stop']
+
+    def __getattr__(self, name):
+        streams = self.__dict__.get('streams', {})
+        if name in streams:
+            return streams[name]
+        raise AttributeError(name)
+
+    def __contains__(self, name):
+        return name in self.streams
+
+    def table(self, stream='primary'):
+        '''Return a stream as a pandas DataFrame indexed from 1, with a time
+        column, like db[-1].table().'''
+        this = self.streams[stream].read()
+        frame = pandas.DataFrame({'time': pandas.to_datetime(this.pop('time'), unit='s'),
+                                  **{k: list(v) if v.ndim > 1 else v for k, v in this.items()}})
+        frame.index = pandas.RangeIndex(1, len(frame)+1, name='seq_num')
+        return frame
+
+
+class RecentRuns():
+    '''Keep the last few runs in memory, assembled from the documents
+    the RunEngine emits, so that a plan can look at what it just
+    measured without a round trip through Tiled -- and without waiting
+    for the documents to get there.
+
+    Subscribe an instance of this to the RunEngine.  A run is available
+    as soon as its start document is emitted and is filled in as its
+    events arrive.  Runs are looked up like in a Tiled catalog: by uid
+    (or the beginning of one), by negative index counting back from
+    the most recent run, or by positive scan_id.  A run which is no
+    longer held raises a KeyError.  lookup() falls back to a catalog
+    for those.
+
+    attributes
+    ==========
+    maxruns : int
+      number of runs to keep [10]
+
+    example
+    =======
+    >>> recent = RecentRuns()
+    >>> RE.subscribe(recent)
+    >>> recent[-1].metadata['start']['scan_id']
+    >>> t = recent[-1].table()
+    >>> recent.lookup(uid, bmm_catalog).primary.read(['I0', 'It'])
+
+    '''
+    def __init__(self, maxruns=10):
+        self.maxruns     = maxruns
+        self.runs        = OrderedDict()
+        self.descriptors = {}   # descriptor uid : (run, stream name)
+        self.lock        = threading.Lock()
+
+    def __call__(self, name, doc):
+        with self.lock:
+            if name == 'start':
+                self.runs[doc['uid']] = RecentRun(doc)
+                while len(self.runs) > self.maxruns:
+                    uid, run = self.runs.popitem(last=False)
+                    self.descriptors = {k: v for k, v in self.descriptors.items() if v[0] is not run}
+            elif name == 'descriptor':
+                run = self.runs.get(doc['run_start'])
+                if run is not None:
+                    run.streams.setdefault(doc['name'], RecentStream(doc['name']))
+                    self.descriptors[doc['uid']] = (run, doc['name'])
+            elif name == 'event':
+                if doc['descriptor'] in self.descriptors:
+                    run, stream = self.descriptors[doc['descriptor']]
+                    run.streams[stream].append(doc['data'], doc['time'])
+            elif name == 'event_page':
+                if doc['descriptor'] in self.descriptors:
+                    run, stream = self.descriptors[doc['descriptor']]
+                    for i, t in enumerate(doc['time']):
+                        run.streams[stream].append({k: v[i] for k, v in doc['data'].items()}, t)
+            elif name == 'stop':
+                run = self.runs.get(doc['run_start'])
+                if run is not None:
+                    run.metadata['stop'] = doc
+
+    def __len__(self):
+        return len(self.runs)
+
+    def __getitem__(self, key):
+        with self.lock:
+            runs = list(self.runs.values())
+        if isinstance(key, (int, numpy.integer)):
+            if key < 0:
+                if -key > len(runs):
+                    raise KeyError(key)
+                return runs[key]
+            for run in reversed(runs):
+                if run.start.get('scan_id') == key:
+                    return run
+            raise KeyError(key)
+        if not isinstance(key, str):
+            raise KeyError(key)
+        with self.lock:
+            if key in self.runs:
+                return self.runs[key]
+        for run in reversed(runs):
+            if run.start['uid'].startswith(key):
+                return run
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def lookup(self, key, catalog=None):
+        '''Return the run from memory if it is held, otherwise from catalog.'''
+        try:
+            return self[key]
+        except KeyError:
+            if catalog is None:
+                raise
+            return catalog[key]
@@ -1,4 +1,5 @@
 import numpy, json, os, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm           # progress bar
 from pprint import pprint
 
@@ -31,10 +32,25 @@ class BMMTelemetry():
     in the start and stop document.  The measurement time is the sum
     of the dwell time column in the datatable from the measurement.
 
+    The telemetry table is rebuilt by periodic_table.  The work for
+    each element is farmed out to a pool of worker threads.  The
+    per-record samples for each element are checkpointed to a file
+    in the "records" folder as soon as that element is finished, so
+    an interrupted rebuild can be resumed, and an incremental
+    rebuild need only ingest records made since the last one.
+
     '''
+    SAMPLES = ('ratio', 'difference', 'dpp', 'visual', 'xrf')
+
     def __init__(self):
         self.folder      = os.path.join(startup_dir, 'telemetry')
         self.json        = os.path.join(self.folder, 'telemetry.json')
+        self.records_folder = os.path.join(self.folder, 'records')
+        self.workers     = 4
+        ## in-memory copy of the telemetry table, see load()
+        self.table       = {}
+        self.dpp_average = (0, 0)
+        self.mtime       = None
         self.bc          = None
         if not is_re_worker_active():
             self.bc      = catalog['bmm']
@@ -57,7 +73,11 @@ class BMMTelemetry():
         self.time_search = None
         self.xafs_search = None
         
-    def records(self, element=None):
+    def records(self, element=None, since=None):
+        if since is not None:
+            element_search = self.bc.search(TimeRange(since=since)).search({'XDI._kind':'xafs'}).search({'XDI.Element.symbol': element})
+            print(f'\nNumber of records for {element} since {since}: {len(element_search)}')
+            return(element_search)
         query = TimeRange(since=self.start_date)
         if self.time_search is None:
             self.time_search = self.bc.search(query)
@@ -67,7 +87,7 @@ class BMMTelemetry():
         print(f'\nNumber of records for {element} since {self.start_date}: {len(element_search)}')
         return(element_search)
 
-    def visual_metadata(self, snapshots):
+    def visual_metadata(self, snapshots, seen=None):
         '''Determine the amount of time to capture all four camera images,
         including the time between images.
 
@@ -75,11 +95,34 @@ class BMMTelemetry():
         record the time required to capture the XRF spectrun and make
         its png image.
 
+        The dict seen holds the webcam UIDs already accounted for, so
+        that the visual metadata for a sequence of scans is counted
+        only once.
+
+        Snapshots taken with all cameras in a single run are
+        recognized by all camera UIDs being the same.
+
         '''
-        #print(snapshots['webcam_uid'])
-        if snapshots['webcam_uid'] in self.seen:
-            return 0
+        if seen is None:
+            seen = self.seen
+        if snapshots['webcam_uid'] in seen:
+            return(0, 0)
         net_time, between_time, xrf_time = 0,0,0
+        runs = set(snapshots.get(k, '') for k in ('webcam_uid', 'anacam_uid', 'usbcam1_uid', 'usbcam2_uid')) - {''}
+        if len(runs) == 1:      # all cameras captured in a single run
+            uid = runs.pop()
+            if uid in seen:
+                return(0, 0)
+            try:
+                cam = self.bc[uid].metadata
+                net_time = cam['stop']['time'] - cam['start']['time']
+                if 'xrf_uid' in snapshots:
+                    xrf = self.bc[snapshots['xrf_uid']].metadata
+                    xrf_time = (xrf['stop']['time'] - xrf['start']['time']) + (cam['start']['time'] - xrf['stop']['time'])
+                seen[uid] = 1
+            except:
+                pass
+            return(net_time, xrf_time)
         try:
             web  = self.bc[snapshots['webcam_uid']].metadata
             ana  = self.bc[snapshots['anacam_uid']].metadata
@@ -95,32 +138,51 @@ class BMMTelemetry():
             if 'xrf_uid' in snapshots:
                 xrf = self.bc[snapshots['xrf_uid']].metadata
                 xrf_time = (xrf['stop']['time'] - xrf['start']['time']) + (web['start']['time'] - xrf['stop']['time'])
-            self.seen[snapshots['webcam_uid']] = 1
+            seen[snapshots['webcam_uid']] = 1
         except:
             pass
-        #print(net_time, between_time)
         return(net_time + between_time, xrf_time)
-        
-            
-    def overhead(self, element=None):
-        '''Determine the average overhead for all scans in a time period and
-        of a particular element.  Also record the time taken to
-        capture the visual metadata.
+
+    def samples(self, element=None, since=None, pending=(), progress=True):
+        '''Gather the per-record overhead samples for all scans of an
+        element, from the start date or from the time given by since.
+        Return a dict of lists, one for each of ratio, difference,
+        dpp, visual, and xrf.
+
+        The returned dict also carries "until", the latest start time
+        of the records ingested, and "pending", the UIDs of records
+        without a stop document, i.e. scans still in progress.  Those
+        are handed back in as pending on the next incremental pass,
+        so they are ingested once they finish.
 
         '''
-        if element is None: return({})
-        element_search = self.records(element)
-        l = len(element_search)
-        if l == 0: return({})
-        ratio, difference, dpp, visual, xrf = numpy.zeros(l), numpy.zeros(l), numpy.zeros(l), numpy.zeros(l), numpy.zeros(l)
-        count = 0
-        start = time.time()
-        self.seen = {}
-        for u, this in tqdm(element_search.items()):
-            ## records that did not complete normally
-            #if this is None: continue
+        found = {k: [] for k in self.SAMPLES}
+        found['pending'] = []
+        latest = None
+        element_search = self.records(element, since=since)
+        runs = dict(element_search.items()) if len(element_search) > 0 else {}
+        if isinstance(since, (int, float)):
+            ## records up to and including since were ingested on the previous pass
+            runs = {u: this for u, this in runs.items()
+                    if this.metadata['start']['time'] > since}
+        for u in pending:
+            if u not in runs:
+                try:
+                    runs[u] = self.bc[u]
+                except KeyError:
+                    pass
+        seen = {}
+        for u, this in tqdm(runs.items(), disable=not progress):
             md = this.metadata
-            if md is None or md['stop'] is None: continue
+            if md is None:
+                continue
+            ## scans still in progress, look again next time
+            if md['stop'] is None:
+                found['pending'].append(u)
+                continue
+            if latest is None or md['start']['time'] > latest:
+                latest = md['start']['time']
+            ## records that did not complete normally
             if 'primary' in md['stop']['num_events']:
                 if md['start']['num_points'] != md['stop']['num_events']['primary']:
                     continue
@@ -134,57 +196,164 @@ class BMMTelemetry():
                     continue
 
                 ## gather simple statistics
-                difference[count] = time_elapsed - measurement_time  # total motor motion overhead
-                ratio[count]      = time_elapsed/measurement_time
-                dpp[count]        = difference[count] / len(t)  # approximate overhead as evenly distributed point-by-point
-                visual[count], xrf[count] = self.visual_metadata(md['start']['XDI']['_snapshots'])
-                count             = count + 1
+                difference = time_elapsed - measurement_time  # total motor motion overhead
+                visual, xrf = self.visual_metadata(md['start']['XDI']['_snapshots'], seen)
+                found['difference'].append(difference)
+                found['ratio'].append(time_elapsed/measurement_time)
+                found['dpp'].append(difference / len(t))  # approximate overhead as evenly distributed point-by-point
+                found['visual'].append(visual)
+                found['xrf'].append(xrf)
             except: #  Exception as E:             # if a record cannot be processed for any reason, just skip it.
-                #print(E)
                 pass
+        found['until'] = since if latest is None else latest
+        return found
 
-        ## count will likely be smaller than l
-        ratio = ratio[numpy.flatnonzero(ratio)]
-        difference = difference[numpy.flatnonzero(difference)]
-        dpp = dpp[numpy.flatnonzero(dpp)]
-        visual = visual[numpy.flatnonzero(visual)]
-        xrf = xrf[numpy.flatnonzero(xrf)]
-        elapsed_time(start)
+    def summarize(self, found):
+        '''Reduce a dict of per-record samples to the means and standard
+        deviations stored in the telemetry table.'''
+        if len(found['ratio']) == 0:
+            return({})
+        arrays = {}
+        for k in self.SAMPLES:
+            a = numpy.array(found[k], dtype=float)
+            arrays[k] = a[numpy.flatnonzero(a)]
+        ratio, difference, dpp, visual, xrf = (arrays[k] for k in self.SAMPLES)
         ## return means and standard deviations
-        return({'count'     : count,
+        return({'count'     : len(found['ratio']),
                 'ratio'     : [ratio.mean(), ratio.std()],
                 'difference': [difference.mean(), difference.std()],
                 'dpp'       : [dpp.mean(), dpp.std(), dpp.max(), dpp.min()],
                 'visual'    : [visual.mean(), visual.std(), len(visual)],
                 'xrf'       : [xrf.mean(), xrf.std(), len(xrf)],
             })
-    
 
-    ## TODO: take a list of integers/element symbols as an input
-    ## parameter, extract just those, modify json file for those
-    ## elements
-    def periodic_table(self):
+    def overhead(self, element=None):
+        '''Determine the average overhead for all scans in a time period and
+        of a particular element.  Also record the time taken to
+        capture the visual metadata.
+
+        '''
+        if element is None: return({})
+        start = time.time()
+        found = self.samples(element)
+        elapsed_time(start)
+        return self.summarize(found)
+
+    def checkpoint_file(self, element):
+        return os.path.join(self.records_folder, f'{element}.json')
+
+    def read_checkpoint(self, element):
+        '''Return the checkpointed samples for an element, or None.'''
+        fname = self.checkpoint_file(element)
+        if not os.path.isfile(fname):
+            return None
+        with open(fname, 'r') as f:
+            return json.load(f)
+
+    def write_json(self, fname, content):
+        '''Write a json file by way of a temporary file, so that an
+        interrupted write never leaves a truncated file behind.'''
+        temp = fname + '.tmp'
+        with open(temp, 'w') as f:
+            f.write(json.dumps(content))
+        os.replace(temp, fname)
+
+    def rebuild_element(self, element, incremental=False, resume=False, progress=False):
+        '''Gather the samples for one element and checkpoint them.
+
+        With resume=True, an existing checkpoint made from the current
+        start date is used as is.  With incremental=True, only records
+        made since the existing checkpoint are ingested and appended
+        to it.  The checkpoint is marked with the start time of the
+        latest record ingested, not the wall clock time of the
+        rebuild, so that nothing started during the rebuild is lost.
+
+        '''
+        previous = self.read_checkpoint(element)
+        if previous is not None and previous['since'] != self.start_date:
+            previous = None
+        if resume and previous is not None:
+            return previous
+        if incremental and previous is not None:
+            found = self.samples(element, since=previous['until'], pending=previous.get('pending', []), progress=progress)
+            for k in self.SAMPLES:
+                found[k] = previous[k] + found[k]
+        else:
+            found = self.samples(element, progress=progress)
+        found['since'] = self.start_date
+        self.write_json(self.checkpoint_file(element), found)
+        return found
+
+    def periodic_table(self, elements=None, workers=None, incremental=False, resume=False):
+        '''Rebuild the telemetry table, one element per worker thread.
+
+        Parameters
+        ----------
+        elements : list of int or str
+            elements to rebuild, default is self.all_elements
+        workers : int
+            number of worker threads, default is self.workers
+        incremental : bool
+            only ingest records made since the last rebuild of each element [False]
+        resume : bool
+            reuse elements already checkpointed, e.g. to finish an interrupted rebuild [False]
+
+        The telemetry json file is written once, at the end.  Entries
+        for elements not rebuilt are kept as they were.
+
+        '''
         start = time.time()
+        if elements is None:
+            elements = self.all_elements
+        elements = [element_symbol(z) for z in elements]
+        if workers is None:
+            workers = self.workers
+        os.makedirs(self.records_folder, exist_ok=True)
         results = {}
-        for z in self.all_elements:
-            el = element_symbol(z)
-            results[el] = self.overhead(el)
-            pprint(results[el])
-            j = json.dumps(results)
-            f = open(self.json,"w")
-            f.write(j)
-            f.close()
+        if os.path.isfile(self.json):
+            with open(self.json, 'r') as f:
+                results = json.load(f)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            jobs = {pool.submit(self.rebuild_element, el, incremental, resume, workers==1): el for el in elements}
+            for job in as_completed(jobs):
+                el = jobs[job]
+                try:
+                    results[el] = self.summarize(job.result())
+                except Exception as E:
+                    print(f'{el}: {E}')
+                    continue
+                pprint({el: results[el]})
+        self.write_json(self.json, results)
         end = time.time()
         print('\n\nThat took %.1f min' % ((end-start)/60))
 
 
+    def load(self):
+        '''Read the telemetry json file into memory, but only if it has
+        changed on disk since the last time it was read.  Each
+        element's entry is stored as a dict of numpy arrays.  The
+        mean and standard deviation of the overhead per point across
+        all elements is computed here, once.
+
+        '''
+        mtime = os.path.getmtime(self.json)
+        if mtime == self.mtime:
+            return
+        with open(self.json, 'r') as td:
+            alltele = json.load(td)
+        table = {}
+        for el, entry in alltele.items():
+            table[el] = {k: numpy.array(v, dtype=float) for k, v in entry.items() if k != 'count'}
+            if 'count' in entry:
+                table[el]['count'] = entry['count']
+        a = numpy.array([table[el]['dpp'][0] for el in table if 'dpp' in table[el]])
+        self.table, self.dpp_average, self.mtime = table, (a.mean(), a.std()), mtime
+
     def value(self, el, thing='dpp'):
         if thing not in ('dpp', 'visual', 'xrf', 'ratio', 'difference'):
             return 0
-        with open(self.json, 'r') as td:
-            tdata = td.read()
-        alltele = json.loads(tdata)
-        return alltele[el.capitalize()][thing][0]
+        self.load()
+        return self.table[el.capitalize()][thing][0]
         
     def average(self, thing='dpp'):
         '''In the case of an element that has not been measured before, use
@@ -193,14 +362,8 @@ class BMMTelemetry():
         '''
         if thing not in ('dpp', 'visual', 'xrf', 'ratio', 'difference'):
             return (0,0)
-        with open(self.json, 'r') as td:
-            tdata = td.read()
-        alltele = json.loads(tdata)
-        a = []
-        for el in alltele.keys():
-            if 'dpp' in alltele[el]:
-                a.append(alltele[el]['dpp'][0])
-        return(numpy.array(a).mean(), numpy.array(a).std())
+        self.load()
+        return self.dpp_average
 
     # def interpolate(self, energy):
     #     a = json.load(open(self.json))
@@ -220,12 +383,12 @@ class BMMTelemetry():
     #     return(numpy.interp(energy, e[s], t[s]))
 
     def overhead_per_point(self, element, edge=None):
-        a = json.load(open(self.json))
+        self.load()
         element = element_symbol(element)
         if edge is not None and edge.lower() in ('l2', 'l1'):
             return(self.average(thing='dpp'))
-        if element in a and 'dpp' in a[element]:
-            return(a[element]['dpp'])
+        if element in self.table and 'dpp' in self.table[element]:
+            return(self.table[element]['dpp'].tolist())
         else:
             if edge is None or edge.lower() not in ('l2', 'l1'):
                 edge = 'k'
@@ -0,0 +1,251 @@
+import os, json, time, datetime, threading, queue
+from collections import deque
+import numpy
+
+
+def jsonable(obj):
+    '''Default for json.dumps, for the numpy types found in documents.'''
+    if isinstance(obj, numpy.ndarray):
+        return obj.tolist()
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    raise TypeError(f'{type(obj)} is not JSON serializable')
+
+
+class TiledDocumentWriter():
+    '''Post Bluesky documents to Tiled from a background thread.
+
+    Subscribe an instance of this to the RunEngine in place of a
+    function which posts documents directly.  Each document is put on
+    a queue and the RunEngine carries on at once.  A single worker
+    thread posts the documents, in order, in batches of whatever has
+    accumulated since the last batch.
+
+    A failed post is retried a few times with exponential backoff.
+    If Tiled still cannot be reached, the worker switches to spooling:
+    that document and all that follow are appended to a local,
+    append-only file of json lines.  Every so often (again with
+    exponential backoff), the worker attempts to replay the spool.
+    Once the whole spool has been posted, it is removed and documents
+    are once again posted directly.  The number of spooled documents
+    already replayed is kept in a small file next to the spool, so a
+    spool left behind by a crash or restart is replayed, without
+    duplicates, when the next writer starts.
+
+    A failure to replay the spool does not affect the handling of new
+    documents.  If handling a batch fails part way through, whatever
+    part of it was not posted is spooled.  If even that fails, those
+    documents are held in memory and tried again with the next batch.
+    A line of the spool which cannot be read is reported and skipped.
+
+    attributes
+    ==========
+    client : tiled client
+      the Tiled writing client, which provides post_document
+    spool : str
+      fully resolved path to the spool file
+    attempts : int
+      number of direct posts to try before spooling [3]
+    backoff : float
+      seconds to wait after the first failed attempt, doubled after each [0.5]
+    retry : float
+      longest wait, in seconds, between attempts to replay the spool [120]
+
+    example
+    =======
+    >>> tiled_writer = TiledDocumentWriter(tiled_writing_client, spool=os.path.join(WORKSPACE, 'tiled_spool', 'documents.jsonl'))
+    >>> RE.subscribe(tiled_writer)
+    >>> tiled_writer.status()
+    >>> tiled_writer.wait(timeout=30)    # e.g. at a run boundary
+
+    '''
+    def __init__(self, client, spool, attempts=3, backoff=0.5, retry=120, maxbatch=500):
+        self.client    = client
+        self.spool     = spool
+        self.attempts  = attempts
+        self.backoff   = backoff
+        self.retry     = retry
+        self.maxbatch  = maxbatch
+        self.queue     = queue.Queue()
+        self.latencies = deque(maxlen=1000)
+        self.posted    = 0
+        self.spooled   = 0
+        self.spooling  = False
+        self.next_replay = 0
+        self.wait_time = backoff
+        self.progress  = 0    # number of documents of the current batch posted directly
+        self.held      = []   # documents which could be neither posted nor spooled
+        os.makedirs(os.path.dirname(self.spool), exist_ok=True)
+        if os.path.isfile(self.spool) and os.path.getsize(self.spool) > 0:
+            self.spooling = True  # left over from before, replay when the worker starts
+        self.worker = threading.Thread(target=self.run, name='BMM tiled writer', daemon=True)
+        self.worker.start()
+
+    def __call__(self, name, doc):
+        self.queue.put((name, doc, time.monotonic()))
+
+    @property
+    def replayed_file(self):
+        return self.spool + '.replayed'
+
+    def run(self):
+        while True:
+            timeout = None
+            if self.spooling or len(self.held) > 0:
+                timeout = max(self.next_replay - time.monotonic(), 0.01)
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.maxbatch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self.spooling and time.monotonic() >= self.next_replay:
+                try:
+                    self.replay()
+                except Exception as E:
+                    print(f'Tiled writer could not replay the spool: {E!r}')
+                    self.wait_time = min(2*self.wait_time, self.retry)
+                    self.next_replay = time.monotonic() + self.wait_time
+            these, self.held = self.held + batch, []
+            try:
+                self.handle(these)
+            except Exception as E:
+                print(f'Tiled writer failure: {E!r}')
+                self.rescue(these[self.progress:])
+            for i in range(len(batch)):
+                self.queue.task_done()
+
+    def handle(self, batch):
+        to_spool = []
+        self.progress = 0
+        for name, doc, start in batch:
+            if not self.spooling:
+                if self.post(name, doc):
+                    self.latencies.append(time.monotonic() - start)
+                    self.progress += 1
+                    continue
+                print(f'Tiled is unreachable, spooling documents to {self.spool} at {datetime.datetime.now().strftime("%Y-%m-%dT%H-%M-%S")}')
+                self.spooling = True
+                self.wait_time = self.backoff
+                self.next_replay = time.monotonic() + self.wait_time
+            to_spool.append((name, doc))
+        self.write_spool(to_spool)
+
+    def write_spool(self, documents):
+        '''Append (name, doc) pairs to the spool.'''
+        if len(documents) == 0:
+            return
+        with open(self.spool, 'a') as f:
+            for name, doc in documents:
+                f.write(json.dumps([name, doc], default=jsonable) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.spooled += len(documents)
+
+    def rescue(self, batch):
+        '''Spool the documents of a batch which failed part way through.
+        Hold them in memory if they cannot be spooled either.'''
+        if not self.spooling:
+            self.spooling = True
+            self.wait_time = self.backoff
+            self.next_replay = time.monotonic() + self.wait_time
+        try:
+            self.write_spool([(name, doc) for name, doc, start in batch])
+        except Exception as E:
+            print(f'Tiled writer could not spool {len(batch)} documents, holding them in memory: {E!r}')
+            self.held = list(batch)
+
+    def post(self, name, doc, attempts=None):
+        '''Post one document, retrying with exponential backoff.  Return
+        True on success.'''
+        if attempts is None:
+            attempts = self.attempts
+        wait = self.backoff
+        for attempt in range(attempts):
+            try:
+                self.client.post_document(name, doc)
+            except Exception as exc:
+                print("Document saving failure:", repr(exc))
+                if attempt < attempts - 1:
+                    time.sleep(wait)
+                    wait *= 2
+            else:
+                self.posted += 1
+                return True
+        return False
+
+    def replay(self):
+        '''Post the spooled documents not yet replayed.  Remove the spool
+        once everything in it has been posted.'''
+        if not os.path.isfile(self.spool):
+            self.spooling = False
+            self.wait_time = self.backoff
+            return True
+        done = 0
+        if os.path.isfile(self.replayed_file):
+            with open(self.replayed_file, 'r') as f:
+                done = int(f.read().strip() or 0)
+        count = 0
+        with open(self.spool, 'r') as f:
+            for line in f:
+                count += 1
+                if count <= done:
+                    continue
+                try:
+                    name, doc = json.loads(line)
+                except ValueError:
+                    print(f'Skipping unreadable line {count} of {self.spool}')
+                else:
+                    if not self.post(name, doc, attempts=1):
+                        self.wait_time = min(2*self.wait_time, self.retry)
+                        self.next_replay = time.monotonic() + self.wait_time
+                        return False
+                with open(self.replayed_file, 'w') as r:
+                    r.write(str(count))
+        os.remove(self.spool)
+        if os.path.isfile(self.replayed_file):
+            os.remove(self.replayed_file)
+        self.spooling = False
+        self.wait_time = self.backoff
+        print(f'Replayed {count-done} spooled documents to Tiled at {datetime.datetime.now().strftime("%Y-%m-%dT%H-%M-%S")}')
+        return True
+
+    def depth(self):
+        '''Number of documents waiting to be posted, queued or spooled.'''
+        spooled = 0
+        if self.spooling and os.path.isfile(self.spool):
+            with open(self.spool, 'r') as f:
+                spooled = sum(1 for line in f)
+            if os.path.isfile(self.replayed_file):
+                with open(self.replayed_file, 'r') as f:
+                    spooled -= int(f.read().strip() or 0)
+        return self.queue.qsize() + spooled
+
+    def status(self):
+        '''Return a dict describing the state of the writer.  Latencies,
+        in seconds, are from the RunEngine emitting a document to its
+        being posted to Tiled.'''
+        latencies = numpy.array(self.latencies)
+        return {'queued'         : self.queue.qsize(),
+                'waiting'        : self.depth(),
+                'spooling'       : self.spooling,
+                'posted'         : self.posted,
+                'spooled'        : self.spooled,
+                'latency_median' : float(numpy.median(latencies)) if len(latencies) > 0 else None,
+                'latency_max'    : float(latencies.max()) if len(latencies) > 0 else None, }
+
+    def wait(self, timeout=None):
+        '''Block until every queued document has been either posted or
+        spooled, or until timeout seconds have passed.  Return True if
+        the queue was emptied.'''
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks > 0:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
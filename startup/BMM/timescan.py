@@ -22,14 +22,14 @@ from BMM.dossier       import DossierTools
 from BMM.functions     import countdown, boxedtext, now, isfloat, inflect, e2l, etok, ktoe, present_options, plotting_mode
 from BMM.functions     import PROMPT, PROMPTNC, animated_prompt
 from BMM.functions     import error_msg, warning_msg, go_msg, url_msg, bold_msg, verbosebold_msg, list_msg, disconnected_msg, info_msg, whisper
-from BMM.kafka         import kafka_message
+from BMM.kafka         import kafka_message, tiled_catchup
 from BMM.logging       import BMM_log_info, BMM_msg_hook, report
 from BMM.metadata      import bmm_metadata, display_XDI_metadata, metadata_at_this_moment
 from BMM.resting_state import resting_state, resting_state_plan
 from BMM.suspenders    import BMM_suspenders, BMM_clear_to_start, BMM_clear_suspenders
 from BMM.xafs          import scan_metadata, file_exists
 
-from BMM.user_ns.base      import bmm_catalog
+from BMM.user_ns.base      import bmm_catalog, recent
 from BMM.user_ns.detectors import quadem1, ic0, ic1, ic2, xs, xs1, xs4, xs7, ION_CHAMBERS
 from BMM.user_ns.dwelltime import _locked_dwell_time, use_7element, use_4element, use_1element
 
@@ -148,7 +148,7 @@ def timescan(detector, readings, dwell, delay, outfile=None, force=False, md={})
                    'uid' : uid, })
     
     BMM_log_info('timescan: %s\tuid = %s, scan_id = %d' %
-                 (line1, uid, bmm_catalog[uid].metadata['start']['scan_id']))
+                 (line1, uid, recent.lookup(uid, bmm_catalog).metadata['start']['scan_id']))
 
     yield from mv(_locked_dwell_time, 0.5)
     RE.msg_hook = BMM_msg_hook
@@ -172,6 +172,7 @@ def ts2dat(datafile, key):
     -------
     >>> ts2dat('/path/to/myfile.dat', '42447313-46a5-42ef-bf8a-46fedc2c2bd1')
     '''
+    tiled_catchup()
     kafka_message({'seadxdi': True, 'uid': key, 'filename': datafile})
     print(bold_msg('wrote timescan to %s' % datafile))
 
@@ -364,6 +365,7 @@ def sead(inifile=None, force=False, **kwargs):
         if p['shutter'] is True:
             yield from shb.close_plan()
 
+        tiled_catchup()
         kafka_message({'seadxdi': True, 'uid' : seaduid, 'filename': outfile})
         kafka_message({'dossier' : 'set',
                        'rid'     : rid,
@@ -377,9 +379,9 @@ def sead(inifile=None, force=False, **kwargs):
         BMM_clear_suspenders()
         how = 'finished  :tada:'
         try:
-            if 'primary' not in bmm_catalog[-1].metadata['stop']['num_events']:
+            if 'primary' not in recent[-1].metadata['stop']['num_events']:
                 how = '*stopped*'
-            elif bmm_catalog[-1].metadata['stop']['num_events']['primary'] != bmm_catalog[-1].metadata['start']['num_points']:
+            elif recent[-1].metadata['stop']['num_events']['primary'] != recent[-1].metadata['start']['num_points']:
                 how = '*stopped*'
         except:
             how = '*stopped*'
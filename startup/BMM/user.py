@@ -27,9 +27,12 @@ from BMM.kafka     import kafka_message
 from BMM.logging   import BMM_user_log, BMM_unset_user_log, report
 from BMM.periodictable import edge_energy
 from BMM.workspace import rkvs
+from BMM_common.redis_state import RedisState
 
 from BMM.user_ns.base import startup_dir
 
+user_state = RedisState(rkvs)   # BMM:user:* keys, read and written in single round trips
+
 TEMPLATES_FOLDER = 'templates'
 
 #import redis
@@ -275,6 +278,7 @@ class BMM_User(Borg):
         self.rockingcurve  = False
         self.htmlpage      = True
         self.bothways      = False
+        self.continuous    = False
         self.channelcut    = True
         self.ththth        = False
         self.lims          = True
@@ -344,34 +348,36 @@ class BMM_User(Borg):
                                         'motor', 'cycle', 'user_is_defined') and
                            'xschannel' not in n]
         d = dict()
+        state = dict()          # written to redis in one MSET
         for k in self.bmm_strings:
             d[k] = getattr(self, k)
             if verbose: print(f'string: {k} = >{getattr(self, k)}<')
             if getattr(self, k) is None:
-                rkvs.set(f'BMM:user:{k}', 'None')
+                state[k] = 'None'
             else:
-                rkvs.set(f'BMM:user:{k}', getattr(self, k))
+                state[k] = getattr(self, k)
         for k in self.bmm_ints:
             d[k] = getattr(self, k)
             if verbose: print(f'int: {k} = >{getattr(self, k)}<')
             if getattr(self, k) is None:
-                rkvs.set(f'BMM:user:{k}', 0)
+                state[k] = 0
             else:
-                rkvs.set(f'BMM:user:{k}', getattr(self, k))
+                state[k] = getattr(self, k)
         for k in self.bmm_floats:
             d[k] = getattr(self, k)
             if verbose: print(f'float: {k} = >{getattr(self, k)}<')
             if getattr(self, k) is None:
-                rkvs.set(f'BMM:user:{k}', 0.0)
+                state[k] = 0.0
             else:
-                rkvs.set(f'BMM:user:{k}', getattr(self, k))
+                state[k] = getattr(self, k)
         for k in self.bmm_booleans:
             d[k] = getattr(self, k)
             if verbose: print(f'bool: {k} = >{getattr(self, k)}<')
             if getattr(self, k) is None:
-                rkvs.set(f'BMM:user:{k}', 'False')
+                state[k] = 'False'
             else:
-                rkvs.set(f'BMM:user:{k}', str(getattr(self, k)))
+                state[k] = str(getattr(self, k))
+        user_state.set(state)
         for k in self.bmm_none:
             d[k] = getattr(self, k)
             if verbose: print(f'none: {k} = >{getattr(self, k)}<')
@@ -402,8 +408,7 @@ class BMM_User(Borg):
             self.edge    = edge
         for i in (1,2,3,4,8):
             setattr(self, f'xs{i}', f'{element}{i}')
-        for key in ('element', 'edge', 'xs1', 'xs2', 'xs3', 'xs4', 'xs5', 'xs6', 'xs7', 'xs8'):
-            rkvs.set(f'BMM:user:{key}', getattr(self, key))
+        user_state.set({key: getattr(self, key) for key in ('element', 'edge', 'xs1', 'xs2', 'xs3', 'xs4', 'xs5', 'xs6', 'xs7', 'xs8')})
 
     def verify_roi(self, xs, el, edge, tab=''):
         print(bold_msg(f'{tab}Setting ROIs on {xs.name} for {el} {edge} edge'))
@@ -434,44 +439,41 @@ class BMM_User(Borg):
 
             
     def state_from_redis(self):
-        from BMM.workspace import rkvs
         verbose = False
+        ## all of the state in one MGET, keys missing from redis come back as None
+        state = user_state.get_dict(*self.bmm_strings, *self.bmm_ints, *self.bmm_floats, *self.bmm_booleans, default=None)
         for k in self.bmm_strings:
             if verbose: print("string:", k)
-            try:
-                setattr(self, k, rkvs.get(f'BMM:user:{k}').decode('utf-8'))
-            except AttributeError:
+            if state[k] is None:
                 setattr(self, k, '')
+            else:
+                setattr(self, k, state[k])
         for k in self.bmm_ints:
             if verbose: print("int:", k)
-            if rkvs.get(f'BMM:user:{k}').decode('utf-8').strip() == '':
+            if state[k] is None or state[k].strip() == '':
                 setattr(self, k, 0)
             else:
-                setattr(self, k, int(rkvs.get(f'BMM:user:{k}').decode('utf-8')))
+                setattr(self, k, int(state[k]))
         for k in self.bmm_floats:
             if verbose: print("float:", k)
             try:
-                setattr(self, k, float(rkvs.get(f'BMM:user:{k}').decode('utf-8')))
-            except AttributeError:
+                setattr(self, k, float(state[k]))
+            except (TypeError, ValueError):
                 setattr(self, k, 0.0)
         for k in self.bmm_booleans:
             if verbose: print("bool:", k)
-            try:
-                this = rkvs.get(f'BMM:user:{k}').decode('utf-8')
-                if this.lower() in ('false', 'no', '0', 'f', 'n'):
-                    setattr(self, k, False)
-                else:
-                    setattr(self, k, True)
-            except AttributeError:
+            if state[k] is None or state[k].lower() in ('false', 'no', '0', 'f', 'n'):
                 setattr(self, k, False)
+            else:
+                setattr(self, k, True)
                 
         for k in self.bmm_none:
             if verbose: print("none:", k)
             setattr(self, k, None)
         
-        rkvs.set('BMM:pds:element',     self.element)
-        rkvs.set('BMM:pds:edge',        self.edge)
-        rkvs.set('BMM:pds:edge_energy', edge_energy(self.element, self.edge))
+        rkvs.mset({'BMM:pds:element':     self.element,
+                   'BMM:pds:edge':        self.edge,
+                   'BMM:pds:edge_energy': edge_energy(self.element, self.edge)})
             
     def show(self, scan=False):
         '''
@@ -1039,6 +1041,7 @@ class BMM_User(Borg):
         self.htmlpage = True
         self.usbstick = False
         self.bothways = False
+        self.continuous = False
         self.channelcut = True
         self.ththth = False
         self.lims = True
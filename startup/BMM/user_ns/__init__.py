@@ -47,6 +47,10 @@ from .utilities import *
 # everything else, read comments in that file
 from .bmm_end import *
 
+# time spent importing each module and connecting to its devices
+from BMM.connections import connections
+connections.report()
+
 if not is_re_worker_active():
     print('\t', end='')
     get_ipython().magic(u"%xmode Plain")
@@ -1,5 +1,5 @@
 import nslsii
-import os, time, datetime
+import os
 
 from bluesky.plan_stubs import mv, mvr, sleep
 from databroker import Broker
@@ -48,38 +48,24 @@ else:
 RE.unsubscribe(0)  # remove databroker, which was subscribed first by configure_base
 tiled_writing_client = from_uri("https://tiled.nsls2.bnl.gov/api/v1/metadata/bmm/raw", api_key=os.environ["TILED_BLUESKY_WRITING_API_KEY_BMM"])
 
-def post_document(name, doc):
-    #tz = time.monotonic()
-    ATTEMPTS = 20
-    error = None
-    for attempt in range(ATTEMPTS):
-        try:
-            tiled_writing_client.post_document(name, doc)
-        except Exception as exc:
-            print("Document saving failure:", repr(exc))
-            error = exc
-        else:
-            break
-        time.sleep(2)
-    else:
-        # out of attempts
-        print('**************************************************')
-        print('One last try to connect to tiled.  Wating 2 minutes')
-        print(f'Begin sleeping for 2 minutes at {datetime.datetime.now().strftime("%Y-%m-%dT%H-%M-%S")}')
-        print('**************************************************')
-        time.sleep(120)
-        try:
-            tiled_writing_client.post_document(name, doc)
-        except Exception as exc:
-            print("Document saving failure:", repr(exc))
-            error = exc
-            raise error
-        else:
-            pass
-
-    #print(f"post_document timing: {time.monotonic() - tz:.3}\n")
-    
-RE.subscribe(post_document)
+## documents are posted to tiled from a worker thread so that a tiled
+## hiccup never stalls the RunEngine.  if tiled cannot be reached, the
+## documents are spooled to a local file and replayed later.
+## tiled_writer.status() shows the queue depth and posting latency,
+## tiled_writer.wait(timeout) waits for the queue to empty.
+## the xafs, raster, area, line and time scan plans call
+## BMM.kafka.tiled_catchup() before any message which makes a worker
+## read a run from tiled.
+from BMM.tiled_writer import TiledDocumentWriter
+tiled_writer = TiledDocumentWriter(tiled_writing_client, spool=os.path.join(WORKSPACE, 'tiled_spool', 'documents.jsonl'))
+RE.subscribe(tiled_writer)
+
+## the last several runs are also assembled in memory, so that a plan
+## can analyze what it just measured without a round trip to tiled,
+## e.g. recent[-1].table() or recent.lookup(uid, bmm_catalog).primary.read()
+from BMM.recent_runs import RecentRuns
+recent = RecentRuns(maxruns=10)
+RE.subscribe(recent)
 
 # this prefix needs to be the same (but with a dash) as the call to sync_experiment in user.py
 from redis_json_dict import RedisJSONDict 
@@ -55,7 +55,8 @@ import atexit, os
 def teardown():
     print("Shutting down: ", end=' ')
     BMMuser.state_to_redis(filename=os.path.join(BMMuser.workspace, '.BMMuser'), prefix='')
-    from BMM.kafka import producer
+    from BMM.kafka import kafka_flush, producer
+    kafka_flush()
     producer.flush()
     
 atexit.register(teardown)
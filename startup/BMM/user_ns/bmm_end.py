@@ -304,7 +304,7 @@ XDI_record = {'xafs_linx'                        : (True,  'Sample.x'),
 # import logging
 # logging.getLogger("hdf5plugin").setLevel(logging.ERROR) # no longer needed, I guess...
 run_report('\t'+'xafs')
-from BMM.xafs import howlong, xafs, xanes
+from BMM.xafs import howlong, xafs, xanes, reintegrate_rois
 from BMM.xafs_functions import xrfat
 from BMM.dossier import lims
 
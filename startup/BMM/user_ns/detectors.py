@@ -67,10 +67,62 @@ ION_CHAMBERS = []               # list of ion chambers in use, will be populated
 
 # configure signal chains for I0/It/Ir, configuration flags from BMM.user_ns.dwelltime
 from BMM.user_ns.dwelltime import with_ic0, with_ic1, with_ic2, with_iy
-        
+from BMM.user_ns.dwelltime import with_pilatus
+from BMM.user_ns.dwelltime import with_xspress3, use_4element, use_1element, use_7element
+
+## instantiate the electrometers, the Pilatus, and the Xspress3
+## detectors, then wait for all of them to connect at once.  Each is
+## configured below only if it connected.  See BMM/connections.py
+from BMM.connections import connections
+
 quadem1 = BMMQuadEM('XF:06BM-BI{EM:1}EM180:', name='quadem1')
-quadem1.enable_electrometer()
-print(whisper('\t\t\t'+'instantiated quadem1'))
+
+ic0, ic1, ic2 = None, None, None
+try:                            # might not be in use
+    ic0 = IntegratedIC('XF:06BM-BI{IC:0}EM180:', name='Ic0')
+except Exception as E:
+    print(E)
+try:
+    ic1 = IntegratedIC('XF:06BM-BI{IC:1}EM180:', name='Ic1')
+except Exception as E:
+    print(E)
+try:
+    ic2 = IntegratedIC('XF:06BM-BI{IC:3}EM180:', name='Ic2')
+except Exception as E:
+    print(E)
+
+pilatus = None
+#pilatus_tiff = None
+if with_pilatus is True:
+    from BMM.pilatus import BMMPilatusSingleTrigger #,  BMMPilatusTIFFSingleTrigger
+    pilatus = BMMPilatusSingleTrigger("XF:06BMB-ES{Det:PIL100k}:", name="pilatus100k-1", read_attrs=["hdf5"])
+
+xs  = None
+xs4 = None
+xs1 = None
+xs7 = None
+if with_xspress3 is True and use_7element is True:
+    from BMM.xspress3_7element import BMMXspress3Detector_7Element
+    xs7 = BMMXspress3Detector_7Element(prefix     = 'XF:06BM-ES{Xsp:1}:',
+                                       name       = '7-element SDD',
+                                       read_attrs = ['hdf5']    )
+if with_xspress3 is True and use_1element is True:
+    from BMM.xspress3_1element import BMMXspress3Detector_1Element
+    xs1 = BMMXspress3Detector_1Element(prefix     = 'XF:06BM-ES{Xsp:1}:',
+                                       name       = '1-element SDD',
+                                       read_attrs = ['hdf5']    )
+if with_xspress3 is True and use_4element is True:
+    from BMM.xspress3_4element import BMMXspress3Detector_4Element
+    xs4 = BMMXspress3Detector_4Element(prefix     = 'XF:06BM-ES{Xsp:1}:',
+                                       name       = '4-element SDD',
+                                       read_attrs = ['hdf5']    )
+
+connections.watch(*[d for d in (quadem1, ic0, ic1, ic2, pilatus, xs7, xs1, xs4) if d is not None])
+connections.settle()
+
+if quadem1.connected is True:
+    quadem1.enable_electrometer()
+    print(whisper('\t\t\t'+'instantiated quadem1'))
 if with_ic0 is False:
     quadem1.I0.kind, quadem1.I0.name = 'hinted', 'I0'
 else:
@@ -101,14 +153,15 @@ if with_iy is True or with_ic0 is False or with_ic1 is False or with_ic2 is Fals
 def set_precision(pv, val):
     EpicsSignal(pv.pvname + ".PREC", name='').put(val)
 
-set_precision(quadem1.current1.mean_value, 3)
-toss = quadem1.I0.describe()    # this seems to be necessary for the BEC to use the correct precision
-set_precision(quadem1.current2.mean_value, 3)
-toss = quadem1.It.describe()
-set_precision(quadem1.current3.mean_value, 3)
-toss = quadem1.Ir.describe()
-set_precision(quadem1.current4.mean_value, 3)
-toss = quadem1.Iy.describe()
+if quadem1.connected is True:
+    set_precision(quadem1.current1.mean_value, 3)
+    toss = quadem1.I0.describe()    # this seems to be necessary for the BEC to use the correct precision
+    set_precision(quadem1.current2.mean_value, 3)
+    toss = quadem1.It.describe()
+    set_precision(quadem1.current3.mean_value, 3)
+    toss = quadem1.Ir.describe()
+    set_precision(quadem1.current4.mean_value, 3)
+    toss = quadem1.Iy.describe()
 
 
 # try:                            # might not be in use
@@ -135,7 +188,8 @@ toss = quadem1.Iy.describe()
 #######################################################################
 
 try:                            # might not be in use
-    ic0 = IntegratedIC('XF:06BM-BI{IC:0}EM180:', name='Ic0')
+    if ic0 is None or ic0.connected is False:
+        raise ConnectionError('ic0 is not connected')
     ic0.enable_electrometer()
     print(whisper('\t\t\t'+'instantiated ic0'))
     if with_ic0 is False:
@@ -156,7 +210,8 @@ except Exception as E:
     ic0 = noisy_det
 
 try:                            # might not be in use
-    ic1 = IntegratedIC('XF:06BM-BI{IC:1}EM180:', name='Ic1')
+    if ic1 is None or ic1.connected is False:
+        raise ConnectionError('ic1 is not connected')
     ic1.enable_electrometer()
     print(whisper('\t\t\t'+'instantiated ic1'))
     if with_ic1 is False:
@@ -176,7 +231,8 @@ except:
 
 
 try:                            # might not be in use
-    ic2 = IntegratedIC('XF:06BM-BI{IC:3}EM180:', name='Ic2')
+    if ic2 is None or ic2.connected is False:
+        raise ConnectionError('ic2 is not connected')
     ic2.enable_electrometer()
     print(whisper('\t\t\t'+'instantiated ic2'))
     if with_ic2 is False:
@@ -268,12 +324,7 @@ def display_last_image_usb_cam(catalog, camera=usb1):
 # \_|    \___/\_____/\_| |_/\_/  \___/\____/  #
 ###############################################
 
-pilatus = None
-#pilatus_tiff = None
-
-from BMM.user_ns.dwelltime import with_pilatus
-if with_pilatus is True:
-    from BMM.pilatus import BMMPilatusSingleTrigger #,  BMMPilatusTIFFSingleTrigger
+if pilatus is not None and pilatus.connected is True:
     run_report('\t'+'Pilatus')
 
     ## make sure various plugins are turned on
@@ -292,7 +343,6 @@ if with_pilatus is True:
     EpicsSignal('XF:06BMB-ES{Det:PIL100k}:Stats3:EnableCallbacks', name='').put(1)
     EpicsSignal('XF:06BMB-ES{Det:PIL100k}:Stats4:EnableCallbacks', name='').put(1)
     
-    pilatus = BMMPilatusSingleTrigger("XF:06BMB-ES{Det:PIL100k}:", name="pilatus100k-1", read_attrs=["hdf5"])
     pilatus.stats.kind = "omitted"
     pilatus.roi2.kind = "hinted"
     pilatus.roi3.kind = "hinted"
@@ -322,11 +372,6 @@ from ophyd.log import config_ophyd_logging
 import logging
 #config_ophyd_logging(file="xspress3_ophyd_debug.log", level=logging.DEBUG)
 
-xs  = None
-xs4 = None
-xs1 = None
-xs7 = None
-
 warmed_up = False
 
 def _prep_xs(det):
@@ -386,35 +431,21 @@ def _prep_xs(det):
     det.cam.stage_sigs[det.cam.trigger_mode] = "Internal"
 
     
-    
-from BMM.user_ns.dwelltime import with_xspress3, use_4element, use_1element, use_7element
 
 if with_xspress3 is True:
     run_report('\t'+'Xspress3')
 
 
-if with_xspress3 is True and use_7element is True:
+if xs7 is not None and xs7.connected is True:
     run_report('\t'+'7-element SDD with Xspress3')
-    from BMM.xspress3_7element import BMMXspress3Detector_7Element
-    xs7 = BMMXspress3Detector_7Element(prefix     = 'XF:06BM-ES{Xsp:1}:',
-                                       name       = '7-element SDD',
-                                       read_attrs = ['hdf5']    )
     _prep_xs(xs7)
 
-if with_xspress3 is True and use_1element is True:
+if xs1 is not None and xs1.connected is True:
     run_report('\t\t'+'1-element SDD')
-    from BMM.xspress3_1element import BMMXspress3Detector_1Element
-    xs1 = BMMXspress3Detector_1Element(prefix     = 'XF:06BM-ES{Xsp:1}:',
-                                       name       = '1-element SDD',
-                                       read_attrs = ['hdf5']    )
     _prep_xs(xs1)
 
-if with_xspress3 is True and use_4element is True:
+if xs4 is not None and xs4.connected is True:
     run_report('\t\t'+'4-element SDD')
-    from BMM.xspress3_4element import BMMXspress3Detector_4Element
-    xs4 = BMMXspress3Detector_4Element(prefix     = 'XF:06BM-ES{Xsp:1}:',
-                                       name       = '4-element SDD',
-                                       read_attrs = ['hdf5']    )
     _prep_xs(xs4)
 
     
@@ -1,4 +1,4 @@
-import time, json
+import json
 from BMM.functions import run_report, examine_fmbo_motor_group, error_msg
 from BMM.workspace import rkvs
 
@@ -35,14 +35,11 @@ if WITH_ENCLOSURE is True:
 # not running or a controller that is powered down (or both).          #
 ########################################################################
 from ophyd.sim import SynAxis
-def wait_for_connection(thing):
-    # give it a moment
-    count = 0
-    while thing.connected is False:
-        count += 1
-        time.sleep(0.5)
-        if count > 10:
-            break
+from BMM.connections import connections
+def wait_for_connection(*things):
+    # give it (or them, all at once) a moment
+    connections.watch(*things)
+    connections.settle()
 
 
 
@@ -62,19 +59,27 @@ run_report('\tmirrors and tables')
 from BMM.motors import XAFSEpicsMotor, Mirrors, XAFSTable, GonioTable, EndStationEpicsMotor
 from BMM.user_ns.bmm import BMMuser
 from BMM.user_ns.motors import mcs8_motors, xafs_motors, define_EndStationEpicsMotor
+from BMM.slits import Slits #, recover_slits2, recover_slits3
+
+## instantiate the mirrors, the XAFS table, and the slits, then wait
+## for all of them to connect at once
+m1 = Mirrors('XF:06BM-OP{Mir:M1-Ax:',  name='m1', mirror_length=556,  mirror_width=240)
+m2 = Mirrors('XF:06BMA-OP{Mir:M2-Ax:', name='m2', mirror_length=1288, mirror_width=240)
+m3 = Mirrors('XF:06BMA-OP{Mir:M3-Ax:', name='m3', mirror_length=667,  mirror_width=240)
+xt = xafs_table = XAFSTable('XF:06BMA-BI{XAFS-Ax:Tbl_', name='xafs_table', mirror_length=1160,  mirror_width=558)
+sl = slits3 = Slits('XF:06BM-BI{Slt:02-Ax:',  name='slits3')
+slits2 = Slits('XF:06BMA-OP{Slt:01-Ax:',  name='slits2')
+wait_for_connection(m1, m2, m3, xafs_table, slits3, slits2)
 
 
 ## collimating mirror
 print(f'{TAB}FMBO motor group: m1')
-m1 = Mirrors('XF:06BM-OP{Mir:M1-Ax:',  name='m1', mirror_length=556,  mirror_width=240)
 m1.vertical._limits = (-5.0, 5.0)
 m1.lateral._limits  = (-5.0, 5.0)
 m1.pitch._limits    = (-5.0, 5.0)
 m1.roll._limits     = (-5.0, 5.0)
 m1.yaw._limits      = (-5.0, 5.0)
 
-wait_for_connection(m1)
-
 
 
 if m1.connected is True:
@@ -96,15 +101,12 @@ mcs8_motors.extend(m1list)
 
 ## focusing mirror
 print(f'{TAB}FMBO motor group: m2')
-m2 = Mirrors('XF:06BMA-OP{Mir:M2-Ax:', name='m2', mirror_length=1288, mirror_width=240)
 m2.vertical._limits = (-6.0, 8.0)
 m2.lateral._limits  = (-2, 2)
 m2.pitch._limits    = (-0.5, 5.0)
 m2.roll._limits     = (-2, 2)
 m2.yaw._limits      = (-1, 2)
 
-wait_for_connection(m2)
-
 
 #m2_yu, m2_ydo, m2_ydi, m2_xu, m2_xd, m2_bender = None, None, None, None, None, None
 if m2.connected is True:
@@ -132,15 +134,12 @@ examine_fmbo_motor_group(m2list)
 
 ## harmonic rejection mirror
 print(f'{TAB}FMBO motor group: m3')
-m3 = Mirrors('XF:06BMA-OP{Mir:M3-Ax:', name='m3', mirror_length=667,  mirror_width=240)
 m3.vertical._limits = (-11, 1)
 m3.lateral._limits  = (-16, 16)
 m3.pitch._limits    = (-6, 6)
 m3.roll._limits     = (-2, 2)
 m3.yaw._limits      = (-1, 1)
 
-wait_for_connection(m3)
-
 #m3_yu, m3_ydo, m3_ydi, m3_xu, m3_xd = None, None, None, None, None
 if m3.connected is True:
     m3_yu     = XAFSEpicsMotor('XF:06BMA-OP{Mir:M3-Ax:YU}Mtr',   name='m3_yu')
@@ -174,8 +173,6 @@ def kill_mirror_jacks():
 
 ## XAFS table
 print(f'{TAB}XAFS table motor group')
-xt = xafs_table = XAFSTable('XF:06BMA-BI{XAFS-Ax:Tbl_', name='xafs_table', mirror_length=1160,  mirror_width=558)
-wait_for_connection(xafs_table)
 
 if xafs_table.connected is True:
     xafs_yu  = EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Tbl_YU}Mtr',  name='xafs_yu')
@@ -211,13 +208,10 @@ from BMM.mirror_trigonometry import move_m2, move_m3
                                
 
 run_report('\tslits')
-from BMM.slits import Slits #, recover_slits2, recover_slits3
 
 ## DM3
 print(f'{TAB}FMBO motor group: slits3')
-sl = slits3 = Slits('XF:06BM-BI{Slt:02-Ax:',  name='slits3')
 slits3.nominal = [7.0, 1.0, 0.0, 0.0]
-wait_for_connection(slits3)
 
 if slits3.connected is True:
     dm3_slits_o = XAFSEpicsMotor('XF:06BM-BI{Slt:02-Ax:O}Mtr',  name='dm3_slits_o')
@@ -248,14 +242,11 @@ examine_fmbo_motor_group(slits3list)
 ## DM2
 print(f'{TAB}FMBO motor group: slits2')
 
-slits2 = Slits('XF:06BMA-OP{Slt:01-Ax:',  name='slits2')
 slits2.nominal = [18.0, 1.1, 0.0, 0.6]
-slits2.top.user_offset.put(-0.038)
-slits2.bottom.user_offset.put(0.264)
-
-wait_for_connection(slits2)
 
 if slits2.connected is True:
+    slits2.top.user_offset.put(-0.038)
+    slits2.bottom.user_offset.put(0.264)
     dm2_slits_o = XAFSEpicsMotor('XF:06BMA-OP{Slt:01-Ax:O}Mtr',  name='dm2_slits_o')
     dm2_slits_i = XAFSEpicsMotor('XF:06BMA-OP{Slt:01-Ax:I}Mtr',  name='dm2_slits_i')
     dm2_slits_t = XAFSEpicsMotor('XF:06BMA-OP{Slt:01-Ax:T}Mtr',  name='dm2_slits_o')
@@ -1,12 +1,11 @@
-from ophyd.sim import SynAxis
 from ophyd import EpicsMotor, EpicsSignalRO
 from BMM.functions import run_report, error_msg, warning_msg, bold_msg, examine_fmbo_motor_group
-import time
 
 run_report(__file__, text='individual motor definitions')
 
 from BMM.motors import FMBOEpicsMotor, XAFSEpicsMotor, VacuumEpicsMotor, EndStationEpicsMotor
 from BMM.motors import EpicsMotorWithDial
+from BMM.connections import connections
 
 TAB = '\t\t\t'
 
@@ -41,23 +40,53 @@ def define_XAFSEpicsMotor(prefix, name='unnamed'):
     '''Deal gracefully with a motor whose IOC is not running or whose
     controller is turned off.  See discussion at the top of
     BMM/user_ns/instruments.py
+
+    The motor is not waited on here.  Call connections.settle() once
+    all motors are defined, which will replace any that did not
+    connect with a SynAxis.
     '''
-    this = XAFSEpicsMotor(prefix, name=name)
-    count = 0
-    while this.connected is False:  #  try for no more than 3 seconds
-        count += 1
-        time.sleep(0.5)
-        if count > 6:
-            break
-    if this.connected is False:
-        this = SynAxis(name=name)
-    return(this)
+    return connections.define(XAFSEpicsMotor, prefix, name=name)
 
+def define_EndStationEpicsMotor(prefix, name='unnamed'):
+    '''See define_XAFSEpicsMotor.'''
+    return connections.define(EndStationEpicsMotor, prefix, name=name)
 
-## DM1
-print(f'{TAB}FMBO motor group: dm1')
+def define_EpicsMotor(prefix, name='unnamed'):
+    '''See define_XAFSEpicsMotor.'''
+    return connections.define(EpicsMotor, prefix, name=name)
+
+
+## define all the motors, then wait for all of them to connect at once
 dm1_filters1 = define_XAFSEpicsMotor('XF:06BMA-BI{Fltr:01-Ax:Y1}Mtr', name='dm1_filters1')
 dm1_filters2 = define_XAFSEpicsMotor('XF:06BMA-BI{Fltr:01-Ax:Y2}Mtr', name='dm1_filters2')
+
+dm2_fs = define_XAFSEpicsMotor('XF:06BMA-BI{Diag:02-Ax:Y}Mtr', name='dm2_fs')
+
+#dm3_fs      = XAFSEpicsMotor('XF:06BM-BI{FS:03-Ax:Y}Mtr',   name='dm3_fs')
+dm3_fs    = define_XAFSEpicsMotor('XF:06BM-BI{FS:03-Ax:Y}Mtr',   name='dm3_fs')
+dm3_foils = define_XAFSEpicsMotor('XF:06BM-BI{Fltr:01-Ax:Y}Mtr', name='dm3_foils')
+dm3_bct   = define_XAFSEpicsMotor('XF:06BM-BI{BCT-Ax:Y}Mtr',     name='dm3_bct')
+dm3_bpm   = define_XAFSEpicsMotor('XF:06BM-BI{BPM:1-Ax:Y}Mtr',   name='dm3_bpm')
+
+#xafs_wheel = xafs_rotb  = EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:RotB}Mtr',  name='xafs_wheel')
+#xafs_roth  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:RotH}Mtr',  name='xafs_roth')
+xafs_rots  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:RotS}Mtr',  name='xafs_rots')
+#xafs_det   = xafs_lins  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinS}Mtr',  name='xafs_det')
+xafs_det   = EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Tbl_XD}Mtr',  name='xafs_det')
+xafs_linxs = xafs_refy  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinXS}Mtr', name='xafs_refy')
+xafs_refx  = define_EpicsMotor('XF:06BMA-BI{XAFS-Ax:RefX}Mtr', name='xafs_refx')
+xafs_x     = xafs_linx  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinX}Mtr',  name='xafs_x')
+xafs_y     = xafs_liny  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinY}Mtr',  name='xafs_y')
+xafs_roll  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Pitch}Mtr', name='xafs_roll') # note: the way this stage gets mounted, the
+xafs_pitch = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Roll}Mtr',  name='xafs_pitch') # EPICS names are swapped.  sigh....
+
+xafs_garot = xafs_mtr8  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Mtr8}Mtr',  name='xafs_garot') # EPICS names are swapped.
+
+connections.settle(globals())
+
+
+## DM1
+print(f'{TAB}FMBO motor group: dm1')
 dm1list = [dm1_filters1, dm1_filters2]
 mcs8_motors.extend(dm1list)
 if 'XAFSEpicsMotor' in str(type(dm1_filters2)):
@@ -68,7 +97,6 @@ examine_fmbo_motor_group(dm1list)
 
 ## DM3
 print(f'{TAB}FMBO motor group: dm2')  # it's not a big group... :/
-dm2_fs = define_XAFSEpicsMotor('XF:06BMA-BI{Diag:02-Ax:Y}Mtr', name='dm2_fs')
 if 'XAFSEpicsMotor' in str(type(dm2_fs)):
     dm2_fs.hvel_sp.put(0.0005)
 mcs8_motors.append(dm2_fs)
@@ -78,12 +106,6 @@ examine_fmbo_motor_group([dm2_fs])
 
 ## DM3
 print(f'{TAB}FMBO motor group: dm3')
-#dm3_fs      = XAFSEpicsMotor('XF:06BM-BI{FS:03-Ax:Y}Mtr',   name='dm3_fs')
-dm3_fs    = define_XAFSEpicsMotor('XF:06BM-BI{FS:03-Ax:Y}Mtr',   name='dm3_fs')
-dm3_foils = define_XAFSEpicsMotor('XF:06BM-BI{Fltr:01-Ax:Y}Mtr', name='dm3_foils')
-dm3_bct   = define_XAFSEpicsMotor('XF:06BM-BI{BCT-Ax:Y}Mtr',     name='dm3_bct')
-dm3_bpm   = define_XAFSEpicsMotor('XF:06BM-BI{BPM:1-Ax:Y}Mtr',   name='dm3_bpm')
-
 dm3list = [dm3_fs, dm3_foils, dm3_bct, dm3_bpm]
 mcs8_motors.extend(dm3list)
 examine_fmbo_motor_group(dm3list)
@@ -110,58 +132,9 @@ if 'XAFSEpicsMotor' in str(type(dm3_foils)):
     dm3_foils.hvel_sp.put(0.05)
 
 
-
-
-def define_EndStationEpicsMotor(prefix, name='unnamed'):
-    '''Deal gracefully with a motor whose IOC is not running or whose
-    controller is turned off.  See discussion at the top of
-    BMM/user_ns/instruments.py
-    '''
-    this = EndStationEpicsMotor(prefix, name=name)
-    count = 0
-    while this.connected is False:  #  try for no more than 3 seconds
-        count += 1
-        time.sleep(0.5)
-        if count > 6:
-            break
-    if this.connected is False:
-        this = SynAxis(name=name)
-    return(this)
-
-
-def define_EpicsMotor(prefix, name='unnamed'):
-    '''Deal gracefully with a motor whose IOC is not running or whose
-    controller is turned off.  See discussion at the top of
-    BMM/user_ns/instruments.py
-    '''
-    this = EpicsMotor(prefix, name=name)
-    count = 0
-    while this.connected is False:  #  try for no more than 3 seconds
-        count += 1
-        time.sleep(0.5)
-        if count > 6:
-            break
-    if this.connected is False:
-        this = SynAxis(name=name)
-    return(this)
-
     
 ## XAFS stages
 print(f'{TAB}XAFS stages motor group')
-#xafs_wheel = xafs_rotb  = EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:RotB}Mtr',  name='xafs_wheel')
-#xafs_roth  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:RotH}Mtr',  name='xafs_roth')
-xafs_rots  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:RotS}Mtr',  name='xafs_rots')
-#xafs_det   = xafs_lins  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinS}Mtr',  name='xafs_det')
-xafs_det   = EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Tbl_XD}Mtr',  name='xafs_det')
-xafs_linxs = xafs_refy  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinXS}Mtr', name='xafs_refy')
-xafs_refx  = define_EpicsMotor('XF:06BMA-BI{XAFS-Ax:RefX}Mtr', name='xafs_refx')
-xafs_x     = xafs_linx  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinX}Mtr',  name='xafs_x')
-xafs_y     = xafs_liny  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:LinY}Mtr',  name='xafs_y')
-xafs_roll  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Pitch}Mtr', name='xafs_roll') # note: the way this stage gets mounted, the
-xafs_pitch = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Roll}Mtr',  name='xafs_pitch') # EPICS names are swapped.  sigh....
-
-xafs_garot = xafs_mtr8  = define_EndStationEpicsMotor('XF:06BMA-BI{XAFS-Ax:Mtr8}Mtr',  name='xafs_garot') # EPICS names are swapped.
-
 #xafs_linxs.hlm.put(30)
 #xafs_linxs.llm.put(10)
 xafs_linx.kill_cmd.kind = 'config'
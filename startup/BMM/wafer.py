@@ -86,7 +86,7 @@ class Wafer():
             motor = user_ns['xafs_liny']
         uid = yield from linescan(motor, 'it', -2, 2, 41, dopluck=False)
         kafka_message({'close': 'last'})
-        table  = user_ns['db'][-1].table()
+        table  = user_ns['recent'][-1].table()
         yy     = table[motor.name]
         signal = table['It']/table['I0']
         if float(signal[2]) > list(signal)[-2] :
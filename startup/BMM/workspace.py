@@ -16,6 +16,10 @@ class NoRedis():
         return None
     def get(self, thing):
         return None
+    def mset(self, mapping):
+        return None
+    def mget(self, things):
+        return [None] * len(things)
     
 ###################################################################
 # things that are configurable                                    #
@@ -1,6 +1,7 @@
 from bluesky.plans import scan_nd, count
-from bluesky.plan_stubs import sleep, mv, null
-from bluesky.preprocessors import subs_decorator, finalize_wrapper
+from bluesky.plan_stubs import sleep, mv, null, abs_set, trigger_and_read
+from bluesky.preprocessors import subs_decorator, finalize_wrapper, stage_decorator, run_decorator
+from ophyd.sim import SynAxis
 #from databroker.core import SingleRunCache
 
 import numpy, os, re, shutil, uuid, time
@@ -18,7 +19,7 @@ from BMM.dossier         import DossierTools
 from BMM.functions       import countdown, boxedtext, now, isfloat, inflect, e2l, etok, ktoe, present_options, plotting_mode
 from BMM.functions       import PROMPT, DEFAULT_INI, proposal_base, PROMPTNC, animated_prompt
 from BMM.functions       import error_msg, warning_msg, go_msg, url_msg, bold_msg, verbosebold_msg, list_msg, disconnected_msg, info_msg, whisper
-from BMM.kafka           import kafka_message, close_plots
+from BMM.kafka           import kafka_message, kafka_request, kafka_flush, close_plots, tiled_catchup
 from BMM.linescans       import rocking_curve
 from BMM.logging         import BMM_log_info, BMM_msg_hook, report
 from BMM.metadata        import bmm_metadata, display_XDI_metadata, metadata_at_this_moment
@@ -28,11 +29,13 @@ from BMM.periodictable   import edge_energy, Z_number, element_name
 from BMM.resting_state   import resting_state_plan
 from BMM.suspenders      import BMM_suspenders, BMM_clear_to_start, BMM_clear_suspenders
 from BMM.xafs_functions  import conventional_grid, sanitize_step_scan_parameters
+from BMM_common.file_index import find_next_index, find_files, folder_is_local
+from BMM_common.flygrid    import cell_edges
 
 from BMM import user_ns as user_ns_module
 user_ns = vars(user_ns_module)
 
-from BMM.user_ns.base      import bmm_catalog, WORKSPACE
+from BMM.user_ns.base      import bmm_catalog, WORKSPACE, recent
 from BMM.user_ns.dwelltime import _locked_dwell_time, use_7element, use_4element, use_1element
 from BMM.user_ns.detectors import quadem1, xs, xs1, xs4, xs7, ic0, ic1, ic2, pilatus, ION_CHAMBERS
 
@@ -48,15 +51,14 @@ except ImportError:
 
 
 
-def next_index(folder=None, stub=None, maxtries=15, verbose=False):
+def next_index(folder=None, stub=None, timeout=5, verbose=False):
     '''Find the next numeric filename extension for a filename stub in the
     specified folder in the proposals directory.
 
-    This sends a message over kafka asking the file manager worker to
-    search for the next index.  The worker posts the value to redis.
-    This function sets that redis key to "None" and polls the
-    appropriate redis key for a value interpretable integer.
-   
+    If the folder is readable from here, look directly.  Otherwise,
+    send a request over kafka asking the file manager worker to
+    search for the next index and wait for its reply.
+
     arguments
     =========
     folder: (str)
@@ -65,11 +67,11 @@ def next_index(folder=None, stub=None, maxtries=15, verbose=False):
     stub: (str)
       filename stub to check, i.e. filename without extension
 
-    maxtries: (int)
-      maximum number of attempts to read before giving up and returning None
+    timeout: (float)
+      seconds to wait for the worker before giving up and returning None
 
     verbose: (bool)
-      if True, be noisy as we wait for a result
+      if True, be noisy about how the answer was found
 
     '''
     if folder is None:
@@ -77,31 +79,28 @@ def next_index(folder=None, stub=None, maxtries=15, verbose=False):
     if stub is None:
         print(error_msg('No stub supplied to next_index'))
         return(None)
-    rkvs = user_ns['rkvs']
-    rkvs.set('BMM:next_index', 'None')
-    kafka_message({'next_index': True, 'folder': folder, 'stub': stub})
-    answer = rkvs.get('BMM:next_index').decode('utf8')
-    count = 0
-    if verbose: print(f"{count = }, {answer = }")
-    while answer == 'None':
-        time.sleep(0.1)
-        answer = rkvs.get('BMM:next_index').decode('utf8')
-        count += 1
-        if verbose: print(f"{count = }, {answer = }")
-        if count > maxtries:
-            return(None)
+    if folder_is_local(folder):
+        try:
+            answer = find_next_index(folder, stub)
+            if verbose: print(f"{answer = } (local)")
+            return answer
+        except OSError:
+            pass
+    answer = kafka_request({'next_index': True, 'folder': folder, 'stub': stub}, timeout=timeout)
+    if verbose: print(f"{answer = } (file manager)")
+    if answer is None:
+        return(None)
     return int(answer)
 
 
-def file_exists(folder=None, filename=None, start=1, stop=2, maxtries=15, number=True, verbose=False):
+def file_exists(folder=None, filename=None, start=1, stop=2, timeout=5, number=True, verbose=False):
     '''Determine if a file of the specified filename exists in specified
     folder in the proposals directory.
 
-    This sends a message over kafka asking the file manager worker to
-    search for the file.  The worker posts "true" or "false" to redis.
-    This function sets that redis key to "None" and polls the
-    appropriate redis key for a "true"/"false" value.
-   
+    If the folder is readable from here, look directly.  Otherwise,
+    send a request over kafka asking the file manager worker to
+    search for the file and wait for its reply.
+
     arguments
     =========
     folder: (str)
@@ -116,14 +115,14 @@ def file_exists(folder=None, filename=None, start=1, stop=2, maxtries=15, number
     stop: (int)
       end of extension number range to check
 
-    maxtries: (int)
-      maximum number of attempts to read before giving up and returning None
+    timeout: (float)
+      seconds to wait for the worker before giving up and returning None
 
     number: (bool)
       if True, search for numbered extensions.  if False, search for filename as specified
 
     verbose: (bool)
-      if True, be noisy as we wait for a result
+      if True, be noisy about how the answer was found
 
     '''
     if folder is None:
@@ -131,23 +130,39 @@ def file_exists(folder=None, filename=None, start=1, stop=2, maxtries=15, number
     if filename is None:
         print(error_msg('No filename supplied to file_exists'))
         return(None)
-    rkvs = user_ns['rkvs']
-    rkvs.set('BMM:file_exists', 'None')
-    kafka_message({'file_exists': True, 'folder': folder, 'filename': filename, 'start': start, 'stop': stop, 'number': number})
-    answer = rkvs.get('BMM:file_exists').decode('utf8')
-    count = 0
-    if verbose: print(f"{count = }, {answer = }")
-    while answer == 'None':
-        time.sleep(0.1)
-        answer = rkvs.get('BMM:file_exists').decode('utf8')
-        count += 1
-        if verbose: print(f"{count = }, {answer = }")
-        if count > maxtries:
-            return(None)
-    if answer == 'true':
-        return True
-    else:
-        return False
+    answer = files_exist(folder, [{'filename': filename, 'start': start, 'stop': stop, 'number': number}],
+                         timeout=timeout, verbose=verbose)
+    if answer is None:
+        return(None)
+    return answer[0]
+
+
+def files_exist(folder=None, checks=None, timeout=5, verbose=False):
+    '''Answer several file_exists questions about one folder at once.
+
+    checks is a list of dicts, each with the keys filename, start,
+    stop, and number, as for the arguments of file_exists.  Return a
+    list of booleans in the same order, or None if the file manager
+    did not answer within timeout seconds.
+
+    >>> files_exist(checks=[{'filename': 'Fe-foil', 'start': 1, 'stop': 3, 'number': True},
+    ...                     {'filename': 'maps/Fe-foil-01.png', 'start': 1, 'stop': 1, 'number': False}])
+
+    '''
+    if folder is None:
+        folder = proposal_base()
+    if checks is None or len(checks) == 0:
+        return []
+    if folder_is_local(folder):
+        try:
+            answer = [find_files(folder, c['filename'], c['start'], c['stop'], c['number'])[0] for c in checks]
+            if verbose: print(f"{answer = } (local)")
+            return answer
+        except OSError:
+            pass
+    answer = kafka_request({'files_exist': True, 'folder': folder, 'checks': checks}, timeout=timeout)
+    if verbose: print(f"{answer = } (file manager)")
+    return answer
     
 
 
@@ -216,6 +231,8 @@ def scan_metadata(inifile=None, **kwargs):
         True = measure in pseudo-channel-cut mode
     ththth : bool
         True = measure using the Si(333) reflection
+    continuous : bool
+        True = sweep the mono continuously rather than stepping
     mode : str
         transmission, fluorescence, or reference -- how to display the data
     bounds : list
@@ -344,7 +361,7 @@ def scan_metadata(inifile=None, **kwargs):
             found[a] = True
 
     ## ----- booleans
-    for a in ('snapshots', 'htmlpage', 'lims', 'bothways', 'channelcut', 'usbstick', 'rockingcurve', 'ththth', 'shutter'):
+    for a in ('snapshots', 'htmlpage', 'lims', 'bothways', 'channelcut', 'usbstick', 'rockingcurve', 'ththth', 'shutter', 'continuous'):
         found[a] = False
         if a not in kwargs:
             try:
@@ -488,14 +505,186 @@ def xas2xdi(datafile, key):
     >>> xas2xdi('/path/to/myfile.xdi', '0783ac3a-658b-44b0-bba5-ed4e0c4e7216')
 
     '''
+    tiled_catchup()
     kafka_message({'xasxdi': True, 'uid' : key, 'filename': datafile})
     print(bold_msg('wrote %s' % dfile))
 
 
+def reintegrate_rois(uids, rois, tag=None, deadtime=True):
+    '''
+    Re-integrate fluorescence ROIs from the Xspress3 spectra saved with
+    a list of XAFS scans and write new XDI files alongside the
+    originals.  The work is done by the file manager, across a pool of
+    processes.
+
+    Parameters
+    ----------
+    uids : list of str
+        UIDs of the XAFS scans
+    rois : list
+        element symbols, (element, edge) pairs looked up in rois.json,
+        or (name, low, high) custom ROIs in units of 10 eV bins
+    tag : str
+        added to the stem of each new file name, default is the ROI names
+    deadtime : bool
+        apply the dead-time correction from the Xspress3 scalers
+
+    Examples
+    --------
+    >>> reintegrate_rois(uidlist, ['Mn'])
+    >>> reintegrate_rois(uidlist, [('Pb', 'l2'), ('FeKb', 700, 720)], tag='test')
+
+    '''
+    kafka_message({'reintegrate': True, 'uids': list(uids), 'rois': list(rois), 'tag': tag, 'deadtime': deadtime})
+
+
 
 #########################
 # -- the main XAFS scan #
 #########################
+def energy_segments(rates, time_grid, maxpoints=25, tolerance=0.1):
+    '''Divide an energy grid into segments to be swept at constant
+    velocity in a continuous-energy scan.  rates is the velocity
+    needed to cross each cell of the grid in its dwell time.  A
+    segment ends when the rate or the dwell time differs by more than
+    tolerance from that of the first cell of the segment, or when the
+    segment is maxpoints long.  Return a list of (first, last) index
+    pairs, with last exclusive.
+    '''
+    segments, first = [], 0
+    for i in range(1, len(rates)):
+        if abs(rates[i]/rates[first] - 1) > tolerance or abs(time_grid[i]/time_grid[first] - 1) > tolerance or i - first >= maxpoints:
+            segments.append((first, i))
+            first = i
+    segments.append((first, len(rates)))
+    return segments
+
+
+def sweep_segments(energy_grid, time_grid, e2a=None, maxpoints=25):
+    '''Return the cell edges of an energy grid and the segments in
+    which a continuous-energy scan sweeps it, see energy_segments.
+    Each segment is [first, last, target energy, velocity, time bin].
+    The velocity is in Bragg angle per second or, without e2a, in
+    energy per second.
+    '''
+    energy_grid = numpy.asarray(energy_grid, dtype=float)
+    time_grid   = numpy.asarray(time_grid,   dtype=float)
+    edges       = cell_edges(energy_grid)
+    if e2a is None:
+        widths  = numpy.abs(numpy.diff(edges))
+    else:
+        widths  = numpy.abs(numpy.diff([e2a(e) for e in edges]))
+    segments    = []
+    for first, last in energy_segments(widths/time_grid, time_grid, maxpoints):
+        duration = float(time_grid[first:last].sum())
+        segments.append([first, last, float(edges[last]), float(widths[first:last].sum())/duration, duration/(last-first)])
+    return edges, segments
+
+
+def sweep_bins(segments, ramp=0, margin=0.1):
+    '''Return the largest number of time bins expected in a
+    continuous-energy scan: for each segment, the time to sweep it
+    plus the time for the mono to speed up and slow down, in bins of
+    that segment's length, with a fractional margin and a couple of
+    spare bins.  Compare BMM.areascan.fly_bins.
+    '''
+    return sum(int(numpy.ceil((tbin*(last-first) + 2*ramp) / tbin * (1 + margin))) + 2
+               for first, last, target, velocity, tbin in segments)
+
+
+def continuous_energy_scan(detectors, energy, energy_grid, time_grid, dwell=None, bragg=None, e2a=None, md={}, maxpoints=25):
+    '''Continuous-energy XAFS scan.  Rather than moving to, settling
+    at, then measuring each point of the energy grid, the energy is
+    swept continuously while the detectors are read in time bins.
+
+    Each point of the grid is the center of a cell extending halfway
+    to its neighbors.  The grid is divided into segments (see
+    energy_segments) and each segment is swept at the constant Bragg
+    angle velocity which traverses each of its cells in the dwell
+    time of that cell.  Within a segment, the time bin is the average
+    dwell time of its points.  In k-space regions, short segments
+    approximate the changing velocity profile.  The mono comes to a
+    stop at the end of each segment, since a motor velocity cannot be
+    changed during a move.
+
+    Each event is one time bin, read at the end of the bin, and holds
+    the detector readings, the energy readback, and the dwell time.
+    The bins are rebinned onto the energy grid afterwards, see
+    BMM_common.flygrid.rebin_energy, which is how the XDI file is made.
+
+    This works with ophyd.sim devices, so throughput can be measured
+    without hardware.  If energy is a SynAxis, the duration of each
+    segment is set by its delay.  It moves at constant velocity if
+    made with many events per move, e.g.
+
+       en = SynAxis(name='dcm_energy', events_per_move=200)
+
+    arguments
+    =========
+    detectors : list of readable devices
+    energy : energy positioner, dcm.energy or a SynAxis
+    energy_grid, time_grid : from conventional_grid, in the order to be measured
+    dwell : dwell time positioner, None for simulated detectors
+    bragg : Bragg axis motor, whose velocity is set for each segment
+    e2a : function converting energy to Bragg angle
+    md : metadata dictionary
+    maxpoints : longest segment, in points [25]
+    '''
+    energy_grid = numpy.asarray(energy_grid, dtype=float)
+    time_grid   = numpy.asarray(time_grid,   dtype=float)
+    direction   = 1 if energy_grid[-1] >= energy_grid[0] else -1
+    simulated   = isinstance(energy, SynAxis)
+    edges, segments = sweep_segments(energy_grid, time_grid, None if simulated else e2a, maxpoints)
+    readables = list(detectors) + [energy] + ([dwell] if dwell is not None else [])
+
+    _md = {'detectors'   : [d.name for d in detectors],
+           'motors'      : [energy.name],
+           'num_points'  : len(energy_grid),
+           'plan_name'   : 'continuous_energy_scan',
+           'plan_pattern': 'fly',
+           'flyenergy'   : {'energy_grid' : energy_grid.tolist(),
+                            'time_grid'   : time_grid.tolist(),
+                            'direction'   : direction,
+                            'segments'    : segments},
+           'hints'       : {'dimensions': [([energy.name], 'primary')]},
+           }
+    _md.update(md)
+
+    if simulated:
+        initial = energy.delay
+    else:
+        initial = bragg.velocity.get()
+
+    def sweep_speed(segment=None):
+        if simulated:
+            energy.delay = initial if segment is None else segment[4]*(segment[1]-segment[0])
+            yield from null()
+        else:
+            yield from mv(bragg.velocity, initial if segment is None else segment[3])
+
+    @stage_decorator(readables)
+    @run_decorator(md=_md)
+    def sweep():
+        yield from mv(energy, edges[0])
+        for segment in segments:
+            first, last, target, velocity, tbin = segment
+            if dwell is not None:
+                yield from mv(dwell, tbin)
+            yield from sweep_speed(segment)
+            status = yield from abs_set(energy, target)
+            began = time.monotonic()
+            while not status.done:
+                ## an ion chamber integrating for tbin on trigger needs no pacing, a detector which reads instantly does
+                wait = tbin - (time.monotonic() - began)
+                if wait > 0:
+                    yield from sleep(wait)
+                began = time.monotonic()
+                yield from trigger_and_read(readables)
+            yield from sweep_speed()
+
+    return (yield from finalize_wrapper(sweep(), sweep_speed()))
+
+
 def xafs(inifile=None, **kwargs):
     '''
     Read an INI file for scan matadata, then perform an XAFS scan sequence.
@@ -624,7 +813,7 @@ def xafs(inifile=None, **kwargs):
             #     return
 
 
-        ## sometimes the kafka-redis-while loop in next_index() fails, give it another go
+        ## if the file manager did not answer in time, give it another go
         nicount = 0
         while p['start'] is None:
             report(f":bangbang: p['start']=next_index() returned None, retrying ({nicount})", slack=True)
@@ -836,10 +1025,16 @@ def xafs(inifile=None, **kwargs):
 
             ## --*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--
             ## make sure XSpress3 IOC knows how many data points to measure
+            ## a continuous scan reads time bins while the mono sweeps each segment and while it
+            ## speeds up and slows down, in either direction if measuring both ways
+            npoints = len(energy_grid)
+            if p['continuous']:
+                npoints = max(sweep_bins(sweep_segments(grid, times, dcm.e2a)[1], ramp=BMMuser.acc_fast)
+                              for grid, times in ((energy_grid, time_grid), (energy_grid[::-1], time_grid[::-1])))
             if plotting_mode(p['mode']) in ('xs', 'yield', 'fluo+yield', 'fluo+pilatus'):
-                yield from mv(xs.total_points, len(energy_grid))
+                yield from mv(xs.total_points, npoints)
             if plotting_mode(p['mode']) == 'xs1':
-                yield from mv(xs1.total_points, len(energy_grid))
+                yield from mv(xs1.total_points, npoints)
             ## xs4 vs xs7
 
                 
@@ -981,8 +1176,7 @@ def xafs(inifile=None, **kwargs):
 
                 ## --*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--
                 ## compute trajectory
-                energy_trajectory    = cycler(dcm.energy, energy_grid)
-                dwelltime_trajectory = cycler(dwell_time, time_grid)
+                scan_energy, scan_time = energy_grid, time_grid
 
                 ## --*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--
                 ## need to set certain metadata items on a per-scan basis... temperatures, ring stats
@@ -990,8 +1184,7 @@ def xafs(inifile=None, **kwargs):
                 
                 md['Mono']['direction'] = 'forward'
                 if p['bothways'] and cnt%2 == 0:
-                    energy_trajectory    = cycler(dcm.energy, energy_grid[::-1])
-                    dwelltime_trajectory = cycler(dwell_time, time_grid[::-1])
+                    scan_energy, scan_time = energy_grid[::-1], time_grid[::-1]
                     md['Mono']['direction'] = 'backward'
                     yield from attain_energy_position(energy_grid[-1]+5)
                     #dcm_bragg.clear_encoder_loss()
@@ -1012,19 +1205,19 @@ def xafs(inifile=None, **kwargs):
                     #yield from mv(xs.cam.acquire_time, time_grid[0])
                     #yield from mv(xs.Acquire, 1)
                     yield from mv(xs.spectra_per_point, 1) 
-                    yield from mv(xs.total_points, len(energy_grid))
+                    yield from mv(xs.total_points, npoints)
                     hdf5_uid = xs.hdf5.file_name.value
                 if plotting_mode(p['mode']) == 'xs1':
                     #yield from mv(xs1.cam.acquire_time, time_grid[0])
                     #yield from mv(xs1.Acquire, 1)
                     yield from mv(xs1.spectra_per_point, 1) 
-                    yield from mv(xs1.total_points, len(energy_grid))
+                    yield from mv(xs1.total_points, npoints)
                     hdf5_uid = xs1.hdf5.file_name.value
                 if 'pilatus' in p['mode']:
                     ## the next line does not work.  gets overridden by stage_sigs when staged :(
                     #yield from mv(pilatus.hdf5.num_capture, len(energy_grid))
                     ## this seems ugly and too far in the weeds, but it works
-                    pilatus.hdf5.stage_sigs['num_capture'] = len(energy_grid)
+                    pilatus.hdf5.stage_sigs['num_capture'] = npoints
                 
                 rightnow = metadata_at_this_moment() # see metadata.py
                 for family in rightnow.keys():       # transfer rightnow to md
@@ -1054,7 +1247,12 @@ def xafs(inifile=None, **kwargs):
                 xdi = {'XDI': md}
                 
                 ## --*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--*--
-                ## call the stock scan_nd plan with the correct detectors
+                ## call the stock scan_nd plan, or sweep continuously, with the correct detectors
+                def energy_scan(detectors, md):
+                    if p['continuous']:
+                        return (yield from continuous_energy_scan(detectors, dcm.energy, scan_energy, scan_time, dwell=dwell_time,
+                                                                  bragg=dcm_bragg, e2a=dcm.e2a, md=md))
+                    return (yield from scan_nd(detectors, cycler(dcm.energy, scan_energy) + cycler(dwell_time, scan_time), md=md))
                 uid = None
                 more_kafka = {'filename': p["filename"],
                               'folder': BMMuser.folder,
@@ -1065,30 +1263,30 @@ def xafs(inifile=None, **kwargs):
                 kafka_message({'xafsscan': 'next',
                                'count': cnt })
                 if any(md in p['mode'] for md in ('trans', 'ref', 'test')):
-                    uid = yield from scan_nd([*ION_CHAMBERS], energy_trajectory + dwelltime_trajectory,
-                                             md={**xdi, **supplied_metadata, 'plan_name' : f'scan_nd xafs {p["mode"]}',
-                                                 'BMM_kafka': { 'hint': f'xafs {p["mode"]}', **more_kafka }})
+                    uid = yield from energy_scan([*ION_CHAMBERS],
+                                                 md={**xdi, **supplied_metadata, 'plan_name' : f'scan_nd xafs {p["mode"]}',
+                                                     'BMM_kafka': { 'hint': f'xafs {p["mode"]}', **more_kafka }})
                 ## xs4 vs xs7
                 elif plotting_mode(p['mode']) == 'xs':
-                    uid = yield from scan_nd([*ION_CHAMBERS, xs], energy_trajectory + dwelltime_trajectory,
-                                             md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs fluorescence',
-                                                 'BMM_kafka': { 'hint':  'xafs xs', **more_kafka }})
+                    uid = yield from energy_scan([*ION_CHAMBERS, xs],
+                                                 md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs fluorescence',
+                                                     'BMM_kafka': { 'hint':  'xafs xs', **more_kafka }})
                 elif plotting_mode(p['mode']) == 'xs1':
-                    uid = yield from scan_nd([*ION_CHAMBERS, xs1], energy_trajectory + dwelltime_trajectory,
-                                             md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs fluorescence',
-                                                 'BMM_kafka': { 'hint':  'xafs xs1', **more_kafka }})
+                    uid = yield from energy_scan([*ION_CHAMBERS, xs1],
+                                                 md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs fluorescence',
+                                                     'BMM_kafka': { 'hint':  'xafs xs1', **more_kafka }})
                 elif plotting_mode(p['mode']) == 'fluo+yield':
-                    uid = yield from scan_nd([*ION_CHAMBERS, xs], energy_trajectory + dwelltime_trajectory,
-                                             md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs yield + fluorescence',
-                                                 'BMM_kafka': { 'hint':  'xafs yield', **more_kafka }})
+                    uid = yield from energy_scan([*ION_CHAMBERS, xs],
+                                                 md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs yield + fluorescence',
+                                                     'BMM_kafka': { 'hint':  'xafs yield', **more_kafka }})
                 elif plotting_mode(p['mode']) == 'fluo+pilatus':
-                    uid = yield from scan_nd([*ION_CHAMBERS, xs, pilatus], energy_trajectory + dwelltime_trajectory,
-                                             md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs fluorescence + pilatus',
-                                                 'BMM_kafka': { 'hint':  'xafs fluo+pilatus', **more_kafka }})
+                    uid = yield from energy_scan([*ION_CHAMBERS, xs, pilatus],
+                                                 md={**xdi, **supplied_metadata, 'plan_name' : 'scan_nd xafs fluorescence + pilatus',
+                                                     'BMM_kafka': { 'hint':  'xafs fluo+pilatus', **more_kafka }})
                 elif plotting_mode(p['mode']) == 'yield':
-                    uid = yield from scan_nd([*ION_CHAMBERS, xs], energy_trajectory + dwelltime_trajectory,
-                                             md={**xdi, **supplied_metadata, 'plan_name' : f'scan_nd xafs {p["mode"]}',
-                                                 'BMM_kafka': { 'hint': f'xafs {p["mode"]}', **more_kafka }})
+                    uid = yield from energy_scan([*ION_CHAMBERS, xs],
+                                                 md={**xdi, **supplied_metadata, 'plan_name' : f'scan_nd xafs {p["mode"]}',
+                                                     'BMM_kafka': { 'hint': f'xafs {p["mode"]}', **more_kafka }})
                 
                 else:
                     print(error_msg('No valid plotting mode provided!'))
@@ -1100,10 +1298,11 @@ def xafs(inifile=None, **kwargs):
                     hdf5_uid = xs.hdf5.file_name.value
                     
                 uidlist.append(uid)
+                tiled_catchup()
                 kafka_message({'xasxdi': True, 'uid' : uid, 'filename': os.path.basename(datafile)})
                 print(bold_msg('wrote %s' % datafile))
                 if not is_re_worker_active():
-                    BMM_log_info(f'energy scan finished, uid = {uid}, scan_id = {bmm_catalog[uid].metadata["start"]["scan_id"]}\ndata file written to {datafile}')
+                    BMM_log_info(f'energy scan finished, uid = {uid}, scan_id = {recent.lookup(uid, bmm_catalog).metadata["start"]["scan_id"]}\ndata file written to {datafile}')
                 else:
                     BMM_log_info(f'energy scan finished, uid = {uid}\ndata file written to {datafile}')
                     
@@ -1145,9 +1344,13 @@ def xafs(inifile=None, **kwargs):
         if not is_re_worker_active():
             how = 'finished  :tada:'
             try:
-                if 'primary' not in bmm_catalog[-1].metadata['stop']['num_events']:
+                if 'primary' not in recent[-1].metadata['stop']['num_events']:
                     how = '*stopped*  :warning:'
-                elif bmm_catalog[-1].metadata['stop']['num_events']['primary'] != bmm_catalog[-1].metadata['start']['num_points']:
+                elif 'flyenergy' in recent[-1].metadata['start']:
+                    ## a continuous sweep records one event per time bin, not per energy point
+                    if recent[-1].metadata['stop']['exit_status'] != 'success':
+                        how = '*stopped*  :warning:'
+                elif recent[-1].metadata['stop']['num_events']['primary'] != recent[-1].metadata['start']['num_points']:
                     how = '*stopped*  :warning:'
             except:
                 how = '*stopped*  :warning:'
@@ -1156,12 +1359,14 @@ def xafs(inifile=None, **kwargs):
         if BMMuser.final_log_entry is True:
             report(f'== XAFS scan sequence {how}', level='bold', slack=True)
             if not is_re_worker_active():
-                BMM_log_info(f'most recent uid = {bmm_catalog[-1].metadata["start"]["uid"]}, scan_id = {bmm_catalog[-1].metadata["start"]["scan_id"]}')
+                BMM_log_info(f'most recent uid = {recent[-1].metadata["start"]["uid"]}, scan_id = {recent[-1].metadata["start"]["scan_id"]}')
             else:
                 pass
 
+            tiled_catchup()
             kafka_message({'dossier' : 'set', 'uidlist' : uidlist, })
             kafka_message({'dossier' : 'write', })
+            kafka_flush()
             time.sleep(3.0)
 
         if len(uidlist) > 0:
@@ -1173,6 +1378,7 @@ def xafs(inifile=None, **kwargs):
                 #kafka_message({'xafs_sequence':'stop', 'filename': os.path.join(BMMuser.folder, 'snapshots', f'{basename}.png')})
                 kafka_message({'xafsscan': 'stop', 'filename': f'snapshots/{basename}_liveplot.png', 'uid': uidlist[0]})
                 kafka_message({'xafs_sequence':'stop', 'filename': f'snapshots/{basename}.png'})
+        kafka_flush()
                 
         dcm.mode = 'fixed'
         yield from resting_state_plan()
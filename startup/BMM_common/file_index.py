@@ -0,0 +1,39 @@
+import os, re
+
+
+def find_next_index(folder, stub):
+    '''Find the next numeric filename extension for a filename stub in folder.'''
+    listing = os.listdir(folder)
+    r = re.compile(re.escape(stub) + r'\.\d+')
+    results = sorted(list(filter(r.match, listing)))
+    if len(results) == 0:
+        return 1
+    return int(results[-1][-3:]) + 1
+
+
+def find_files(folder, filename, start, stop, number):
+    '''Look for a file of the supplied name in the supplied folder.
+
+    If number is True, look for each of the numbered extensions from
+    start to stop, inclusive.  Otherwise, look for filename as given.
+
+    Return a tuple of a boolean, True if anything was found, and a
+    list of the filenames found.
+    '''
+    target = os.path.join(folder, filename)
+    found, text = False, []
+    if number is True:
+        for i in range(start, stop+1, 1):
+            if os.path.isfile(f'{target}.{i:03d}'):
+                found = True
+                text.append(f'{filename}.{i:03d}')
+    else:
+        if os.path.isfile(target):
+            found = True
+            text.append(filename)
+    return found, text
+
+
+def folder_is_local(folder):
+    '''Return True if folder can be read directly from this machine.'''
+    return os.path.isdir(folder) and os.access(folder, os.R_OK | os.X_OK)
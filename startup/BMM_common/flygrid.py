@@ -0,0 +1,182 @@
+import numpy
+
+
+def is_fly(start):
+    '''True if the start document is from a fly (continuous motion) area scan.'''
+    return 'fly' in start
+
+
+def fly_positions(start, time, fast, slow):
+    '''Return the fast axis position at the center of each time bin of
+    a fly scan.
+
+    Each event of a fly scan is read at the end of a time bin of
+    length dwell.  The fast axis readback recorded with each event,
+    along with the event time, samples the trajectory of the fast
+    axis.  The center of each bin is interpolated from those samples,
+    one row at a time.
+
+    arguments
+    =========
+    start : dict
+      the start document
+    time, fast, slow : numpy arrays
+      event times, fast axis readbacks, slow axis readbacks
+    '''
+    dwell = start['fly']['dwell']
+    row = nearest(start['fly']['slow_positions'], slow)
+    centers = numpy.empty(len(time))
+    for r in numpy.unique(row):
+        these = row == r
+        t, x = time[these], fast[these]
+        order = numpy.argsort(t)
+        centers[these] = numpy.interp(t - dwell/2, t[order], x[order])
+    return centers
+
+
+def nearest(grid, values):
+    '''Index of the nearest point on a regular grid for each value.'''
+    grid = numpy.asarray(grid, dtype=float)
+    if len(grid) < 2:
+        return numpy.zeros(len(values), dtype=int)
+    step = (grid[-1] - grid[0]) / (len(grid) - 1)
+    return numpy.clip(numpy.rint((numpy.asarray(values) - grid[0]) / step), 0, len(grid)-1).astype(int)
+
+
+def regrid(start, table, columns):
+    '''Resample the time bins of a fly scan onto the pixel grid of the
+    equivalent step scan.
+
+    Each time bin is assigned to the pixel nearest to the interpolated
+    center of the bin, bins falling more than half a pixel outside
+    the scan range (i.e. during run up or run out) are discarded, and
+    the bins in each pixel are averaged.  A pixel with no bins, which
+    happens when the fast axis moves more than a pixel in one bin,
+    is interpolated from its neighbors in the same row.
+
+    The result is a dict of flattened arrays of length nslow*nfast, in
+    the same row-major order as a grid_scan, with the slow and fast
+    axis positions under the motor names.
+
+    arguments
+    =========
+    start : dict
+      the start document
+    table : dict-like
+      the primary stream, including 'time' and the motor readbacks
+    columns : list of str
+      columns of table to regrid
+    '''
+    slow_name, fast_name = start['motors']
+    nslow, nfast = start['shape']
+    slow_grid = numpy.asarray(start['fly']['slow_positions'], dtype=float)
+    fast_grid = numpy.linspace(start['fly']['fast_start'], start['fly']['fast_stop'], nfast)
+    time = numpy.asarray(table['time'], dtype=float)
+    slow = numpy.asarray(table[slow_name], dtype=float)
+    centers = fly_positions(start, time, numpy.asarray(table[fast_name], dtype=float), slow)
+
+    row = nearest(slow_grid, slow)
+    col = nearest(fast_grid, centers)
+    halfstep = abs(fast_grid[1] - fast_grid[0])/2 if nfast > 1 else numpy.inf
+    keep = (centers >= min(fast_grid[0], fast_grid[-1]) - halfstep) & (centers <= max(fast_grid[0], fast_grid[-1]) + halfstep)
+    pixel = row[keep]*nfast + col[keep]
+    counts = numpy.bincount(pixel, minlength=nslow*nfast)
+
+    gridded = {slow_name: numpy.repeat(slow_grid, nfast),
+               fast_name: numpy.tile(fast_grid, nslow)}
+    for c in columns:
+        sums = numpy.bincount(pixel, weights=numpy.asarray(table[c], dtype=float)[keep], minlength=nslow*nfast)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            image = (sums / counts).reshape(nslow, nfast)
+        for r in range(nslow):
+            empty = counts[r*nfast:(r+1)*nfast] == 0
+            if empty.any() and not empty.all():
+                xp, fp = fast_grid[~empty], image[r, ~empty]
+                if xp[0] > xp[-1]:
+                    xp, fp = xp[::-1], fp[::-1]
+                image[r, empty] = numpy.interp(fast_grid[empty], xp, fp)
+        gridded[c] = image.ravel()
+    return gridded
+
+
+def is_flyenergy(start):
+    '''True if the start document is from a continuous-energy XAFS scan.'''
+    return 'flyenergy' in start
+
+
+def cell_edges(grid):
+    '''Boundaries of the cells around the points of an energy grid,
+    which need not be regular.  The outer cells are as wide as their
+    inner neighbors.'''
+    grid = numpy.asarray(grid, dtype=float)
+    if len(grid) < 2:
+        return numpy.array([grid[0]-0.5, grid[0]+0.5])
+    middle = (grid[1:] + grid[:-1]) / 2
+    return numpy.concatenate(([grid[0] - (middle[0]-grid[0])], middle, [grid[-1] + (grid[-1]-middle[-1])]))
+
+
+def rebin_energy(start, table, columns, energy='dcm_energy', dwell='dwti_dwell_time'):
+    '''Rebin the time bins of a continuous-energy XAFS scan onto the
+    energy grid of the equivalent step scan.
+
+    Each event is read at the end of its time bin.  The energy at the
+    center of each bin is interpolated from the energy readbacks and
+    event times.  The length of a bin is the dwell time recorded with
+    the event or, lacking that, the time since the previous event.
+    Each bin is assigned to the cell of the energy grid containing its
+    center, bins outside the grid (i.e. during run up or run out) are
+    discarded, and the bins in each cell are averaged.  A cell with no
+    bins is interpolated from its neighbors.
+
+    The result is a dict of arrays, one value per point of the energy
+    grid, in the order in which the grid was measured.  The energy
+    column holds the average bin center in each cell and the
+    setpoint column (energy+'_setpoint') holds the requested grid.
+
+    arguments
+    =========
+    start : dict
+      the start document
+    table : dict-like
+      the primary stream, including 'time' and the energy readback
+    columns : list of str
+      columns of table to rebin
+    energy : str
+      name of the energy readback column ['dcm_energy']
+    dwell : str
+      name of the dwell time column ['dwti_dwell_time']
+    '''
+    grid = numpy.asarray(start['flyenergy']['energy_grid'], dtype=float)
+    time = numpy.asarray(table['time'], dtype=float)
+    order = numpy.argsort(time)
+    time, readback = time[order], numpy.asarray(table[energy], dtype=float)[order]
+    elapsed = numpy.diff(time, prepend=time[0] - (time[1]-time[0] if len(time) > 1 else 0))
+    if dwell in table:
+        elapsed = numpy.minimum(elapsed, numpy.asarray(table[dwell], dtype=float)[order])
+    centers = numpy.interp(time - elapsed/2, time, readback)
+
+    ## grid points are measured in either direction, cells are found on the ascending grid
+    ascending = numpy.argsort(grid)
+    edges = cell_edges(grid[ascending])
+    keep = (centers >= edges[0]) & (centers <= edges[-1])
+    cell = numpy.clip(numpy.searchsorted(edges, centers[keep], side='right') - 1, 0, len(grid)-1)
+    counts = numpy.bincount(cell, minlength=len(grid))
+    empty = counts == 0
+
+    def average(values):
+        sums = numpy.bincount(cell, weights=values[keep], minlength=len(grid))
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            this = sums / counts
+        if empty.any() and not empty.all():
+            this[empty] = numpy.interp(grid[ascending][empty], grid[ascending][~empty], this[~empty])
+        rebinned = numpy.empty(len(grid))
+        rebinned[ascending] = this
+        return rebinned
+
+    rebinned = {energy: average(centers), f'{energy}_setpoint': grid.copy()}
+    for c in columns:
+        if c in (energy, f'{energy}_setpoint', 'time'):
+            continue
+        rebinned[c] = average(numpy.asarray(table[c], dtype=float)[order])
+    rebinned['time'] = average(time)
+    return rebinned
@@ -0,0 +1,100 @@
+import numpy, openpyxl
+from scipy.io import savemat
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+class MapExport():
+    '''Write the data products of an area scan -- a spreadsheet, a
+    Matlab file and, optionally, a NeXus/HDF5 file -- from columns
+    already in memory, so that all of them come from a single read of
+    the primary stream.  In the Matlab and HDF5 files, a / in a column
+    name is written as _over_.
+
+    The columns are numpy arrays of length nslow*nfast, in the
+    row-major order of a grid_scan.  The Matlab and HDF5 files hold
+    them as 2-D (nslow, nfast) arrays.  The spreadsheet is written
+    through a write-only workbook, which streams rows to disk rather
+    than building the whole sheet in memory.
+
+    attributes
+    ==========
+    label : str
+      sample name, used as the spreadsheet title and the Matlab label
+    motors : list of str
+      names of the slow and fast motors, which are also columns
+    shape : (int, int)
+      (nslow, nfast)
+    columns : dict
+      column name : 1-D numpy array, in the order they will be written
+    signal : str
+      name of the column plotted by default from the HDF5 file
+
+    example
+    =======
+    >>> export = MapExport('my sample', ['xafs_y', 'xafs_x'], (nslow, nfast), columns, signal='If/I0')
+    >>> export.xlsx('maps/my_sample-01.xlsx')
+    >>> export.mat('maps/my_sample-01.mat')
+    >>> export.hdf5('maps/my_sample-01.h5')
+
+    '''
+    def __init__(self, label, motors, shape, columns, signal=None):
+        self.label   = label
+        self.motors  = list(motors)
+        self.shape   = tuple(shape)
+        self.columns = {k: numpy.asarray(v, dtype=float) for k, v in columns.items()}
+        self.signal  = signal
+
+    def image(self, name):
+        '''Return a column as a 2-D (nslow, nfast) array.  An incomplete
+        scan is padded with NaN.'''
+        this = self.columns[name]
+        npix = self.shape[0]*self.shape[1]
+        if len(this) < npix:
+            this = numpy.concatenate((this, numpy.full(npix - len(this), numpy.nan)))
+        return this[:npix].reshape(self.shape)
+
+    def safe(self, name):
+        '''A column name usable as a Matlab variable or HDF5 dataset name.'''
+        return name.replace('/', '_over_')
+
+    def xlsx(self, fname):
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=str(self.label)[:31])  # the longest sheet title Excel allows
+        ws.append(list(self.columns.keys()))
+        for row in numpy.column_stack(list(self.columns.values())).tolist():
+            ws.append(row)
+        wb.save(fname)
+
+    def mat(self, fname, aliases={}):
+        '''aliases is a dict of additional Matlab name : column name.'''
+        images = {self.safe(k): self.image(k) for k in self.columns}
+        images.update({a: self.image(k) for a, k in aliases.items()})
+        savemat(fname, {'label': self.label, **images}, do_compression=True)
+
+    def hdf5(self, fname, compression='gzip'):
+        '''Write a NeXus file with an NXentry/NXdata group holding every
+        column as a chunked, compressed 2-D dataset.  The motor
+        positions are 2-D axes spanning both dimensions.  Return False
+        if h5py is not available.'''
+        if h5py is None:
+            return False
+        names  = {k: self.safe(k) for k in self.columns}
+        signal = self.signal if self.signal in self.columns else list(self.columns.keys())[-1]
+        with h5py.File(fname, 'w') as f:
+            entry = f.create_group('entry')
+            entry.attrs['NX_class'] = 'NXentry'
+            entry['title'] = str(self.label)
+            data = entry.create_group('data')
+            data.attrs['NX_class'] = 'NXdata'
+            data.attrs['signal'] = names[signal]
+            data.attrs['axes'] = [names[m] for m in self.motors]
+            for m in self.motors:
+                data.attrs[f'{names[m]}_indices'] = [0, 1]
+            for k in self.columns:
+                data.create_dataset(names[k], data=self.image(k), chunks=(1, self.shape[1]),  # one row per chunk
+                                    compression=compression)
+        return True
@@ -0,0 +1,138 @@
+import threading
+
+
+class RedisState():
+    '''Read and write groups of BMM's Redis keys in single round trips.
+
+    Values are stored, as before, as individual string keys, e.g.
+    BMM:user:xs1, so that anything reading a single key with
+    rkvs.get() continues to work.  But a group of keys is written
+    with one MSET and read with one MGET, rather than one round trip
+    per key.
+
+    Values read are kept in a client-side cache.  A background thread
+    subscribes to keyspace notifications for the keys under prefix
+    and drops a key from the cache whenever it is changed by anyone.
+    The notification flags needed for this (K, $ and g) are added to
+    those the server already has, leaving the flags that other clients
+    rely on in place.  If the server's flags cannot be read or
+    extended, or if the subscription is lost, the cache is cleared and
+    disabled, after which every read goes to the server.
+
+    attributes
+    ==========
+    rkvs : redis.Redis
+      the Redis client
+    prefix : str
+      prefix of the keys managed here ['BMM:user:']
+    caching : bool
+      True while the cache is kept current by keyspace notifications
+
+    example
+    =======
+    >>> user_state = RedisState(rkvs)
+    >>> xs1, xs2, xs3, xs4, xs8 = user_state.get('xs1', 'xs2', 'xs3', 'xs4', 'xs8')
+    >>> user_state.set({'element': 'Fe', 'edge': 'K'})
+
+    '''
+    def __init__(self, rkvs, prefix='BMM:user:', cache=True):
+        self.rkvs       = rkvs
+        self.prefix     = prefix
+        self.cache      = {}
+        self.caching    = False
+        self.generation = 0
+        self.lock       = threading.Lock()
+        if cache:
+            self.listen()
+
+    def notifications(self):
+        '''Make sure the server sends the keyspace notifications needed to
+        keep the cache current, adding any missing flags to the ones
+        already set.  Return False if that cannot be done.'''
+        try:
+            current = self.rkvs.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            if isinstance(current, bytes):
+                current = current.decode('utf-8')
+            have = set(current)
+            if 'A' in have:     # A is an alias for all the event classes
+                have |= set('g$lshzxetd')
+            missing = ''.join(f for f in 'K$g' if f not in have)
+            if len(missing) > 0:
+                self.rkvs.config_set('notify-keyspace-events', current + missing)
+        except Exception as E:
+            print(f'Redis state cache disabled, keyspace notifications are not available: {E!r}')
+            return False
+        return True
+
+    def listen(self):
+        if not self.notifications():
+            return
+        try:
+            self.pubsub = self.rkvs.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.psubscribe(f'__keyspace@*__:{self.prefix}*')
+        except Exception:
+            return
+        self.caching = True
+        self.listener = threading.Thread(target=self.invalidate, name='BMM redis state', daemon=True)
+        self.listener.start()
+
+    def invalidate(self):
+        try:
+            for message in self.pubsub.listen():
+                if message is None or message.get('type') != 'pmessage':
+                    continue
+                channel = message['channel']
+                if isinstance(channel, bytes):
+                    channel = channel.decode('utf-8')
+                key = channel.split(':', 1)[1][len(self.prefix):]
+                with self.lock:
+                    self.generation += 1
+                    self.cache.pop(key, None)
+        except Exception as E:
+            print(f'Redis state cache disabled: {E!r}')
+        with self.lock:
+            self.caching = False
+            self.cache = {}
+
+    def get(self, *keys, default=''):
+        '''Return a list of the decoded values of keys, which are given
+        without the prefix.  Keys not in Redis are returned as
+        default.  Only the keys not in the cache are fetched, all in one
+        MGET.'''
+        with self.lock:
+            missing = [k for k in keys if not (self.caching and k in self.cache)]
+            generation = self.generation
+        if len(missing) > 0:
+            values = self.rkvs.mget([self.prefix + k for k in missing])
+            if values is None:
+                values = [None] * len(missing)
+            fetched = {k: default if v is None else v.decode('utf-8') for k, v in zip(missing, values)}
+            with self.lock:
+                ## do not cache a value that may have been changed while it was being fetched
+                if self.caching and self.generation == generation:
+                    self.cache.update(fetched)
+                answer = {k: self.cache.get(k) for k in keys if k not in fetched}
+            answer.update(fetched)
+        else:
+            with self.lock:
+                answer = {k: self.cache[k] for k in keys}
+        return [answer[k] for k in keys]
+
+    def get_dict(self, *keys, default=''):
+        return dict(zip(keys, self.get(*keys, default=default)))
+
+    def set(self, mapping):
+        '''Write a dict of key : value, with keys given without the prefix,
+        in one MSET.  Values are written as strings.'''
+        if len(mapping) == 0:
+            return
+        self.rkvs.mset({self.prefix + k: str(v) for k, v in mapping.items()})
+        with self.lock:
+            self.generation += 1
+            for k in mapping:
+                self.cache.pop(k, None)
+
+    def rois(self):
+        '''Return a dict of the ROI names for the Xspress3 channels,
+        xs1 through xs8.'''
+        return self.get_dict(*(f'xs{i}' for i in range(1, 9)))
@@ -0,0 +1,100 @@
+import os, json
+
+import numpy
+
+from BMM.periodictable import Z_number
+from BMM_common.xspress3_file import Xspress3File
+
+rois_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'rois.json')
+
+
+def roi_windows(rois, filename=rois_file):
+    '''Turn a list of ROI definitions into a dict of name : (low, high)
+    in units of MCA bins (10 eV).  As in the ROIs set by
+    BMMXspress3DetectorBase.set_rois, low is included and high is not.
+
+    Each ROI definition is one of
+      + an element symbol, looked up in rois.json at its K edge, or its
+        L3 edge above Z=45, as set_rois does
+      + an (element, edge) pair, looked up in rois.json
+      + a (name, low, high) triplet of custom bins
+
+    Lists are accepted in place of tuples, as they arrive in a kafka
+    message.
+
+    example
+    =======
+    >>> roi_windows(['Fe', ('Pb', 'l2'), ('FeKb', 700, 720)])
+    {'Fe': (626, 654), 'Pb': (1232, 1292), 'FeKb': (700, 720)}
+
+    '''
+    with open(filename, 'r') as fl:
+        allrois = json.load(fl)
+    windows = {}
+    for this in rois:
+        if isinstance(this, str):
+            this = (this, 'l3' if Z_number(this) > 45 else 'k')
+        if len(this) == 3:
+            name, low, high = this
+        else:
+            name, edge = this[0].capitalize(), this[1].lower()
+            if name not in allrois or edge not in allrois[name]:
+                raise KeyError(f'{name} {edge} is not in {filename}')
+            low, high = allrois[name][edge]['low'], allrois[name][edge]['high']
+        windows[name] = (int(low), int(high))
+    return windows
+
+
+def bin_range(windows, nbins):
+    '''The range of bins spanned by all the ROIs, as (first, last) with
+    last excluded, clipped to the nbins of the spectra.'''
+    first = min(max(min(w[0] for w in windows.values()), 0), nbins)
+    last  = max(min(max(w[1] for w in windows.values()), nbins), first)
+    return first, last
+
+
+def integrate(frames, windows, first=0):
+    '''Integrate every ROI of every channel at every point at once.
+
+    frames is a (npoints, nchan, nbins) array of spectra, starting at
+    bin first, and windows is a dict of name : (low, high), as from
+    roi_windows().  A cumulative sum is taken along the bins once, so
+    that each ROI costs a single subtraction, however wide it is.
+    Return a (npoints, nchan, nroi) array, the ROIs in the order of
+    windows.
+    '''
+    nbins = frames.shape[2]
+    cumulative = numpy.zeros(frames.shape[:2] + (nbins+1,))
+    numpy.cumsum(frames, axis=2, out=cumulative[:, :, 1:])
+    low  = numpy.clip([w[0] - first for w in windows.values()], 0, nbins)
+    high = numpy.clip([w[1] - first for w in windows.values()], 0, nbins)
+    return cumulative[:, :, high] - cumulative[:, :, low]
+
+
+def reintegrate_file(job):
+    '''Re-integrate the spectra in one Xspress3 HDF5 file.  This is run in
+    a worker process, so it takes and returns only plain data.
+
+    job is a dict with
+      filename : path to the HDF5 file
+      channels : dataset channel indices, as from Xspress3File.detector_channels
+      windows  : dict of name : (low, high), as from roi_windows()
+      deadtime : True to apply the dead-time correction
+
+    Return a dict of column name : array, the columns named like the
+    ROI columns of the primary stream (e.g. Mn1 to Mn4, or Mn8 for the
+    1-element detector), and a flag telling whether the dead-time
+    correction was applied.
+    '''
+    x3 = Xspress3File(job['filename'], channels=job['channels'])
+    ## read and sum only the bins spanned by the ROIs
+    first, last = bin_range(job['windows'], x3.nbins)
+    sums = integrate(x3.frames(bins=(first, last)), job['windows'], first)
+    factors = x3.deadtime_factors() if job['deadtime'] else None
+    if factors is not None:
+        sums *= factors[:, :, numpy.newaxis]
+    columns = {}
+    for j, name in enumerate(job['windows']):
+        for i, c in enumerate(x3.channels):
+            columns[f'{name}{c+1}'] = sums[:, i, j]
+    return columns, factors is not None
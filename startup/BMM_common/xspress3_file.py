@@ -0,0 +1,196 @@
+import os, threading
+from collections import OrderedDict
+
+import numpy, h5py
+
+
+class Xspress3File():
+    '''Read MCA spectra from the HDF5 file written by the Xspress3
+    during a scan.
+
+    The file is found once, from the resource document of the run, and
+    the spectra are read directly from the /entry/data/data dataset,
+    which has shape (npoints, nchannels, nbins).  Spectra are read as
+    whole hyperslabs: all the channels of a detector at one or several
+    points, or at every point, in a single read, rather than one
+    channel at a time.
+
+    An uncompressed, contiguous dataset is memory-mapped, so that a
+    frame costs no more than touching the pages it occupies.
+    Otherwise, large reads are made one chunk-aligned block of points
+    at a time, into a preallocated array.
+
+    Open files are kept in a small cache shared by all instances, so
+    reading spectra at several energies or from several runs measured
+    into the same file does not reopen it.
+
+    attributes
+    ==========
+    filename : str
+      fully resolved path to the HDF5 file
+    channels : list of int
+      dataset channel indices used by the detector of this run (the
+      1-element detector is channel 8, i.e. index 7)
+    npoints, nbins : int
+      shape of the dataset
+
+    example
+    =======
+    >>> x3 = Xspress3File.from_run(catalog[uid])
+    >>> frame = x3.frame(42)                  # (nchan, nbins) at the 43rd point
+    >>> spectra = x3.frames([0, 42, -1])      # (3, nchan, nbins)
+    >>> everything = x3.frames()              # (npoints, nchan, nbins)
+
+    '''
+    cache     = OrderedDict()
+    cachesize = 8
+    lock      = threading.Lock()
+
+    def __init__(self, filename, channels=(0, 1, 2, 3)):
+        self.filename = filename
+        self.channels = list(channels)
+        self.dataset  = self.open(filename)['entry']['data']['data']
+        self.npoints, self.nchannels, self.nbins = self.dataset.shape
+        self.mapped   = self.memmap()
+
+    @classmethod
+    def open(cls, filename):
+        '''Return an open h5py.File, from the cache if possible.'''
+        with cls.lock:
+            if filename in cls.cache:
+                cls.cache.move_to_end(filename)
+                return cls.cache[filename]
+            handle = h5py.File(filename, 'r')
+            cls.cache[filename] = handle
+            while len(cls.cache) > cls.cachesize:
+                name, old = cls.cache.popitem(last=False)
+                old.close()
+            return handle
+
+    @classmethod
+    def close_all(cls):
+        with cls.lock:
+            for handle in cls.cache.values():
+                handle.close()
+            cls.cache.clear()
+
+    @classmethod
+    def from_run(cls, record):
+        '''Make a reader for a Tiled run, finding the file from its resource
+        document and the channels from its start document.'''
+        return cls(cls.resource(record), channels=cls.detector_channels(record.metadata['start']))
+
+    @staticmethod
+    def resource(record):
+        '''The fully resolved path to the Xspress3 file of a run.'''
+        found = None
+        for name, doc in record.documents():
+            if name != 'resource':
+                continue
+            this = os.path.join(doc['root'], doc['resource_path'])
+            if 'XSP3' in doc.get('spec', '') or 'xspress3' in this:
+                return this
+            if found is None:
+                found = this
+        return found
+
+    @staticmethod
+    def detector_channels(start):
+        '''Dataset channel indices for the fluorescence detector named in a
+        start document.'''
+        if '1-element SDD' in start['detectors']:
+            return [7]
+        if '7-element SDD' in start['detectors']:
+            return list(range(7))
+        return list(range(4))
+
+    def memmap(self):
+        '''Map the dataset into memory, if it is stored contiguously and
+        uncompressed.  Return None otherwise.'''
+        if self.dataset.chunks is not None or self.dataset.compression is not None:
+            return None
+        try:
+            offset = self.dataset.id.get_offset()
+        except Exception:
+            return None
+        if offset is None:
+            return None
+        return numpy.memmap(self.filename, mode='r', dtype=self.dataset.dtype, offset=offset, shape=self.dataset.shape)
+
+    def index(self, position):
+        '''A point index, counting back from the end if negative.'''
+        position = int(position)
+        return position + self.npoints if position < 0 else position
+
+    def frame(self, position):
+        '''Return the spectra of the detector's channels at one point as a
+        (nchan, nbins) array.'''
+        return self.frames([position])[0]
+
+    def frames(self, positions=None, bins=None):
+        '''Return the spectra of the detector's channels at a list of
+        points, or at every point, as a (npoints, nchan, nbins) array.
+        With bins=(first, last), only that range of bins is read, last
+        excluded.'''
+        low, high = min(self.channels), max(self.channels) + 1
+        pick = [c - low for c in self.channels]
+        first, last = (0, self.nbins) if bins is None else bins
+        if positions is None:
+            if self.mapped is not None:
+                return numpy.array(self.mapped[:, low:high, first:last][:, pick, :])
+            return self.block_read(low, high, first, last)[:, pick, :]
+        rows = [self.index(p) for p in positions]
+        if self.mapped is not None:
+            return numpy.array(self.mapped[rows, low:high, first:last][:, pick, :])
+        ## h5py wants increasing, unique indices along the first axis
+        unique, inverse = numpy.unique(rows, return_inverse=True)
+        slab = self.dataset[list(unique), low:high, first:last]
+        return slab[inverse][:, pick, :]
+
+    def block_read(self, low, high, first=0, last=None):
+        '''Read channels low to high, and bins first to last, at every
+        point, one chunk-aligned block of points at a time.'''
+        if last is None:
+            last = self.nbins
+        out = numpy.empty((self.npoints, high-low, last-first), dtype=self.dataset.dtype)
+        step = self.dataset.chunks[0] if self.dataset.chunks is not None else self.npoints
+        step = max(step, 1) * max(1, 256 // max(step, 1))     # whole chunks, at least a few hundred points
+        for i in range(0, self.npoints, step):
+            j = min(i + step, self.npoints)
+            self.dataset.read_direct(out, numpy.s_[i:j, low:high, first:last], numpy.s_[i:j])
+        return out
+
+    def deadtime_factors(self):
+        '''Dead-time correction factors of the detector's channels at every
+        point, as a (npoints, nchan) array, from the scalers saved with
+        each frame under /entry/instrument/NDAttributes.
+
+        The factor computed by the IOC (CHANnDTFACTOR) is used if it was
+        saved.  Otherwise, it is computed from the scalers as the ratio
+        of all events to all good events (input to output counts),
+        scaled by the fraction of the frame time not lost to resets.
+        Return None if neither was saved.  A point with no output
+        counts gets a factor of 1.
+        '''
+        attributes = self.open(self.filename)['entry'].get('instrument/NDAttributes')
+        if attributes is None:
+            return None
+        factors = numpy.ones((self.npoints, len(self.channels)))
+        for i, c in enumerate(self.channels):
+            n = c + 1
+            if f'CHAN{n}DTFACTOR' in attributes:
+                these = numpy.asarray(attributes[f'CHAN{n}DTFACTOR'][:self.npoints], dtype=float)
+            elif all(f'CHAN{n}SCA{k}' in attributes for k in (0, 1, 3, 4)):
+                clock, reset, allevent, allgood = (numpy.asarray(attributes[f'CHAN{n}SCA{k}'][:self.npoints], dtype=float)
+                                                   for k in (0, 1, 3, 4))
+                with numpy.errstate(invalid='ignore', divide='ignore'):
+                    these = clock / (clock - reset) * allevent / allgood
+            else:
+                return None
+            factors[:len(these), i] = these
+        factors[~numpy.isfinite(factors) | (factors <= 0)] = 1
+        return factors
+
+    def energies(self, binwidth=10):
+        '''The energy of each bin, in eV.'''
+        return numpy.arange(self.nbins) * binwidth
@@ -1,4 +1,4 @@
-import os
+import os, time
 from matplotlib import get_backend
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -14,11 +14,19 @@ import pprint
 
 import redis
 rkvs = redis.Redis(host='xf06bm-ioc2', port=6379, db=0)
+from BMM_common.redis_state import RedisState
+user_state = RedisState(rkvs)   # cached, so ROI names do not cost a round trip at each scan start
 
 from slack import img_to_slack
 from tools import experiment_folder, echo_slack
 
 from BMM.periodictable import Z_number, edge_number
+from redraw import GrowingArray, RedrawScheduler
+from BMM_common.flygrid import nearest
+from BMM_common.xspress3_file import Xspress3File
+
+## shared by all the live plots
+scheduler = RedrawScheduler()
 
 
 class LineScan():
@@ -35,8 +43,8 @@ class LineScan():
 
     Every time an event document from BlueSky is observed, call the
     add method, which will parse the event document, extract the
-    latest data point, add it correctly to the data arrays, and redraw
-    the plot.
+    latest data point, add it correctly to the data arrays, and mark
+    the plot for redrawing by the scheduler.
 
     After the basic scan finishes, issue a kafka document indicating
     the end of the scan.  This document will look
@@ -57,11 +65,11 @@ class LineScan():
     ongoing (bool)
       a flag indicating whether a line or time scan is in progress
 
-    xdata (list)
-      a list containing all x-axis values measured thus far
+    xdata (GrowingArray)
+      all x-axis values measured thus far
 
-    ydata (list)
-      a list containing all y-axis values measured thus far
+    ydata (GrowingArray)
+      all y-axis values measured thus far
 
     motor (str)
       the name of the motor in motion or None for a time scan
@@ -121,10 +129,10 @@ class LineScan():
         #if self.figure is not None:
         #    plt.close(self.figure.number)
         self.ongoing = True
-        self.xdata = []
-        self.ydata = []
-        self.y2data = []
-        self.y3data = []
+        self.xdata = GrowingArray()
+        self.ydata = GrowingArray()
+        self.y2data = GrowingArray()
+        self.y3data = GrowingArray()
         if 'motor' in kwargs: self.motor = kwargs['motor']
         self.numerator = kwargs['detector'].capitalize()
         self.denominator = None
@@ -139,11 +147,7 @@ class LineScan():
         self.line, = self.axes.plot([],[])
         self.initial = 0
 
-        self.xs1 = rkvs.get('BMM:user:xs1').decode('utf-8')
-        self.xs2 = rkvs.get('BMM:user:xs2').decode('utf-8')
-        self.xs3 = rkvs.get('BMM:user:xs3').decode('utf-8')
-        self.xs4 = rkvs.get('BMM:user:xs4').decode('utf-8')
-        self.xs8 = rkvs.get('BMM:user:xs8').decode('utf-8')
+        self.xs1, self.xs2, self.xs3, self.xs4, self.xs8 = user_state.get('xs1', 'xs2', 'xs3', 'xs4', 'xs8')
 
 
         ## todo:  bicron, new ion chambers, both
@@ -234,6 +238,7 @@ class LineScan():
 
         
     def stop(self, catalog, **kwargs):
+        scheduler.service(force=True)
         if get_backend().lower() == 'agg':
             if 'fname' in kwargs and 'uid' in kwargs:
                 fname = os.path.join(experiment_folder(catalog, kwargs["uid"]), 'snapshots', kwargs["fname"])
@@ -310,16 +315,13 @@ class LineScan():
                 self.y2data.append(signal2/kwargs['data'][self.denominator])
             if self.numerator == 'Xs1':
                 self.y3data.append(signal3/kwargs['data'][self.denominator])
-        self.line.set_data(self.xdata, self.ydata)
+        lines = {self.line: (self.xdata, self.ydata)}
         if self.numerator in ('Ic0', 'Ic1', 'Xs1'): #, 'Xs', 'If'):
-            self.line2.set_data(self.xdata, self.y2data)
+            lines[self.line2] = (self.xdata, self.y2data)
         if self.numerator == 'Xs1':
-            self.line3.set_data(self.xdata, self.y3data)
-        self.axes.relim()
-        self.axes.autoscale_view(True,True,True)
-        #self.figure.show()      # in case the user has closed the window
-        self.figure.canvas.draw()
-        self.figure.canvas.flush_events()
+            lines[self.line3] = (self.xdata, self.y3data)
+        scheduler.mark(self.figure, lines)
+        scheduler.service()
 
     def close_all_lineplots(self):
         for i in self.plots:
@@ -380,11 +382,7 @@ class XAFSScan():
         '''Begin a sequence of XAFS live plots.
         '''
         self.ongoing     = True
-        self.energy      = []
-        self.i0sig       = []
-        self.trans       = []
-        self.fluor       = []
-        self.refer       = []
+        self.new_arrays()
         self.mode        = kwargs['mode']
         self.filename    = kwargs['filename']
         self.repetitions = kwargs['repetitions']
@@ -403,14 +401,8 @@ class XAFSScan():
 
         ## 2x2 grid if fluorescence
         if self.mode in ('both', 'fluorescence', 'fluo', 'flourescence', 'flour', 'xs', 'xs1', 'yield', 'eyield', 'fluo+yield', 'fluo+pilatus'):
-            self.xs1 = rkvs.get('BMM:user:xs1').decode('utf-8')
-            self.xs2 = rkvs.get('BMM:user:xs2').decode('utf-8')
-            self.xs3 = rkvs.get('BMM:user:xs3').decode('utf-8')
-            self.xs4 = rkvs.get('BMM:user:xs4').decode('utf-8')
-            self.xs5 = rkvs.get('BMM:user:xs5').decode('utf-8')
-            self.xs6 = rkvs.get('BMM:user:xs6').decode('utf-8')
-            self.xs7 = rkvs.get('BMM:user:xs7').decode('utf-8')
-            self.xs8 = rkvs.get('BMM:user:xs8').decode('utf-8')
+            (self.xs1, self.xs2, self.xs3, self.xs4,
+             self.xs5, self.xs6, self.xs7, self.xs8) = user_state.get(*(f'xs{i}' for i in range(1, 9)))
             if get_backend().lower() == 'agg':
                 self.fig.set_figheight(9.5)
                 self.fig.set_figwidth(11)
@@ -485,17 +477,20 @@ class XAFSScan():
 
         
 
-            
+
+    def new_arrays(self):
+        self.energy      = GrowingArray()
+        self.i0sig       = GrowingArray()
+        self.trans       = GrowingArray()
+        self.fluor       = GrowingArray()
+        self.refer       = GrowingArray()
+
     def Next(self, **kwargs):
         '''Initialize data arrays and plotting lines for next scan.
         '''
         self.count = kwargs['count']
         self.fig.suptitle(f'{self.filename}: scan {self.count} of {self.repetitions}')
-        self.energy      = []
-        self.i0sig       = []
-        self.trans       = []
-        self.fluor       = []
-        self.refer       = []
+        self.new_arrays()
         self.line_mut,   = self.mut.plot([],[], label=f'scan {self.count}')
         self.line_i0,    = self.i0.plot([],[],  label=f'scan {self.count}')
         self.line_ref,   = self.ref.plot([],[], label=f'scan {self.count}')
@@ -510,12 +505,14 @@ class XAFSScan():
                 self.muf.legend(loc='best', shadow=True)
             else:
                 self.muf.legend.remove()
+        scheduler.mark(self.fig, full=True)
             
     def stop(self, catalog, **kwargs):
         '''Done with a sequence of XAFS live plots.
         '''
         filename = kwargs['filename']
         uid = kwargs['uid']
+        scheduler.service(force=True)
         #self.figure.show(block=False)
         self.ongoing     = False
         # self.xdata       = []
@@ -574,10 +571,10 @@ class XAFSScan():
         else:
             self.refer.append(numpy.log(abs(kwargs['data']['It']/kwargs['data']['Ir'])))
             
-        ## push the updated data arrays to the various lines
-        self.line_mut.set_data(self.energy, self.trans)
-        self.line_i0.set_data(self.energy, self.i0sig)
-        self.line_ref.set_data(self.energy, self.refer)
+        ## the updated data arrays go to the various lines
+        lines = {self.line_mut: (self.energy, self.trans),
+                 self.line_i0:  (self.energy, self.i0sig),
+                 self.line_ref: (self.energy, self.refer), }
 
         ## and do all that for the fluorescence spectrum if it is being plotted.
         if self.mode in ('both', 'fluorescence', 'fluo', 'flourescence', 'flou', 'xs', 'xs1', 'yield', 'fluo+yield', 'fluo+pilatus'):
@@ -596,20 +593,15 @@ class XAFSScan():
                                     kwargs['data'][self.xs5] +
                                     kwargs['data'][self.xs6] +
                                     kwargs['data'][self.xs7]   ) / kwargs['data']['I0'])
-            self.line_muf.set_data(self.energy, self.fluor)
+            lines[self.line_muf] = (self.energy, self.fluor)
         #if self.mode in ('eyield'):
         #    self.fluor.append( kwargs['data']['Iy'] / kwargs['data']['I0'] )
         #    self.line_muf.set_data(self.energy, self.fluor)
 
-        ## rescale everything
-        for ax in self.axis_list:
-            ax.relim()
-            ax.autoscale_view(True,True,True)
-        #self.fig.show()         # in case the user has closed the window
-        ## redraw and flush the canvas 
+        ## the scheduler rescales and redraws, at most scheduler.fps times a second
         ## Tom's explanation for how to do multiple plots: https://stackoverflow.com/a/31686953
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        scheduler.mark(self.fig, lines)
+        scheduler.service()
         
             
 
@@ -676,16 +668,14 @@ class XRF():
             nelem = 7
             channels = tuple(range(1, 8))
 
+        x3 = Xspress3File.from_run(catalog[uid])
+        s = x3.frame(0)         # every channel in one read, the 1-element detector is channel 8
         if nelem == 1:
-            s.append(catalog[uid].primary.data['1-element SDD_channel08_xrf'][0])  #  note channel number!
             only = 1
             add = False
-        else:
-            for i in channels:
-                s.append(catalog[uid].primary.data[f'{nelem}-element SDD_channel0{i}_xrf'][0])
 
 
-        e = numpy.arange(0, len(s[0])) * 10
+        e = x3.energies()
 
         if only is not None and only in channels:
             plt.plot(e, s[only-1], label=f'channel {only}')
@@ -796,17 +786,11 @@ class XRF():
         handle.write('# ----------------------------------------------------------\n')
         handle.write('# energy ')
 
-        ## data table
-        s = []
-        if nchan == 1:
-            s.append(catalog[uid].primary.data['1-element SDD_channel08_xrf'][0])  #  note channel number!
-            datatable = numpy.array([s,])
-        else:
-            for i in range(1, nchan+1):
-                s.append(catalog[uid].primary.data[f'{nchan}-element SDD_channel0{i}_xrf'][0])
-            datatable = numpy.vstack(s)
+        ## data table, every channel in one read
+        x3 = Xspress3File.from_run(catalog[uid])
+        datatable = x3.frame(0)
                 
-        e=numpy.arange(0, len(s[0])) * 10
+        e = x3.energies()
         ndt=numpy.vstack(datatable)
         b=pandas.DataFrame(ndt.transpose(), index=e, columns=column_list)
         handle.write(b.to_csv(sep=' '))
@@ -816,7 +800,16 @@ class XRF():
         print('wrote XRF spectra to %s' % fname)
                 
 class AreaScan():
-    '''Manage the live plot for a motor scan or a time scan.
+    '''Manage the live plot for an area scan.
+
+    A single QuadMesh is made at the start of the scan.  Each event
+    fills one pixel of the image array, which is pushed to the mesh
+    with set_array.  In a step scan, events fill the pixels in order.
+    In a fly scan, each event fills the pixel nearest to the motor
+    readbacks in the event.  Redraws are coalesced: the mesh is updated at
+    most fps times a second, with the remaining updates made by
+    refresh(), which is called while waiting for kafka messages, and
+    at the end of the scan.
     '''
 
     ongoing     = False
@@ -824,6 +817,11 @@ class AreaScan():
     ydata       = []
     cdata       = []
     count       = 0 
+    measured    = None
+    fly         = False
+    fps         = 4
+    dirty       = False
+    last_draw   = 0
 
     detector    = None
     element     = 'H'
@@ -875,8 +873,12 @@ class AreaScan():
 
         
         self.detector     = kwargs['detector']
+        self.fly          = kwargs.get('fly', False)
         self.cdata        = numpy.zeros(self.fast_steps * self.slow_steps)
+        self.measured     = numpy.zeros(self.fast_steps * self.slow_steps, dtype=bool)
         self.count        = 0
+        self.dirty        = False
+        self.last_draw    = 0
         
         self.figure = plt.figure()
         if self.fast_motor is not None:
@@ -895,11 +897,7 @@ class AreaScan():
         self.axes.set_title(f'{self.detector}   Energy = {self.energy:.1f}')
 
         
-        self.xs1 = rkvs.get('BMM:user:xs1').decode('utf-8')
-        self.xs2 = rkvs.get('BMM:user:xs2').decode('utf-8')
-        self.xs3 = rkvs.get('BMM:user:xs3').decode('utf-8')
-        self.xs4 = rkvs.get('BMM:user:xs4').decode('utf-8')
-        self.xs8 = rkvs.get('BMM:user:xs8').decode('utf-8')
+        self.xs1, self.xs2, self.xs3, self.xs4, self.xs8 = user_state.get('xs1', 'xs2', 'xs3', 'xs4', 'xs8')
 
     def interpret_click(self, ev):
         '''Grab location of mouse click.  Identify motor by grabbing the
@@ -915,7 +913,22 @@ class AreaScan():
         rkvs.set('BMM:mouse_event:value2', y)
         rkvs.set('BMM:mouse_event:motor2', ev.canvas.figure.axes[0].get_ylabel())
         
+    def refresh(self, force=False):
+        '''Push the image array to the mesh and request a redraw, if there
+        are new pixels and the frame budget allows.'''
+        if not self.dirty or self.figure is None:
+            return
+        if not force and time.monotonic() - self.last_draw < 1/self.fps:
+            return
+        self.im.set_array(self.cdata.reshape(self.slow_steps, self.fast_steps))
+        measured = self.cdata[self.measured]
+        self.im.set_clim(measured.min(), measured.max())
+        self.figure.canvas.draw_idle()
+        self.dirty     = False
+        self.last_draw = time.monotonic()
+
     def stop(self, catalog, **kwargs):
+        self.refresh(force=True)
         if get_backend().lower() == 'agg':
             if 'filename' in kwargs and kwargs['filename'] is not None and kwargs['filename'] != '':
                 fname = os.path.join(experiment_folder(catalog, kwargs["uid"]), 'maps', kwargs["filename"])
@@ -959,7 +972,14 @@ class AreaScan():
         elif self.detector == 'Xs':
             signal  = (kwargs['data'][f'{self.element}1']+kwargs['data'][f'{self.element}2']+kwargs['data'][f'{self.element}3']+kwargs['data'][f'{self.element}4']) / kwargs['data']['I0']
             
-        self.cdata[self.count] = signal
-        self.axes.pcolormesh(self.fast, self.slow, self.cdata.reshape(self.slow_steps, self.fast_steps), cmap=plt.cm.viridis)
-        self.im.set_clim(self.cdata.min(), self.cdata.max())
+        if self.fly:
+            pixel = nearest(self.slow, [kwargs['data'][self.slow_motor]])[0]*self.fast_steps + nearest(self.fast, [kwargs['data'][self.fast_motor]])[0]
+        elif self.count >= len(self.cdata):
+            return
+        else:
+            pixel = self.count
+        self.cdata[pixel] = signal
+        self.measured[pixel] = True
         self.count += 1
+        self.dirty = True
+        self.refresh(force=self.count == len(self.cdata) and not self.fly)
@@ -3,7 +3,7 @@ sys.path.append('/home/xf06bm/.ipython/profile_collection/startup')
 
 import matplotlib.pyplot as plt
 from lmfit.models import SkewedGaussianModel, RectangleModel
-import numpy, os, h5py, xraylib, datetime, pandas
+import numpy, os, xraylib, datetime, pandas
 from scipy.interpolate import interp1d
 from mendeleev import element
 
@@ -12,10 +12,16 @@ from slack import img_to_slack, post_to_slack
 
 import redis
 rkvs = redis.Redis(host='xf06bm-ioc2', port=6379, db=0)
+from BMM_common.redis_state import RedisState
+user_state = RedisState(rkvs)
 
 from BMM_common.xdi import xdi_xrf_header
+from BMM_common.flygrid import is_fly, regrid
+from BMM_common.xspress3_file import Xspress3File
 
 def finished(record):
+    if is_fly(record.metadata['start']):  # the number of time bins in a fly scan is not known in advance
+        return record.metadata['stop']['exit_status'] == 'success'
     if 'num' in record.metadata['start']['plan_args']:  # 1D scan
         expected = record.metadata['start']['plan_args']['num']
     else:                       # 2D scan
@@ -55,12 +61,12 @@ def plot_linescan(bmm_catalog, uid):
     elif detector == 'Iy':
         signal, label, title = table['Iy']/table['I0'], 'Iy/I0', f'yield vs. {motor}'
     elif detector == 'If' or detector == 'Xs':
-        xs1, xs2, xs3, xs4 = rkvs.get('BMM:user:xs1'), rkvs.get('BMM:user:xs2'), rkvs.get('BMM:user:xs3'), rkvs.get('BMM:user:xs4')
+        xs1, xs2, xs3, xs4 = user_state.get('xs1', 'xs2', 'xs3', 'xs4')
         signal = (table[xs1]+table[xs2]+table[xs3]+table[xs4]) / table['I0']
         label = 'If/I0'
         title = f'4 element fluorescence vs. {motor}'
     elif detector == 'Xs1':
-        xs8 = rkvs.get('BMM:user:xs8')
+        xs8, = user_state.get('xs8')
         signal = table[xs8] / table['I0']
         label = 'If/I0'
         title = f'1 element fluorescence vs. {motor}'
@@ -107,17 +113,17 @@ def plot_timescan(bmm_catalog, uid):
     elif detector == 'Yield':
         signal, label, title = table['Iy']/table['I0'], 'Iy/I0', 'yield time scan'
     elif detector == 'Fluorescence' or detector == 'Xs':
-        xs1, xs2, xs3, xs4 = rkvs.get('BMM:user:xs1'), rkvs.get('BMM:user:xs2'), rkvs.get('BMM:user:xs3'), rkvs.get('BMM:user:xs4')
+        xs1, xs2, xs3, xs4 = user_state.get('xs1', 'xs2', 'xs3', 'xs4')
         signal = (table[xs1]+table[xs2]+table[xs3]+table[xs4]) / table['I0']
         label  = 'If/I0'
         title  = '4 element fluorescence time scan'
     elif detector == 'If':
-        xs1, xs2, xs3, xs4 = rkvs.get('BMM:user:xs1'), rkvs.get('BMM:user:xs2'), rkvs.get('BMM:user:xs3'), rkvs.get('BMM:user:xs4')
+        xs1, xs2, xs3, xs4 = user_state.get('xs1', 'xs2', 'xs3', 'xs4')
         signal = table[xs1]+table[xs2]+table[xs3]+table[xs4]
         label  = 'If'
         title  = '4 element If time scan'
     elif detector == 'Xs1':
-        xs8    = rkvs.get('BMM:user:xs8')
+        xs8,   = user_state.get('xs8')
         signal = table[xs8] / table['I0']
         label  = 'If/I0'
         title  = '1 element fluorescence time scan'
@@ -145,10 +151,7 @@ def plot_rectanglescan(bmm_catalog, uid):
     table = record.primary.read()
 
     if detector.lower() == 'if':
-        xs1 = rkvs.get('BMM:user:xs1').decode('utf-8')
-        xs2 = rkvs.get('BMM:user:xs2').decode('utf-8')
-        xs3 = rkvs.get('BMM:user:xs3').decode('utf-8')
-        xs4 = rkvs.get('BMM:user:xs4').decode('utf-8')
+        xs1, xs2, xs3, xs4 = user_state.get('xs1', 'xs2', 'xs3', 'xs4')
         signal   = numpy.array((table[xs1]+table[xs2]+table[xs3]+table[xs4])/table['I0'])
     elif detector.lower() == 'it':
         signal   = numpy.array(table['It']/table['I0'])
@@ -180,13 +183,12 @@ def plot_areascan(bmm_catalog, uid):
         fname = None
         
     table = record.primary.read()
+    if is_fly(record.metadata['start']):
+        table = regrid(record.metadata['start'], table, [c for c in table.data_vars if c not in (slow, fast) and table[c].ndim == 1])
 
     x=numpy.array(table[fast])
     y=numpy.array(table[slow])
-    xs1 = rkvs.get('BMM:user:xs1').decode('utf-8')
-    xs2 = rkvs.get('BMM:user:xs2').decode('utf-8')
-    xs3 = rkvs.get('BMM:user:xs3').decode('utf-8')
-    xs4 = rkvs.get('BMM:user:xs4').decode('utf-8')
+    xs1, xs2, xs3, xs4 = user_state.get('xs1', 'xs2', 'xs3', 'xs4')
     if detector.lower() == 'noisy_det':
         z=numpy.array(table['noisy_det'])
     elif detector.lower() == 'it':
@@ -338,16 +340,7 @@ def xrfat(**kwargs):
     xmax    = kwargs['xmax']
     
     record  = catalog[uid]
-    xafs    = record.primary.read()
-    docs    = record.documents()
-    for d in docs:
-        if d[0] == 'resource':
-            hfile = os.path.join(d[1]['root'], d[1]['resource_path'])
-            #if '_%d' in this: hfile = this % 0  #  deal with image files
-            break
-    
-    #hfile = file_resource(uid)
-    f  = h5py.File(hfile,'r')
+    xafs    = record.primary.read(['dcm_energy', 'I0', 'dwti_dwell_time'])   # one read of the scalar columns needed
     el = record.metadata["start"]["XDI"]["Element"]["symbol"]
     ed = record.metadata["start"]["XDI"]["Element"]["edge"]
     
@@ -362,6 +355,7 @@ def xrfat(**kwargs):
     else:
         print('The specified scan was not a fluorescence XAFS scan.')
         return()
+    x3 = Xspress3File.from_run(record)
         
     dcm = numpy.array(xafs['dcm_energy'])
     fig = plt.figure()
@@ -373,29 +367,25 @@ def xrfat(**kwargs):
     title = f'{thisname} at '
     if len(energy) > 1:
         xrffile = None
-    for i,e in enumerate(energy):
+    positions = []
+    for e in energy:
         if e <= 0:
-            position = e
-            en = float(dcm[position])
+            positions.append(e)
         elif e < dcm[0] and e < len(dcm):
-            position = e
-            en = float(dcm[position])
+            positions.append(e)
         elif e < dcm[0] and e > len(dcm):
-            position = 0
-            en = float(dcm[position])
+            positions.append(0)
         else:
-            position = numpy.abs(dcm - e).argmin()
-            en = float(dcm[position])
-
+            positions.append(numpy.abs(dcm - e).argmin())
+    frames = x3.frames(positions)   # all the spectra at all the energies in one read
+    ee = x3.energies()
+    for i,position in enumerate(positions):
+        en = float(dcm[position])
         if is_4elem is True:
-            s1 = f['entry']['data']['data'][position][0]
-            s2 = f['entry']['data']['data'][position][1]
-            s3 = f['entry']['data']['data'][position][2]
-            s4 = f['entry']['data']['data'][position][3]
+            s1, s2, s3, s4 = frames[i]
         else:
-            s1 = f['entry']['data']['data'][position][7]
+            s1 = frames[i][0]
             add, only = False, 8
-        ee = numpy.array(range(len(f['entry']['data']['data'][position][0])))*10
 
         title += f'{en:.1f}, '
 
@@ -445,17 +435,18 @@ def xrfat(**kwargs):
     ax.set_title(title)
 
     if xrffile is not None:
-        thistime = float(record.primary.read()['time'][position])
+        thistime = float(xafs['time'][position])
+        baseline = record.baseline.read(['xafs_x', 'xafs_y'])
         kwargs = {'m2state' : record.metadata["start"]["XDI"]["Beamline"]["focusing"],
                   'm3state' : record.metadata["start"]["XDI"]["Beamline"]["harmonic_rejection"],
                   'energy' : round(energy, 1),
-                  'i0val' : round(float(record.primary.read()['I0'][position]), 3),
+                  'i0val' : round(float(xafs['I0'][position]), 3),
                   'sample_name' : record.metadata["start"]["XDI"]["Sample"]["name"],
                   'sample_prep' : record.metadata["start"]["XDI"]["Sample"]["prep"],
-                  'sample_x' : round(float(record.baseline.read()['xafs_x'][0]), 3),
-                  'sample_y' : round(float(record.baseline.read()['xafs_y'][0]), 3),
+                  'sample_x' : round(float(baseline['xafs_x'][0]), 3),
+                  'sample_y' : round(float(baseline['xafs_y'][0]), 3),
                   'scan_end' : datetime.datetime.fromtimestamp(thistime).strftime("%Y-%m-%dT%H-%M-%S"),
-                  'dwell_time' : float(record.primary.read()['dwti_dwell_time'][position]),
+                  'dwell_time' : float(xafs['dwti_dwell_time'][position]),
                   'uid' : uid + '  (this is the UID of the parent XAFS scan)',
                   'current' : record.metadata["start"]["XDI"]["Facility"]["current"],
                   'ring_mode' : record.metadata["start"]["XDI"]["Facility"]["mode"],
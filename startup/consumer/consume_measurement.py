@@ -7,7 +7,8 @@ import nslsii
 import nslsii.kafka_utils
 
 from tiled.client import from_profile
-bmm_catalog = from_profile('bmm')
+from run_cache import RunRecordCache
+bmm_catalog = RunRecordCache(from_profile('bmm'))
 
 import matplotlib.pyplot as plt
 import bmm_plot
@@ -50,7 +51,7 @@ aw.logger = logger
 be_verbose = True
 doing = None
 
-from bmm_live import LineScan, XAFSScan, XRF, AreaScan
+from bmm_live import LineScan, XAFSScan, XRF, AreaScan, scheduler
 ls  = LineScan()
 ls.logger = logger
 xs  = XAFSScan()
@@ -287,8 +288,12 @@ def plot_from_kafka_messages(beamline_acronym):
         process_message   = examine_message,
     )
 
+    def work_during_wait():
+        asc.refresh()
+        scheduler.wait(.1)
+
     try:
-        kafka_consumer.start_polling(work_during_wait=lambda : plt.pause(.1))
+        kafka_consumer.start_polling(work_during_wait=work_during_wait)
     except KeyboardInterrupt:
         print('\n\nExiting Kafka consumer (plotting tool)')
         return()
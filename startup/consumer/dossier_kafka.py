@@ -1,9 +1,9 @@
 import os, sys, re, socket, ast, datetime, pathlib
 from urllib.parse import quote
-import numpy, pandas, openpyxl
-from scipy.io import savemat
+import numpy, pandas
 from bluesky import __version__ as bluesky_version
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import redis
 if not os.environ.get('AZURE_TESTING'):
@@ -27,6 +27,10 @@ from pygments.lexers import PythonLexer, IniLexer
 from pygments.formatters import HtmlFormatter
 
 from BMM.periodictable import edge_energy, Z_number, element_symbol, element_name
+from BMM_common.flygrid import is_fly, regrid, is_flyenergy, rebin_energy
+from BMM_common.mapfiles import MapExport
+from BMM_common.roi_integration import roi_windows, reintegrate_file
+from BMM_common.xspress3_file import Xspress3File
 from tools import echo_slack, experiment_folder
 from slack import img_to_slack, post_to_slack
 
@@ -291,33 +295,34 @@ class BMMDossier():
             # middle part, XRF and glancing angle alignment images
             if thismode == 'xs' or thismode == 'xs1':
                 el = XDI['Element']['symbol']
-                if '4-element SDD' in bmm_catalog[self.uidlist[0]].metadata['start']['detectors']:
-                    rois = [int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'1'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'2'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'3'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'4'][0])]
-                    ocrs = [int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['4-element SDD_channel01_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['4-element SDD_channel02_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['4-element SDD_channel03_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['4-element SDD_channel04_xrf']).sum()) ]
-                elif '1-element SDD' in bmm_catalog[self.uidlist[0]].metadata['start']['detectors']:
-                    rois = [int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'8'][0]),]
-                    ocrs = [int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['1-element SDD_channel08_xrf']).sum()),]
-                elif '7-element SDD' in bmm_catalog[self.uidlist[0]].metadata['start']['detectors']:
-                    rois = [int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'1'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'2'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'3'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'4'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'5'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'6'][0]),
-                            int(bmm_catalog[snapshots['xrf_uid']].primary.data[el+'7'][0]) ]
-                    ocrs = [int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['7-element SDD_channel01_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['7-element SDD_channel02_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['7-element SDD_channel03_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['7-element SDD_channel04_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['7-element SDD_channel05_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['7-element SDD_channel06_xrf']).sum()),
-                            int(numpy.array(bmm_catalog[snapshots['xrf_uid']].primary.data['7-element SDD_channel07_xrf']).sum()) ]
+                xrfdata = bmm_catalog[snapshots['xrf_uid']].primary.data
+                if '4-element SDD' in startdoc['detectors']:
+                    rois = [int(xrfdata[el+'1'][0]),
+                            int(xrfdata[el+'2'][0]),
+                            int(xrfdata[el+'3'][0]),
+                            int(xrfdata[el+'4'][0])]
+                    ocrs = [int(numpy.array(xrfdata['4-element SDD_channel01_xrf']).sum()),
+                            int(numpy.array(xrfdata['4-element SDD_channel02_xrf']).sum()),
+                            int(numpy.array(xrfdata['4-element SDD_channel03_xrf']).sum()),
+                            int(numpy.array(xrfdata['4-element SDD_channel04_xrf']).sum()) ]
+                elif '1-element SDD' in startdoc['detectors']:
+                    rois = [int(xrfdata[el+'8'][0]),]
+                    ocrs = [int(numpy.array(xrfdata['1-element SDD_channel08_xrf']).sum()),]
+                elif '7-element SDD' in startdoc['detectors']:
+                    rois = [int(xrfdata[el+'1'][0]),
+                            int(xrfdata[el+'2'][0]),
+                            int(xrfdata[el+'3'][0]),
+                            int(xrfdata[el+'4'][0]),
+                            int(xrfdata[el+'5'][0]),
+                            int(xrfdata[el+'6'][0]),
+                            int(xrfdata[el+'7'][0]) ]
+                    ocrs = [int(numpy.array(xrfdata['7-element SDD_channel01_xrf']).sum()),
+                            int(numpy.array(xrfdata['7-element SDD_channel02_xrf']).sum()),
+                            int(numpy.array(xrfdata['7-element SDD_channel03_xrf']).sum()),
+                            int(numpy.array(xrfdata['7-element SDD_channel04_xrf']).sum()),
+                            int(numpy.array(xrfdata['7-element SDD_channel05_xrf']).sum()),
+                            int(numpy.array(xrfdata['7-element SDD_channel06_xrf']).sum()),
+                            int(numpy.array(xrfdata['7-element SDD_channel07_xrf']).sum()) ]
 
                 with open(os.path.join(startup_dir, 'tmpl', 'dossier_xrf_image.tmpl')) as f:
                     content = f.readlines()
@@ -347,7 +352,7 @@ class BMMDossier():
                                                    steps         = XDI['_user']['steps'],
                                                    times         = XDI['_user']['times'],
                                                    reference     = re.sub(r'(\d+)', r'<sub>\1</sub>', this_ref),
-                                                   seqstart      = datetime.datetime.fromtimestamp(bmm_catalog[self.uidlist[0]].metadata['start']['time']).strftime('%A, %B %d, %Y %I:%M %p'),
+                                                   seqstart      = datetime.datetime.fromtimestamp(startdoc['time']).strftime('%A, %B %d, %Y %I:%M %p'),
                                                    seqend        = datetime.datetime.fromtimestamp(bmm_catalog[self.uidlist[-1]].metadata['stop']['time']).strftime('%A, %B %d, %Y %I:%M %p'),
                                                    mono          = self.mono_text(bmm_catalog),
                                                    pdsmode       = '%s  (%s)' % self.pdstext(bmm_catalog),
@@ -561,25 +566,23 @@ class BMMDossier():
     def hdf5_filename(self, bmm_catalog, uid):
         '''Find the path/name of the asset file associated with UID
         '''
-        for d in bmm_catalog[uid].documents():
-            if d[0] == 'resource':
-                this = os.path.join(d[1]['root'], d[1]['resource_path'])
-                if '_%d' in this:
-                    this = this % 0
-                if 'xspress3' in this:
-                    return this 
+        for d in bmm_catalog[uid].resources():
+            this = os.path.join(d['root'], d['resource_path'])
+            if '_%d' in this:
+                this = this % 0
+            if 'xspress3' in this:
+                return this 
         return None
 
     def pilatus_filename(self, bmm_catalog, uid):
         '''Find the path/name of the asset file associated with UID
         '''
-        for d in bmm_catalog[uid].documents():
-            if d[0] == 'resource':
-                this = os.path.join(d[1]['root'], d[1]['resource_path'])
-                if '_%d' in this:
-                    this = this % 0
-                if 'pilatus100k' in this:
-                    return this
+        for d in bmm_catalog[uid].resources():
+            this = os.path.join(d['root'], d['resource_path'])
+            if '_%d' in this:
+                this = this % 0
+            if 'pilatus100k' in this:
+                return this
         return None
 
     
@@ -799,7 +802,7 @@ class BMMDossier():
                                               usb2uid       = snapshots['usbcam2_uid'],
                                               mode          = XDI['_user']['mode'],
                                               motors        = self.motor_sidebar(catalog),
-                                              seqstart      = datetime.datetime.fromtimestamp(catalog[self.uidlist[0]].metadata['start']['time']).strftime('%A, %B %d, %Y %I:%M %p'),
+                                              seqstart      = datetime.datetime.fromtimestamp(startdoc['time']).strftime('%A, %B %d, %Y %I:%M %p'),
                                               seqend        = datetime.datetime.fromtimestamp(catalog[self.uidlist[-1]].metadata['stop']['time']).strftime('%A, %B %d, %Y %I:%M %p'),
                                               mono          = self.mono_text(catalog),
                                               pdsmode       = '%s  (%s)' % self.pdstext(catalog),
@@ -912,7 +915,7 @@ class BMMDossier():
                                               matout        = XDI['_snapshots']['matout'],
                                               mode          = XDI['_user']['mode'],
                                               motors        = self.motor_sidebar(catalog),
-                                              seqstart      = datetime.datetime.fromtimestamp(catalog[self.uidlist[0]].metadata['start']['time']).strftime('%A, %B %d, %Y %I:%M %p'),
+                                              seqstart      = datetime.datetime.fromtimestamp(startdoc['time']).strftime('%A, %B %d, %Y %I:%M %p'),
                                               seqend        = datetime.datetime.fromtimestamp(catalog[self.uidlist[-1]].metadata['stop']['time']).strftime('%A, %B %d, %Y %I:%M %p'),
                                               mono          = self.mono_text(catalog),
                                               pdsmode       = '%s  (%s)' % self.pdstext(catalog),
@@ -940,313 +943,346 @@ class BMMDossier():
 
         
 
-class XASFile():
+class XDIWriter():
+    '''Shared engine for writing the XDI-style files made from XAS,
+    SEAD, and line scans.
 
-    def plot_hint(self, catalog=None, uid=None):
+    Each file class gathers the start and stop documents once, then
+    describes its data table with a column plan: a list of (key,
+    label, description) tuples.  The key is the name of a column in
+    the primary stream (or of a computed column), the label is used
+    on the column label line, and the description is used on the
+    "# Column.N:" header line.  The Column.N numbering thus always
+    matches the data table.
+
+    The data table is read from the primary stream in a single
+    projected read and written as a numpy array, in chunks, with a
+    fixed %.6f format.
+
+    '''
+    chunksize = 2048
+
+    def open_xdi(self, catalog, uid, filename):
+        fname = os.path.join(experiment_folder(catalog, uid), filename)
+        handle = open(fname, 'w')
+        handle.write(f'# XDI/1.0 BlueSky/{bluesky_version} BMM/{pathlib.Path(sys.executable).parts[-3]}\n')
+        return fname, handle
+
+    def write_families(self, handle, xdi, rename={}):
+        '''Header lines with metadata from the XDI dictionary.'''
+        for family in ('Beamline', 'Detector', 'Element', 'Facility', 'Mono', 'Sample', 'Scan'):
+            for k in xdi[family].keys():
+                if family == 'Sample' and k in ('comment', 'extra_metadata'):
+                    continue
+                handle.write(f'# {family}.{rename.get((family, k), k)}: {xdi[family][k]}\n')
+
+    def timestamp(self, doc):
+        return datetime.datetime.fromtimestamp(doc['time']).strftime("%Y-%m-%dT%H:%M:%S") # '%A, %d %B, %Y %I:%M %p')
+
+    def sdd_columns(self, startdoc, el):
+        '''Return the names of the fluorescence ROI columns, if any.'''
+        if '1-element SDD' in startdoc['detectors']:
+            return [f'{el}8']
+        elif '4-element SDD' in startdoc['detectors']:
+            return [f'{el}{i}' for i in range(1, 5)]
+        elif '7-element SDD' in startdoc['detectors']:
+            return [f'{el}{i}' for i in range(1, 8)]
+        return []
+
+    def write_column_headers(self, handle, plan):
+        for i, (key, label, description) in enumerate(plan):
+            handle.write(f'# Column.{i+1}: {description}\n')
+
+    def read_table(self, catalog, uid, keys):
+        '''Read the needed columns of the primary stream all at once and
+        return them as a dict of numpy arrays.  The time column is
+        always included.'''
+        xa = catalog[uid].primary.read([k for k in keys if k != 'time'])
+        table = {k: numpy.asarray(xa[k], dtype=float) for k in keys if k != 'time'}
+        table['time'] = numpy.asarray(xa['time'], dtype=float)
+        return table
+
+    def write_table(self, handle, plan, table, comments):
+        '''Write the comment lines, the column label line, and the data
+        table, then close the file.'''
+        handle.write('# //////////////////////////////////////////////////////////\n')
+        for l in comments:
+            handle.write(f'# {l}\n')
+        handle.write('# ----------------------------------------------------------\n')
+        handle.write('# ' + ' '.join(label for key, label, description in plan) + '\n')
+        data = numpy.column_stack([table[key] for key, label, description in plan])
+        for i in range(0, len(data), self.chunksize):
+            numpy.savetxt(handle, data[i:i+self.chunksize], fmt='%.6f', delimiter=' ')
+        handle.flush()
+        handle.close()
+
+
+class XASFile(XDIWriter):
+
+    def plot_hint(self, catalog=None, uid=None, startdoc=None):
+        if startdoc is None:
+            startdoc = catalog[uid].metadata['start']
         text = 'ln(I0/It)  --  ln($5/$6)'
-        el = catalog[uid].metadata['start']['XDI']['Element']['symbol']
-        
-        if '1-element SDD' in catalog[uid].metadata['start']['detectors']:
+        el = startdoc['XDI']['Element']['symbol']
+
+        if '1-element SDD' in startdoc['detectors']:
             text = f'{el}8/I0  --  $8/$5'
-        elif '4-element SDD' in catalog[uid].metadata['start']['detectors']:
+        elif '4-element SDD' in startdoc['detectors']:
             text = f'({el}1+{el}2+{el}3+{el}4)/I0  --  ($8+$9+$10+$11)/$5'
-        elif '7-element SDD' in catalog[uid].metadata['start']['detectors']:
+        elif '7-element SDD' in startdoc['detectors']:
             text = f'({el}1+{el}2+{el}3+{el}4+{el}5+{el}6+{el}7)/I0  --  ($8+$9+$10+$11+$12+$13+$14)/$5'
-        elif 'reference' in catalog[uid].metadata['start']['plan_name']:
+        elif 'reference' in startdoc['plan_name']:
             text = 'ln(It/Ir)  --  ln($6/$7)'
-        elif 'yield' in catalog[uid].metadata['start']['plan_name']:
+        elif 'yield' in startdoc['plan_name']:
             text = 'ln(It/Ir)  --  ln($8/$5)'
-        elif 'test' in catalog[uid].metadata['start']['plan_name']:
+        elif 'test' in startdoc['plan_name']:
             text = 'I0  --  $5'
         return text
 
     def file_resource(self, catalog, uid):
-        docs = catalog[uid].documents()
         found = []
-        for d in docs:
-            if d[0] == 'resource':
-                this = os.path.join(d[1]['root'], d[1]['resource_path'])
-                if '_%d' in this or re.search('%\d\.\dd', this) is not None:
-                    this = this % 0
-                found.append(this)
+        for d in catalog[uid].resources():
+            this = os.path.join(d['root'], d['resource_path'])
+            if '_%d' in this or re.search('%\d\.\dd', this) is not None:
+                this = this % 0
+            found.append(this)
         return found
-    
+
     def to_xdi(self, catalog=None, uid=None, filename=None, logger=None, include_yield=False):
         '''Write an XDI-style file for an XAS scan.
 
         '''
-        
-        xdi = catalog[uid].metadata["start"]["XDI"]
-        fname = os.path.join(experiment_folder(catalog, uid), filename)
-        handle = open(fname, 'w')
-        handle.write(f'# XDI/1.0 BlueSky/{bluesky_version} BMM/{pathlib.Path(sys.executable).parts[-3]}\n')
-
-        ## header lines with metadata from the XDi dictionary
-        for family in ('Beamline', 'Detector', 'Element', 'Facility', 'Mono', 'Sample', 'Scan'):
-            for k in xdi[family].keys():
-                if family == 'Sample' and k == 'comment':
-                    continue
-                if family == 'Sample' and k == 'extra_metadata':
-                    continue
-                handle.write(f'# {family}.{k}: {xdi[family][k]}\n')
-        start = datetime.datetime.fromtimestamp(catalog[uid].metadata['start']['time']).strftime("%Y-%m-%dT%H:%M:%S") # '%A, %d %B, %Y %I:%M %p')
-        end   = datetime.datetime.fromtimestamp(catalog[uid].metadata['stop']['time']).strftime("%Y-%m-%dT%H:%M:%S") # '%A, %d %B, %Y %I:%M %p')
-        handle.write(f'# Scan.start_time: {start}\n')
-        handle.write(f'# Scan.end_time: {end}\n')
-        handle.write(f'# Scan.uid: {uid}\n')
-        handle.write(f'# Scan.transient_id: {catalog[uid].metadata["start"]["scan_id"]}\n')
-        
-        if any(x in catalog[uid].metadata['start']['detectors'] for x in ('1-element SDD', '4-element SDD', '7-element SDD')):
-            hdf5files = self.file_resource(catalog, uid)
-            for h in hdf5files:
-                relative = '/'.join(h.split('/')[-6:])
-                if 'xspress3' in relative:
-                    handle.write(f'# Scan.xspress3_hdf5_file: {relative}\n')
-                elif 'pilatus' in relative:
-                    handle.write(f'# Scan.piltus100k_hdf5_file: {relative}\n')
-        ## is this correct?  need to test....
-            
-        handle.write(f'# Scan.plot_hint: {self.plot_hint(catalog=catalog, uid=uid)}\n')
-        handle.write( '# Column.1: energy eV\n')
-        handle.write( '# Column.2: requested_energy eV\n')
-        handle.write( '# Column.3: measurement_time seconds\n')
-        handle.write( '# Column.4: xmu\n')
-        handle.write( '# Column.5: I0 nA\n')
-        handle.write( '# Column.6: Itrans nA\n')
-        handle.write( '# Column.7: Irefer nA\n')
-
-        ## Column.N header lines
-        column_list = ['dcm_energy', 'dcm_energy_setpoint', 'dwti_dwell_time', 'I0', 'It', 'Ir']
-        column_labels = ['energy', 'requested_energy', 'measurement_time', 'xmu', 'I0', 'It', 'Ir']
-        if 'yield' in catalog[uid].metadata['start']['plan_name'] or include_yield is True:
-            handle.write( '# Column.8: Iy nA\n')
-            column_list.append('Iy')
-            column_labels.append('Iy')
-
-        
-        el = catalog[uid].metadata['start']['XDI']['Element']['symbol']
-        nchan = 0
-        if '1-element SDD' in catalog[uid].metadata['start']['detectors']:
-            nchan = 1
-            column_list.append(f'{el}8')
-            column_labels.append(f'{el}8')
-            handle.write(f'# Column.8: {el}8\n')
-        elif '4-element SDD' in catalog[uid].metadata['start']['detectors']:
-            column_list.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4'])
-            column_labels.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4'])
-            nchan = 4
-            if 'pilatus100k-1' in catalog[uid].metadata['start']['detectors']:
-                column_list.extend(['yoneda', 'specular'])
-                column_labels.extend(['yoneda', 'specular'])
-                
-        elif '7-element SDD' in catalog[uid].metadata['start']['detectors']:
-            column_list.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4', f'{el}5', f'{el}6', f'{el}7'])
-            column_labels.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4', f'{el}5', f'{el}6', f'{el}7'])
-            nchan = 7
-        if nchan > 0:
-            if 'yield' in catalog[uid].metadata['start']['plan_name'] or include_yield is True:
-                for i in range(1, nchan+1):
-                    handle.write(f'# Column.{i+8}: {el}{i}\n')
-            else:
-                for i in range(1, nchan+1):
-                    handle.write(f'# Column.{i+7}: {el}{i}\n')
-        if 'pilatus100k-1' in catalog[uid].metadata['start']['detectors']:
-            handle.write(f'# Column.{8+nchan}: yoneda\n')
-            handle.write(f'# Column.{9+nchan}: specular\n')
-
-                    
-        ## prepare data table and insert xmu column
-        xa = catalog[uid].primary.read(column_list)
-        p = xa.to_pandas()
-        column_list.insert(3, 'xmu')
-        if '1-element SDD' in catalog[uid].metadata['start']['detectors']:
-            p['xmu'] = p[f'{el}8']/p['I0']
-        elif '4-element SDD' in catalog[uid].metadata['start']['detectors']:
-            p['xmu'] = (p[f'{el}1']+p[f'{el}2']+p[f'{el}3']+p[f'{el}4'])/p['I0']
-        elif '7-element SDD' in catalog[uid].metadata['start']['detectors']:
-            p['xmu'] = (p[f'{el}1']+p[f'{el}2']+p[f'{el}3']+p[f'{el}4']+p[f'{el}5']+p[f'{el}6']+p[f'{el}7'])/p['I0']
-        elif 'transmission' in catalog[uid].metadata['start']['plan_name']:
+        startdoc = catalog[uid].metadata['start']
+        xdi = startdoc["XDI"]
+        fname, handle = self.open_xdi(catalog, uid, filename)
+        self.write_header(handle, catalog, uid, self.plot_hint(startdoc=startdoc))
+
+        ## column plan
+        plan = self.base_plan(startdoc, include_yield)
+        el = xdi['Element']['symbol']
+        rois = self.sdd_columns(startdoc, el)
+        plan.extend([(r, r, r) for r in rois])
+        if 'pilatus100k-1' in startdoc['detectors'] and '4-element SDD' in startdoc['detectors']:
+            plan.extend([('yoneda', 'yoneda', 'yoneda'), ('specular', 'specular', 'specular')])
+        self.write_column_headers(handle, plan)
+
+        ## read data table and compute xmu column
+        p = self.read_table(catalog, uid, [key for key, label, description in plan if key != 'xmu'])
+        if is_flyenergy(startdoc):
+            p = rebin_energy(startdoc, p, list(p.keys()))
+        if len(rois) > 0:
+            p['xmu'] = sum(p[r] for r in rois)/p['I0']
+        elif 'transmission' in startdoc['plan_name']:
             p['xmu'] = numpy.log(p['It']/p['I0'])
-        elif 'reference' in catalog[uid].metadata['start']['plan_name']:
+        elif 'reference' in startdoc['plan_name']:
             p['xmu'] = numpy.log(p['Ir']/p['It'])
-        elif 'yield' in catalog[uid].metadata['start']['plan_name']:
+        elif 'yield' in startdoc['plan_name']:
             p['xmu'] = p['Iy']/p['It']
-        elif 'test' in catalog[uid].metadata['start']['plan_name']:
+        elif 'test' in startdoc['plan_name']:
             p['xmu'] = p['I0']
         else:
             p['xmu'] = numpy.log(p['It']/p['I0'])
 
-        ## use energy as the pandas index
-        p.set_index('dcm_energy')
-        
-        ## comment and separator lines
-        handle.write('# //////////////////////////////////////////////////////////\n')
-        for l in xdi["_comment"]:
-            handle.write(f'# {l}\n')
-        handle.write('# ----------------------------------------------------------\n')
-        handle.write('# ')
-
-        ## dump the data table and close the file
-        handle.write(p.to_csv(None, sep=' ', columns=column_list, index=False, header=column_labels, float_format='%.6f'))
-        handle.flush()
-        handle.close()
+        ## comment and separator lines, data table
+        self.write_table(handle, plan, p, xdi["_comment"])
 
         log_entry(logger, f'wrote XAS data to {fname}')
         #post_to_slack(f'wrote XAS data to {fname}')
 
+    def write_header(self, handle, catalog, uid, hint):
+        '''Header lines with the metadata, the times, and the asset files
+        of an XAS scan.'''
+        startdoc = catalog[uid].metadata['start']
+        stopdoc  = catalog[uid].metadata['stop']
+        self.write_families(handle, startdoc["XDI"])
+        handle.write(f'# Scan.start_time: {self.timestamp(startdoc)}\n')
+        handle.write(f'# Scan.end_time: {self.timestamp(stopdoc)}\n')
+        handle.write(f'# Scan.uid: {uid}\n')
+        handle.write(f'# Scan.transient_id: {startdoc["scan_id"]}\n')
+
+        if any(x in startdoc['detectors'] for x in ('1-element SDD', '4-element SDD', '7-element SDD')):
+            hdf5files = self.file_resource(catalog, uid)
+            for h in hdf5files:
+                relative = '/'.join(h.split('/')[-6:])
+                if 'xspress3' in relative:
+                    handle.write(f'# Scan.xspress3_hdf5_file: {relative}\n')
+                elif 'pilatus' in relative:
+                    handle.write(f'# Scan.piltus100k_hdf5_file: {relative}\n')
+        ## is this correct?  need to test....
 
+        handle.write(f'# Scan.plot_hint: {hint}\n')
+
+    def base_plan(self, startdoc, include_yield=False):
+        '''The column plan for energy, measurement time, xmu, and the ion
+        chambers.'''
+        plan = [('dcm_energy',          'energy',           'energy eV'),
+                ('dcm_energy_setpoint', 'requested_energy', 'requested_energy eV'),
+                ('dwti_dwell_time',     'measurement_time', 'measurement_time seconds'),
+                ('xmu',                 'xmu',              'xmu'),
+                ('I0',                  'I0',               'I0 nA'),
+                ('It',                  'It',               'Itrans nA'),
+                ('Ir',                  'Ir',               'Irefer nA'), ]
+        if 'yield' in startdoc['plan_name'] or include_yield is True:
+            plan.append(('Iy', 'Iy', 'Iy nA'))
+        return plan
+
+
+
+class ReintegratedXASFile(XASFile):
+    '''Re-integrate the fluorescence ROIs of XAS scans from the spectra
+    saved in their Xspress3 HDF5 files, then write new XDI-style files
+    alongside the originals.
+
+    The HDF5 files are read and integrated in a pool of worker
+    processes, one task per file (see
+    BMM_common.roi_integration.reintegrate_file).  The catalog is read
+    and the XDI files are written here, as each result comes back.
+
+    A new file has the header of the original plus a line for each
+    re-integrated ROI.  Its columns are those of the original, with
+    the new ROI columns added or in place of those of the same name.
+    xmu is computed from the first ROI.  The file is named for the
+    original with the tag added to the stem, e.g. Fe-foil.001 becomes
+    Fe-foil-Mn.001.
 
-class SEADFile():
+    '''
+    def reintegrate(self, catalog=None, uids=[], rois=[], tag=None, deadtime=True, processes=3, logger=None):
+        '''Re-integrate a list of XAS scans.  rois is a list of ROI
+        definitions, as explained in roi_windows().  The tag defaults to
+        the names of the ROIs.  processes is the number of worker
+        processes, kept small so as not to crowd the other consumers.
+        Return the list of files written.'''
+        windows = roi_windows(rois)
+        if tag is None:
+            tag = '-'.join(windows)
+        jobs = {}
+        for uid in uids:
+            startdoc = catalog[uid].metadata['start']
+            if not any(x in startdoc['detectors'] for x in ('1-element SDD', '4-element SDD', '7-element SDD')):
+                log_entry(logger, f'not re-integrating {uid}, it was not measured with a fluorescence detector')
+                continue
+            jobs[uid] = {'filename' : Xspress3File.resource(catalog[uid]),
+                         'channels' : Xspress3File.detector_channels(startdoc),
+                         'windows'  : windows,
+                         'deadtime' : deadtime}
+
+        written = []
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(reintegrate_file, job): uid for uid, job in jobs.items()}
+            for future in as_completed(futures):
+                uid = futures[future]
+                try:
+                    columns, corrected = future.result()
+                    written.append(self.write_reintegrated(catalog, uid, columns, windows, tag, corrected))
+                except Exception as E:
+                    log_entry(logger, f'failed to re-integrate {uid}: {E}')
+        log_entry(logger, f're-integrated {len(written)} of {len(uids)} XAS scans with {", ".join(windows)}')
+        return written
+
+    def write_reintegrated(self, catalog, uid, columns, windows, tag, corrected):
+        '''Write one re-integrated XAS scan.  Return the name of the file.'''
+        startdoc = catalog[uid].metadata['start']
+        xdi = startdoc["XDI"]
+        stem, ext = os.path.splitext(os.path.basename(xdi['_filename']))
+
+        ## column plan: the original columns, then the new ROI columns
+        plan = self.base_plan(startdoc)
+        plan.extend([(r, r, r) for r in self.sdd_columns(startdoc, xdi['Element']['symbol']) if r not in columns])
+        plan.extend([(r, r, r) for r in columns])
+
+        ## read the rest of the data table, align the new columns with the events
+        p = self.read_table(catalog, uid, [key for key, label, description in plan if key != 'xmu' and key not in columns])
+        npoints = len(p['time'])
+        for k, v in columns.items():
+            if len(v) < npoints:
+                raise ValueError(f'{len(v)} spectra saved for {npoints} points')
+            p[k] = numpy.asarray(v[:npoints], dtype=float)
+        if is_flyenergy(startdoc):
+            p = rebin_energy(startdoc, p, list(p.keys()))
+        first = list(columns.keys())[:len(columns)//len(windows)]
+        p['xmu'] = sum(p[r] for r in first)/p['I0']
+
+        number = {key: i+1 for i, (key, label, description) in enumerate(plan)}
+        hint = f'({"+".join(first)})/I0  --  ({"+".join(f"${number[r]}" for r in first)})/${number["I0"]}'
+        fname, handle = self.open_xdi(catalog, uid, f'{stem}-{tag}{ext}')
+        self.write_header(handle, catalog, uid, hint)
+        handle.write(f'# Reintegration.original_file: {os.path.basename(xdi["_filename"])}\n')
+        for name, (low, high) in windows.items():
+            handle.write(f'# Reintegration.{name}: {10*low} to {10*high} eV\n')
+        handle.write(f'# Reintegration.deadtime_correction: {"Xspress3 scalers" if corrected else "none"}\n')
+        self.write_column_headers(handle, plan)
+        self.write_table(handle, plan, p, xdi["_comment"])
+        return fname
+
+
+class SEADFile(XDIWriter):
 
     def to_xdi(self, catalog=None, uid=None, filename=None, logger=None):
         '''Write a single energy absorption detection (SEAD) scan file in XDI
         format, which is a timescan at a specific energy.
 
         '''
-        xdi = catalog[uid].metadata["start"]["XDI"]
-        fname = os.path.join(experiment_folder(catalog, uid), filename)
-        handle = open(fname, 'w')
-        handle.write(f'# XDI/1.0 BlueSky/{bluesky_version} BMM/{pathlib.Path(sys.executable).parts[-3]}\n')
-
-        ## header lines with metadata from the XDi dictionary
-        for family in ('Beamline', 'Detector', 'Element', 'Facility', 'Mono', 'Sample', 'Scan'):
-            for k in xdi[family].keys():
-                if family == 'Sample' and k == 'comment':
-                    continue
-                if family == 'Sample' and k == 'extra_metadata':
-                    continue
-                if family == 'Scan' and k == 'edge_energy':
-                    handle.write(f'# {family}.mono_energy: {xdi[family][k]}\n')
-                else:
-                    handle.write(f'# {family}.{k}: {xdi[family][k]}\n')
-        start = datetime.datetime.fromtimestamp(catalog[uid].metadata['start']['time']).strftime("%Y-%m-%dT%H:%M:%S") # '%A, %d %B, %Y %I:%M %p')
-        end   = datetime.datetime.fromtimestamp(catalog[uid].metadata['stop']['time']).strftime("%Y-%m-%dT%H:%M:%S") # '%A, %d %B, %Y %I:%M %p')
-        handle.write(f'# Scan.start_time: {start}\n')
-        handle.write(f'# Scan.end_time: {end}\n')
+        startdoc = catalog[uid].metadata['start']
+        stopdoc  = catalog[uid].metadata['stop']
+        xdi = startdoc["XDI"]
+        fname, handle = self.open_xdi(catalog, uid, filename)
+        self.write_families(handle, xdi, rename={('Scan', 'edge_energy'): 'mono_energy'})
+        handle.write(f'# Scan.start_time: {self.timestamp(startdoc)}\n')
+        handle.write(f'# Scan.end_time: {self.timestamp(stopdoc)}\n')
         handle.write(f'# Scan.uid: {uid}\n')
-        handle.write(f'# Scan.transient_id: {catalog[uid].metadata["start"]["scan_id"]}\n')
-        handle.write( '# Column.1: energy eV\n')
-        handle.write( '# Column.2: requested_energy eV\n')
-        handle.write( '# Column.3: measurement_time seconds\n')
-        handle.write( '# Column.4: xmu\n')
-        handle.write( '# Column.5: I0 nA\n')
-        handle.write( '# Column.6: It nA\n')
-        handle.write( '# Column.7: Ir nA\n')
-
-        ## Column.N header lines
-        column_list = ['I0', 'It', 'Ir']
-        column_labels = ['time', 'I0', 'It', 'Ir']
-        
-        el = catalog[uid].metadata['start']['XDI']['Element']['symbol']
-        nchan = 0
-        if '1-element SDD' in catalog[uid].metadata['start']['detectors']:
-            nchan = 1
-            column_list.append(f'{el}8')
-            column_labels.append(f'{el}8')
-            handle.write(f'# Column.8: {el}8\n')
-        elif '4-element SDD' in catalog[uid].metadata['start']['detectors']:
-            column_list.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4'])
-            column_labels.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4'])
-            nchan = 4
-        elif '7-element SDD' in catalog[uid].metadata['start']['detectors']:
-            column_list.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4', f'{el}5', f'{el}6', f'{el}7'])
-            column_labels.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4', f'{el}5', f'{el}6', f'{el}7'])
-            nchan = 7
-        if nchan > 0:
-            for i in range(1, nchan+1):
-                handle.write(f'# Column.{i+7}: {el}{i}\n')
-
-        ## prepare data table and insert reltime column
-        xa = catalog[uid].primary.read(column_list)
-        p = xa.to_pandas()
-        t = numpy.array(catalog[uid].primary.data['time'])
-        p['time'] = t - t[0]
-        column_list.insert(0, 'time')
-
-        ## use time as the pandas index
-        p.set_index('time')
-        
-        ## comment and separator lines
-        handle.write('# //////////////////////////////////////////////////////////\n')
-        for l in xdi["_comment"]:
-            handle.write(f'# {l}\n')
-        handle.write('# ----------------------------------------------------------\n')
-        handle.write('# ')
+        handle.write(f'# Scan.transient_id: {startdoc["scan_id"]}\n')
 
-        ## dump the data table and close the file
-        handle.write(p.to_csv(None, sep=' ', columns=column_list, index=False, header=column_labels, float_format='%.6f'))
-        handle.flush()
-        handle.close()
+        ## column plan
+        plan = [('reltime', 'time', 'time seconds'),
+                ('I0',      'I0',   'I0 nA'),
+                ('It',      'It',   'It nA'),
+                ('Ir',      'Ir',   'Ir nA'), ]
+        rois = self.sdd_columns(startdoc, xdi['Element']['symbol'])
+        plan.extend([(r, r, r) for r in rois])
+        self.write_column_headers(handle, plan)
+
+        ## read data table and insert reltime column
+        p = self.read_table(catalog, uid, ['I0', 'It', 'Ir'] + rois)
+        p['reltime'] = p['time'] - p['time'][0]
+
+        ## comment and separator lines, data table
+        self.write_table(handle, plan, p, xdi["_comment"])
 
         log_entry(logger, f'wrote SEAD data to {fname}')
 
 
 
-class LSFile():
+class LSFile(XDIWriter):
 
     def determine_element(self, catalog, uid):
-        labels = list(catalog[uid].primary.read().keys())
+        labels = list(catalog[uid].primary.data.keys())
         for l in labels:
             m = re.match('^[A-Z][a-z]?[1-7]', l)
             if m is not None:
                 return(m.string[:-1])
         return 'MCA'
-        
+
     def to_xdi(self, catalog=None, uid=None, filename=None, logger=None):
         startdoc = catalog[uid].metadata["start"]
-        fname = os.path.join(experiment_folder(catalog, uid), filename)
-        handle = open(fname, 'w')
-        handle.write(f'# XDI/1.0 BlueSky/{bluesky_version} BMM/{pathlib.Path(sys.executable).parts[-3]}\n')
-
-        start = datetime.datetime.fromtimestamp(catalog[uid].metadata['start']['time']).strftime("%Y-%m-%dT%H:%M:%S") # '%A, %d %B, %Y %I:%M %p')
-        handle.write(f'# Scan.start_time: {start}\n')
+        fname, handle = self.open_xdi(catalog, uid, filename)
+        handle.write(f'# Scan.start_time: {self.timestamp(startdoc)}\n')
         handle.write(f'# Scan.uid: {uid}\n')
-        handle.write(f'# Scan.transient_id: {catalog[uid].metadata["start"]["scan_id"]}\n')
+        handle.write(f'# Scan.transient_id: {startdoc["scan_id"]}\n')
 
+        ## column plan
         motor = startdoc["motors"][0]
-        column_list = [motor, 'I0', 'It', 'Ir']
-        column_labels = [motor, 'I0', 'It', 'Ir']
-        
-        el = self.determine_element(catalog, uid)
-        handle.write(f'# Column.1: {motor}\n')
-        handle.write( '# Column.2: I0 nA\n')
-        handle.write( '# Column.3: It nA\n')
-        handle.write( '# Column.4: Ir nA\n')
-        if '1-element SDD' in catalog[uid].metadata['start']['detectors']:
-            nchan = 1
-            column_list.append(f'{el}8')
-            column_labels.append(f'{el}8')
-            handle.write(f'# Column.5: {el}8\n')
-        elif '4-element SDD' in catalog[uid].metadata['start']['detectors']:
-            column_list.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4'])
-            column_labels.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4'])
-            nchan = 4
-        elif '7-element SDD' in catalog[uid].metadata['start']['detectors']:
-            column_list.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4', f'{el}5', f'{el}6', f'{el}7'])
-            column_labels.extend([f'{el}1', f'{el}2', f'{el}3', f'{el}4', f'{el}5', f'{el}6', f'{el}7'])
-            nchan = 7
-        if nchan > 0:
-            for i in range(1, nchan+1):
-                handle.write(f'# Column.{i+4}: {el}{i}\n')
-
-        ## prepare data table and insert reltime column
-        xa = catalog[uid].primary.read(column_list)
-        p = xa.to_pandas()
-        t = numpy.array(catalog[uid].primary.data['time'])
-
-        ## use time as the pandas index
-        p.set_index(motor)
-        
-        ## comment and separator lines
-        handle.write( '# //////////////////////////////////////////////////////////\n')
-        handle.write(f'# linescan on {motor}\n')
-        handle.write( '# ----------------------------------------------------------\n')
-        handle.write( '# ')
-
-        ## dump the data table and close the file
-        handle.write(p.to_csv(None, sep=' ', columns=column_list, index=False, header=column_labels, float_format='%.6f'))
-        handle.flush()
-        handle.close()
+        plan = [(motor, motor, motor),
+                ('I0',  'I0',  'I0 nA'),
+                ('It',  'It',  'It nA'),
+                ('Ir',  'Ir',  'Ir nA'), ]
+        rois = self.sdd_columns(startdoc, self.determine_element(catalog, uid))
+        plan.extend([(r, r, r) for r in rois])
+        self.write_column_headers(handle, plan)
+
+        p = self.read_table(catalog, uid, [key for key, label, description in plan])
+
+        ## comment and separator lines, data table
+        self.write_table(handle, plan, p, [f'linescan on {motor}'])
 
         log_entry(logger, f'wrote linescan data to {fname}')
 
@@ -1254,10 +1290,14 @@ class LSFile():
 
 class RasterFiles():
 
+    hdf5 = True                 # also write a NeXus/HDF5 map file
+
     def preserve_data(self, catalog, uid, logger):
         '''Save the data from an areascan as a .xlsx file (a simple spreadsheet
-        which can be ingested by many plotting programs) and as a .mat
-        file (which can be ingested by Matlab).
+        which can be ingested by many plotting programs), as a .mat
+        file (which can be ingested by Matlab) and, if hdf5 is True, as
+        a NeXus/HDF5 file next to the .mat file.  All are written from
+        one read of the primary stream, see BMM_common.mapfiles.
 
         to do:
         1. save all Xspress3 columns
@@ -1265,48 +1305,50 @@ class RasterFiles():
         '''
 
         record  = catalog[uid]
-        xlsxout = os.path.join(experiment_folder(catalog, uid), record.metadata['start']['XDI']['_snapshots']['xlsxout'])
-        matout  = os.path.join(experiment_folder(catalog, uid), record.metadata['start']['XDI']['_snapshots']['matout'])
-
-        
-        motors = record.metadata['start']['motors']
-        #print('Reading data set...')
-        datatable = record.primary.read()
+        start   = record.metadata['start']
+        xlsxout = os.path.join(experiment_folder(catalog, uid), start['XDI']['_snapshots']['xlsxout'])
+        matout  = os.path.join(experiment_folder(catalog, uid), start['XDI']['_snapshots']['matout'])
 
-        slow = numpy.array(datatable[motors[0]])
-        fast = numpy.array(datatable[motors[1]])
-        i0   = numpy.array(datatable['I0'])
-        it   = numpy.array(datatable['It'])
-        ir   = numpy.array(datatable['Ir'])
-
-        if '4-element SDD' in catalog[uid].metadata['start']['detectors'] or 'if' in catalog[uid].metadata['start']['detectors'] or 'xs' in catalog[uid].metadata['start']['detectors']:
-            det_name = catalog[uid].metadata['start']['plan_name'].split()[-1]
+        motors = start['motors']
+        if '4-element SDD' in start['detectors'] or 'if' in start['detectors'] or 'xs' in start['detectors']:
+            det_name = start['plan_name'].split()[-1]
             det_name = det_name[:-1]
-            z = numpy.array(datatable[det_name+'1'])+numpy.array(datatable[det_name+'2'])+numpy.array(datatable[det_name+'3'])+numpy.array(datatable[det_name+'4'])
-        elif 'noisy_det' in catalog[uid].metadata['start']['detectors']:
+            channels = [det_name+'1', det_name+'2', det_name+'3', det_name+'4']
+        elif 'noisy_det' in start['detectors']:
             det_name = 'noisy_det'
-            z = numpy.array(datatable['noisy_det'])
+            channels = ['noisy_det']
         else:
-            det_name = catalog[uid].metadata['start']['plan_name'].split()[-1]
-            z = numpy.zeros(len(slow))
-            
-        ## save map in xlsx format
-        wb = openpyxl.Workbook()
-        ws1 = wb.active
-        ws1.title = record.metadata['start']['XDI']['Sample']['name']
-        ws1.append((motors[0], motors[1], f'{det_name}/I0', det_name, 'I0', 'It', 'Ir'))
-        for i in range(len(slow)):
-            ws1.append((slow[i], fast[i], z[i]/i0[i], z[i], i0[i], it[i], ir[i]))
-        wb.save(xlsxout)
+            det_name = start['plan_name'].split()[-1]
+            channels = []
+
+        #print('Reading data set...')
+        datatable = record.primary.read(motors + ['I0', 'It', 'Ir'] + channels)
+        if is_fly(start):
+            ## resample the time bins onto the pixel grid, so the products look like those of a step scan
+            datatable = regrid(start, datatable, ['I0', 'It', 'Ir'] + channels)
+
+        i0 = numpy.asarray(datatable['I0'], dtype=float)
+        if len(channels) > 0:
+            z = numpy.sum([numpy.asarray(datatable[c], dtype=float) for c in channels], axis=0)
+        else:
+            z = numpy.zeros(len(i0))
+        columns = {motors[0]          : datatable[motors[0]],
+                   motors[1]          : datatable[motors[1]],
+                   f'{det_name}/I0'   : z/i0,
+                   det_name           : z,
+                   'I0'               : i0,
+                   'It'               : datatable['It'],
+                   'Ir'               : datatable['Ir'], }
+        export = MapExport(start['XDI']['Sample']['name'], motors, start['shape'], columns, signal=f'{det_name}/I0')
+
+        export.xlsx(xlsxout)
         log_entry(logger, f'wrote {xlsxout}')
 
-        ## save map in matlab format 
-        savemat(matout, {'label'   : record.metadata['start']['XDI']['Sample']['name'],
-                         motors[0] : list(slow),
-                         motors[1] : list(fast),
-                         'I0'      : list(i0),
-                         'It'      : list(it),
-                         'Ir'      : list(ir),
-                         'signal'  : list(z),})
+        export.mat(matout, aliases={'signal': det_name})
         log_entry(logger, f'wrote {matout}')
 
+        if self.hdf5:
+            h5out = os.path.splitext(matout)[0] + '.h5'
+            if export.hdf5(h5out):
+                log_entry(logger, f'wrote {h5out}')
+
@@ -7,6 +7,7 @@ import os
 import re
 import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append('/home/xf06bm/.ipython/profile_collection/startup')
 
 from bluesky_kafka.consume import BasicConsumer
@@ -14,7 +15,8 @@ import nslsii
 import nslsii.kafka_utils
 
 from tiled.client import from_profile
-bmm_catalog = from_profile('bmm')
+from run_cache import RunRecordCache
+bmm_catalog = RunRecordCache(from_profile('bmm'))
 
 
 import redis
@@ -33,7 +35,7 @@ except:
     rkvs = NoRedis()
 
 
-from tools import echo_slack, next_index, file_exists
+from tools import echo_slack, next_index, file_exists, files_exist
 from slack import img_to_slack, post_to_slack
 
 # legible screen output
@@ -41,12 +43,16 @@ from pygments import highlight
 from pygments.lexers import PythonLexer, HtmlLexer
 from pygments.formatters import Terminal256Formatter
 
-from dossier_kafka import BMMDossier, startup_dir, XASFile, SEADFile, LSFile, RasterFiles
+from dossier_kafka import BMMDossier, startup_dir, XASFile, SEADFile, LSFile, RasterFiles, ReintegratedXASFile
 dossier = BMMDossier()
 xdi  = XASFile()
 sead = SEADFile()
 ls   = LSFile()
 raster = RasterFiles()
+reint  = ReintegratedXASFile()
+## ROI re-integration can take minutes, so it runs in the background,
+## one batch at a time, while the kafka loop keeps handling live scans
+reintegration = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reintegrate')
 
 # capture Ctrl-c to exit kafka polling loop semi-gracefully
 def handler(signal, frame):
@@ -90,6 +96,13 @@ def usb_filename(self, bmm_catalog, uid):
     return None
 
     
+
+def reintegration_done(future):
+    '''Report a failed ROI re-integration batch.  A batch which finishes
+    reports itself, see ReintegratedXASFile.reintegrate.'''
+    if future.exception() is not None:
+        logger.error(f'ROI re-integration failed: {future.exception()!r}')
+
     
 def manage_files_from_kafka_messages(beamline_acronym):
 
@@ -108,7 +121,7 @@ def manage_files_from_kafka_messages(beamline_acronym):
 
         if name == 'bmm':
             if any(x in message for x in ('dossier', 'mkdir', 'copy', 'touch', 'echoslack',
-                                          'xasxdi', 'seadxdi', 'lsxdi', 'raster', 'next_index')) :
+                                          'xasxdi', 'seadxdi', 'lsxdi', 'raster', 'next_index', 'reintegrate')) :
                 if be_verbose is True:
                     print(f'\n{pprint.pformat(message, compact=True)}')
                 # if be_verbose is True:
@@ -183,23 +196,33 @@ def manage_files_from_kafka_messages(beamline_acronym):
                     logger.info(f'made directory {message["mkdir"]}')
 
             elif 'copy' in message:
-                if 'file' in message:
-                    source = message['file']
-                elif 'uuid' in message:
-                    record = bmm_catalog[message['uuid']]
-                    docs = record.documents()
-                    found = []
-                    for d in docs:
-                        if d[0] == 'resource':
-                            this = os.path.join(d[1]['root'], d[1]['resource_path'])
+                if 'targets' in message:
+                    ## one run with several cameras: copy the file from each camera,
+                    ## identified by the device name in its resource path
+                    for d in bmm_catalog[message['uuid']].resources():
+                        this = os.path.join(d['root'], d['resource_path'])
+                        if '_%d' in this or re.search('%\d\.\dd', this) is not None:
+                            this = this % 0
+                        for device, target in message['targets'].items():
+                            if f'/{device}/' in this or f'/{device}_' in this:
+                                shutil.copy(this, target)
+                                logger.info(f'copied {this} to {target}')
+                else:
+                    if 'file' in message:
+                        source = message['file']
+                    elif 'uuid' in message:
+                        record = bmm_catalog[message['uuid']]
+                        found = []
+                        for d in record.resources():
+                            this = os.path.join(d['root'], d['resource_path'])
                             if '_%d' in this or re.search('%\d\.\dd', this) is not None:
                                 this = this % 0
                             found.append(this)
-                    source = found[0]
-                    uuid = True
-                target = message['target']
-                shutil.copy(source, target)
-                logger.info(f'copied {source} to {target}')
+                        source = found[0]
+                        uuid = True
+                    target = message['target']
+                    shutil.copy(source, target)
+                    logger.info(f'copied {source} to {target}')
 
                 
             elif 'touch' in message:
@@ -223,13 +246,23 @@ def manage_files_from_kafka_messages(beamline_acronym):
 
             elif 'raster' in message:
                 raster.preserve_data(catalog=bmm_catalog, uid=message['uid'], logger=logger)
+
+            elif 'reintegrate' in message:
+                future = reintegration.submit(reint.reintegrate, catalog=bmm_catalog, uids=message['uids'], rois=message['rois'],
+                                              tag=message.get('tag'), deadtime=message.get('deadtime', True), logger=logger)
+                future.add_done_callback(reintegration_done)
+                logger.info(f'queued ROI re-integration of {len(message["uids"])} XAS scans')
                 
             elif 'next_index' in message:
-                next_index(message['folder'], message['stub'])
+                next_index(message['folder'], message['stub'], reply=message.get('reply'))
 
             elif 'file_exists' in message:
                 #pprint.pprint(message)
-                file_exists(message['folder'], message['filename'], message['start'], message['stop'], message['number'])
+                file_exists(message['folder'], message['filename'], message['start'], message['stop'], message['number'],
+                            reply=message.get('reply'))
+
+            elif 'files_exist' in message:
+                files_exist(message['folder'], message['checks'], message['reply'])
 
                 
     kafka_config = nslsii.kafka_utils._read_bluesky_kafka_config_file(config_file_path="/etc/bluesky/kafka.yml")
@@ -252,6 +285,7 @@ def manage_files_from_kafka_messages(beamline_acronym):
         print('\n\nExiting Kafka consumer (file manager)')
         return()
 
-print('Ready to receive documents...')
-manage_files_from_kafka_messages('bmm')
+if __name__ == '__main__':
+    print('Ready to receive documents...')
+    manage_files_from_kafka_messages('bmm')
         
@@ -0,0 +1,168 @@
+import time
+import numpy
+import matplotlib.pyplot as plt
+
+
+class GrowingArray():
+    '''A preallocated numpy buffer for a data column which grows one
+    point at a time.  The buffer doubles in size when it fills up.
+    The data measured so far is the view returned by the data
+    attribute.
+
+    Make a new GrowingArray, rather than reusing an old one, when
+    starting a new line on a plot, as the old line may still refer to
+    the old buffer.
+
+    '''
+    def __init__(self, size=512):
+        self.buffer = numpy.empty(size)
+        self.npts   = 0
+
+    def append(self, value):
+        if self.npts == len(self.buffer):
+            self.buffer = numpy.resize(self.buffer, 2*len(self.buffer))
+        self.buffer[self.npts] = value
+        self.npts += 1
+
+    @property
+    def data(self):
+        return self.buffer[:self.npts]
+
+    def __len__(self):
+        return self.npts
+
+
+class RedrawScheduler():
+    '''Coalesce the redraws of the live plots.
+
+    A live plot marks its figure as dirty, along with the lines that
+    have new data and the GrowingArrays holding that data.  The data
+    is pushed to the lines and the figure is redrawn by service(), at
+    most fps times per second, no matter how quickly events arrive.
+
+    When all the data still fits within the current axis limits and
+    the canvas supports it, only the changed lines are drawn on top of
+    the background saved at the last full draw, then blitted.  As data
+    on a live plot only ever grows, the old line in the background is
+    always covered by the new one.  Otherwise, the axes are rescaled
+    and the whole figure is redrawn.  When rescaling, the x-axis is
+    given some headroom in the direction of the scan, so that the
+    next several points can be blitted.  A forced redraw, as at the
+    end of a scan, removes the headroom so that a figure saved
+    afterwards is not padded on the right.
+
+    Figures handed to the scheduler no longer redraw themselves
+    whenever an artist changes, as pyplot figures do in interactive
+    mode.
+
+    attributes
+    ==========
+    fps : float
+      maximum number of redraws per second [5]
+    headroom : float
+      fraction of the x-axis span added to the upper x limit on rescale [0.1]
+
+    '''
+    def __init__(self, fps=5, headroom=0.1):
+        self.fps         = fps
+        self.headroom    = headroom
+        self.dirty       = {}   # figure : {'lines': {line: (x, y)}, 'full': bool}
+        self.backgrounds = {}   # figure : saved canvas region
+        self.registered  = set()
+        self.padded      = set()  # axes given x-axis headroom
+        self.last_draw   = 0
+
+    def register(self, figure):
+        if figure in self.registered:
+            return
+        self.registered.add(figure)
+        figure.stale_callback = None
+        figure.canvas.mpl_connect('draw_event', lambda ev, fig=figure: self.save_background(fig))
+        figure.canvas.mpl_connect('close_event', lambda ev, fig=figure: self.forget(fig))
+
+    def forget(self, figure):
+        self.registered.discard(figure)
+        self.dirty.pop(figure, None)
+        self.backgrounds.pop(figure, None)
+        self.padded = {ax for ax in self.padded if ax.figure is not figure}
+
+    def save_background(self, figure):
+        if getattr(figure.canvas, 'supports_blit', False):
+            self.backgrounds[figure] = figure.canvas.copy_from_bbox(figure.bbox)
+
+    def mark(self, figure, lines={}, full=False):
+        '''Mark a figure as needing a redraw.  lines is a dict of
+        Line2D : (GrowingArray, GrowingArray) for the lines with new
+        data.  full=True forces a full redraw, e.g. after changing a
+        legend or a title.'''
+        if figure is None:
+            return
+        self.register(figure)
+        this = self.dirty.setdefault(figure, {'lines': {}, 'full': False})
+        this['lines'].update(lines)
+        this['full'] = this['full'] or full
+
+    def service(self, force=False):
+        '''Redraw the dirty figures, if the frame budget allows.  force=True
+        redraws at once and also redraws every figure with x-axis
+        headroom, without it.'''
+        if force:
+            for ax in self.padded:
+                self.dirty.setdefault(ax.figure, {'lines': {}, 'full': True})
+        if len(self.dirty) == 0:
+            return
+        if not force and time.monotonic() - self.last_draw < 1/self.fps:
+            return
+        dirty, self.dirty = self.dirty, {}
+        for figure, this in dirty.items():
+            self.redraw(figure, this['lines'], this['full'] or force, final=force)
+        self.last_draw = time.monotonic()
+
+    def redraw(self, figure, lines, full=False, final=False):
+        for line, (x, y) in lines.items():
+            line.set_data(x.data, y.data)
+        canvas = figure.canvas
+        if not full and figure in self.backgrounds and all(self.inside(line) for line in lines):
+            canvas.restore_region(self.backgrounds[figure])
+            for line in lines:
+                line.axes.draw_artist(line)
+            canvas.blit(figure.bbox)
+            canvas.flush_events()
+            return
+        axes = set(line.axes for line in lines)
+        if final:
+            axes |= {ax for ax in self.padded if ax.figure is figure}
+        for ax in axes:
+            ax.relim()
+            ax.autoscale_view(True,True,True)
+            if final:
+                self.padded.discard(ax)
+                continue
+            lo, hi = ax.get_xlim()
+            if self.headroom > 0 and hi > lo:
+                ax.set_xlim(lo, hi + self.headroom*(hi-lo), auto=None)
+                self.padded.add(ax)
+        canvas.draw_idle()
+        canvas.flush_events()
+
+    def inside(self, line):
+        '''True if all the data in line is within its axis limits.'''
+        x, y = line.get_xdata(), line.get_ydata()
+        if len(x) == 0:
+            return True
+        ax = line.axes
+        x0, x1 = sorted(ax.get_xlim())
+        y0, y1 = sorted(ax.get_ylim())
+        return bool(x0 <= numpy.nanmin(x) and numpy.nanmax(x) <= x1 and
+                    y0 <= numpy.nanmin(y) and numpy.nanmax(y) <= y1)
+
+    def wait(self, interval=0.1):
+        '''Service the dirty figures, then run the GUI event loop for
+        interval seconds.  This replaces plt.pause(), which redraws the
+        current figure whenever it is stale.'''
+        self.service()
+        if len(plt.get_fignums()) == 0:
+            time.sleep(interval)
+            return
+        plt.show(block=False)
+        plt.gcf().canvas.start_event_loop(interval)
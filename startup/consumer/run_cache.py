@@ -0,0 +1,157 @@
+import time, threading
+from collections import OrderedDict
+import numpy
+
+
+class RunRecord():
+    '''A memoized view of a single Bluesky run from a Tiled catalog.
+
+    The start and stop documents come along with the run node when it
+    is first fetched.  The baseline table and the list of resource
+    documents are fetched on first use and then kept in memory.  All
+    later lookups are served locally, without a round trip to Tiled.
+
+    The primary stream and anything else not explicitly memoized is
+    passed through to the underlying run.
+
+    attributes
+    ==========
+    run : BlueskyRun
+      the Tiled client node for this run
+    metadata : dict
+      the metadata dictionary, including the start and stop documents
+    baseline : CachedStream
+      the baseline stream, read once
+    fetched : float
+      monotonic time at which the run node was fetched
+
+    '''
+    def __init__(self, run):
+        self.run       = run
+        self.metadata  = run.metadata
+        self.fetched   = time.monotonic()
+        self._baseline = None
+        self._resources = None
+
+    @property
+    def baseline(self):
+        if self._baseline is None:
+            self._baseline = CachedStream(self.run.baseline.read())
+        return self._baseline
+
+    def resources(self):
+        '''Return the list of resource documents for this run.'''
+        if self._resources is None:
+            self._resources = [d[1] for d in self.run.documents() if d[0] == 'resource']
+        return self._resources
+
+    def documents(self):
+        return self.run.documents()
+
+    @property
+    def complete(self):
+        '''True once the stop document has been written.'''
+        return self.metadata['stop'] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.run, attr)
+
+    def __getitem__(self, key):
+        return self.run[key]
+
+
+class CachedStream():
+    '''An in-memory stand-in for a small event stream, such as the
+    baseline.  Provides the .read() and .data interfaces of the Tiled
+    stream client.'''
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.data    = {k: numpy.asarray(v) for k,v in dataset.data_vars.items()}
+
+    def read(self, *args, **kwargs):
+        if len(args) > 0 and args[0] is not None:
+            return self.dataset[args[0]]
+        return self.dataset
+
+
+class RunRecordCache():
+    '''A bounded, catalog-like cache of run records, keyed by UID.
+
+    Wrap a Tiled catalog with this and pass it around in place of the
+    catalog.  Indexing with a UID string returns a RunRecord, fetching
+    it from the catalog only on the first access or once the entry
+    has aged past the time-to-live.  The least recently used entry is
+    dropped when the cache is full.
+
+    Runs that do not yet have a stop document are never cached, as
+    their metadata is still subject to change.  Any other indexing
+    (e.g. catalog[-1]) and all other attributes are passed straight
+    through to the catalog.
+
+    attributes
+    ==========
+    catalog : Tiled catalog
+      the underlying catalog
+    maxsize : int
+      maximum number of runs to hold in memory [64]
+    ttl : float
+      number of seconds for which a run record is considered fresh [600]
+    hits, misses : int
+      cache statistics
+
+    example
+    =======
+    >>> bmm_catalog = RunRecordCache(from_profile('bmm'))
+    >>> bmm_catalog[uid].metadata['start']['XDI']
+    >>> bmm_catalog.stats()
+
+    '''
+    def __init__(self, catalog, maxsize=64, ttl=600):
+        self.catalog = catalog
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self.hits    = 0
+        self.misses  = 0
+        self.records = OrderedDict()
+        self.lock    = threading.Lock()
+
+    def __getitem__(self, key):
+        if type(key) is not str:
+            return self.catalog[key]
+        with self.lock:
+            if key in self.records:
+                record = self.records[key]
+                if time.monotonic() - record.fetched < self.ttl:
+                    self.records.move_to_end(key)
+                    self.hits += 1
+                    return record
+                del self.records[key]
+        record = RunRecord(self.catalog[key])
+        with self.lock:
+            self.misses += 1
+            if record.complete:
+                self.records[key] = record
+                while len(self.records) > self.maxsize:
+                    self.records.popitem(last=False)
+        return record
+
+    def __getattr__(self, attr):
+        return getattr(self.catalog, attr)
+
+    def __contains__(self, key):
+        return key in self.records or key in self.catalog
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def invalidate(self, uid=None):
+        '''Forget one run record or, if uid is None, all of them.'''
+        with self.lock:
+            if uid is None:
+                self.records.clear()
+            else:
+                self.records.pop(uid, None)
+
+    def stats(self):
+        return {'size': len(self.records), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses}
@@ -1,7 +1,8 @@
-import os, datetime, emojis, re
+import os, datetime, emojis, json
 
 import redis
 from redis_json_dict import RedisJSONDict
+from BMM_common.file_index import find_next_index, find_files
 redis_client = redis.Redis(host="info.bmm.nsls2.bnl.gov")
 
 DATA_SECURITY = True
@@ -9,20 +10,21 @@ DATA_SECURITY = True
 def experiment_folder(catalog, uid):
 
     facility_dict = RedisJSONDict(redis_client=redis_client, prefix='')
-    if 'data_session' in catalog[uid].metadata['start']:
-        proposal = catalog[uid].metadata['start']['data_session'] #[5:]
+    startdoc = catalog[uid].metadata['start']
+    if 'data_session' in startdoc:
+        proposal = startdoc['data_session'] #[5:]
     else:
         proposal = facility_dict['xas-data_session']
-    if 'XDI' in catalog[uid].metadata['start'] and 'Facility' in catalog[uid].metadata['start']['XDI']:
-        cycle = catalog[uid].metadata['start']['XDI']['Facility']['cycle']
+    if 'XDI' in startdoc and 'Facility' in startdoc['XDI']:
+        cycle = startdoc['XDI']['Facility']['cycle']
     else:
         cycle = facility_dict['xas-cycle']
         
     if DATA_SECURITY:
         folder    = os.path.join('/nsls2', 'data3', 'bmm', 'proposals', cycle, f'{proposal}')
     else:
-        proposal  = catalog[uid].metadata['start']['XDI']['Facility']['SAF']
-        startdate = catalog[uid].metadata['start']['XDI']['_user']['startdate']
+        proposal  = startdoc['XDI']['Facility']['SAF']
+        startdate = startdoc['XDI']['_user']['startdate']
         folder = os.path.join('/nsls2', 'data3', 'bmm', 'XAS', cycle, str(proposal), startdate)
     #print(f'folder is {folder}')
     return folder
@@ -100,40 +102,44 @@ def message_div(text='', img=None, icon='message', rid=None, measurement='xafs')
 
 
 
-def next_index(folder, stub):
+def reply_to(reply, answer):
+    '''Push a json-encoded answer onto the redis list named in a
+    request's "reply" field.  The list expires if nobody collects it.'''
+    rkvs.rpush(reply, json.dumps(answer))
+    rkvs.expire(reply, 120)
+
+
+def next_index(folder, stub, reply=None):
     '''Find the next numeric filename extension for a filename stub in folder.'''
-    listing = os.listdir(folder)
-    r = re.compile(re.escape(stub) + '\.\d+')
-    results = sorted(list(filter(r.match, listing)))
-    if len(results) == 0:
-        answer = 1
+    answer = find_next_index(folder, stub)
+    if reply is not None:
+        reply_to(reply, answer)
     else:
-        answer = int(results[-1][-3:]) + 1
-    rkvs.set('BMM:next_index', answer)
+        rkvs.set('BMM:next_index', answer)
     print(f"Next index for {stub} in {folder} is {answer}.")
 
 
-def file_exists(folder, filename, start, stop, number):
+def file_exists(folder, filename, start, stop, number, reply=None):
     '''Return true is a file of the supplied name exists in the supplied folder.'''
-    target = os.path.join(folder, filename) 
-    found, text = False, []
-    if number is True:
-        for i in range(start, stop+1, 1):
-            this = f'{target}.{i:03d}'
-            #print(this)
-            if os.path.isfile(this):
-                found = True
-                text.append(f'{filename}.{i:03d}')
+    found, text = find_files(folder, filename, start, stop, number)
+    if reply is not None:
+        reply_to(reply, found)
+    elif found is True:
+        rkvs.set('BMM:file_exists', 'true')
     else:
-        if os.path.isfile(target):
-            found = True
-            text.append(filename)
-        
-
+        rkvs.set('BMM:file_exists', 'false')
     if found is True:
-        rkvs.set('BMM:file_exists', 'true')
         print(f"{', '.join(text)} found in {folder}.")
     else:
-        rkvs.set('BMM:file_exists', 'false')
         print(f'"{filename}" not found in {folder} in range {start} - {stop}.')
-            
+
+
+def files_exist(folder, checks, reply):
+    '''Answer a batch of file_exists questions with a single reply, a
+    list of booleans in the order of the checks.'''
+    answer = []
+    for c in checks:
+        found, text = find_files(folder, c['filename'], c['start'], c['stop'], c['number'])
+        answer.append(found)
+    reply_to(reply, answer)
+    print(f'checked {len(checks)} file names in {folder}, {answer.count(True)} found.')
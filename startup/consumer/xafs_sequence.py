@@ -3,7 +3,6 @@ import os
 from matplotlib import get_backend
 
 from BMM.larch_interface import Pandrosus, Kekropidai, plt
-from larch.io import create_athena
 
 from slack import img_to_slack, post_to_slack
 from tools import experiment_folder
@@ -92,7 +91,6 @@ class XAFSSequence():
     def merge(self, prj=False, filename=None, seqnumber=None):
         if seqnumber is None:
             seqnumber = int(rkvs.get('BMM:dossier:seqnumber').decode('utf-8'))
-        project = None
         if len(self.uidlist) == 0:
             return 0
         elif len(self.uidlist) == 1:
@@ -105,10 +103,7 @@ class XAFSSequence():
                     filename = filename.replace('snapshots', 'prj')
                     filename = filename.replace('.png', f'_{seqnumber:02d}.prj')
                     location = os.path.join(experiment_folder(self.catalog, self.uidlist[0]), filename)
-                    project = create_athena(location)
-                    for g in self.panlist:
-                        project.add_group(g.group)
-                    project.save()
+                    self.kek.export_project(location)
             except Exception as E:
                 print('xafs_sequence.merge: failed to make project file')
                 print(E)